@@ -1,6 +1,19 @@
-from django.contrib import admin
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils.functional import cached_property
 from django.utils.html import format_html
-from .models import Categoria, Ubicacion, Trabajador, Herramienta, Prestamo, DetallePrestamo
+from .models import Categoria, Ubicacion, Trabajador, Herramienta, Prestamo, DetallePrestamo, AlertaAtraso, Mantencion, MovimientoHerramienta
+from .inventario import invalidar_inventario, version_inventario
+from .servicios import dar_de_baja, reactivar
+from .miniaturas import url_miniatura
+from .nomina import NominaInvalida, normalizar_rut, sincronizar
 
 # ==============================================================================
 # CONFIGURACIÓN GENERAL DEL PANEL
@@ -9,19 +22,98 @@ admin.site.site_header = "Administración SmartStockQR"
 admin.site.site_title = "SmartStockQR Admin"
 admin.site.index_title = "Panel de Control Gerencial"
 
+# ==============================================================================
+# 0. RENDIMIENTO DE LOS LISTADOS
+# ==============================================================================
+
+# Bajo este número de filas el COUNT(*) exacto es barato y preferimos exactitud
+UMBRAL_CONTEO_ESTIMADO = 10000
+
+CONSULTAS_ESTIMACION = {
+    'mysql': "SELECT TABLE_ROWS FROM information_schema.TABLES "
+             "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+    'postgresql': "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+}
+
+
+class PaginadorEstimado(Paginator):
+    """
+    Paginador que, para el listado sin filtros de una tabla grande, usa el
+    conteo aproximado que mantiene el motor en vez de un COUNT(*) completo
+    (en InnoDB eso recorre todo el índice). Con filtros o búsqueda, o en
+    motores sin estadísticas (SQLite), cuenta exacto como siempre.
+    """
+
+    @cached_property
+    def count(self):
+        consulta = getattr(self.object_list, 'query', None)
+        if consulta is not None and not consulta.where:
+            estimado = self._estimacion()
+            if estimado and estimado > UMBRAL_CONTEO_ESTIMADO:
+                return estimado
+        return super().count
+
+    def _estimacion(self):
+        conexion = connections[self.object_list.db]
+        sql = CONSULTAS_ESTIMACION.get(conexion.vendor)
+        if sql is None:
+            return None
+        with conexion.cursor() as cursor:
+            cursor.execute(sql, [self.object_list.model._meta.db_table])
+            fila = cursor.fetchone()
+        return int(fila[0]) if fila and fila[0] else None
+
+
+class ListadoRapidoAdmin(admin.ModelAdmin):
+    """Base de los listados de tablas que crecen con la operación."""
+    paginator = PaginadorEstimado
+    show_full_result_count = False  # Evita el segundo COUNT(*) al filtrar
+
+
+class FiltroMarca(admin.SimpleListFilter):
+    """
+    Filtro por marca con las opciones cacheadas. El list_filter por defecto
+    hace un SELECT DISTINCT sobre toda la tabla en cada carga del listado; la
+    caché se renueva sola cuando cambia la versión del inventario.
+    """
+    title = "marca"
+    parameter_name = 'marca'
+
+    def lookups(self, request, model_admin):
+        marcas = cache.get_or_set(
+            f"admin:marcas:{version_inventario()}",
+            lambda: list(Herramienta.objects.order_by('marca').values_list('marca', flat=True).distinct()),
+            settings.CACHE_FRAGMENTOS_SEGUNDOS,
+        )
+        return [(marca, marca) for marca in marcas]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(marca=self.value())
+        return queryset
+
+
+def miniatura_html(imagen, ancho, estilo):
+    """<img> de la miniatura (nunca el original) con carga diferida."""
+    url = url_miniatura(imagen, ancho)
+    if url is None:
+        return None
+    return format_html('<img src="{}" loading="lazy" style="width: {}px; height: auto; {}" />', url, ancho, estilo)
+
 # ==============================================================================
 # 1. PARAMÉTRICAS (Con Borrado Lógico)
 # ==============================================================================
 
 @admin.register(Categoria)
 class CategoriaAdmin(admin.ModelAdmin):
-    list_display = ('id', 'nombre', 'descripcion', 'activo') 
+    list_display = ('id', 'nombre', 'descripcion', 'horas_prestamo', 'activo') 
     list_filter = ('activo',) 
     search_fields = ('nombre',)
     actions = ['dar_de_baja']
 
     def dar_de_baja(self, request, queryset):
         updated = queryset.update(activo=False)
+        invalidar_inventario()
         self.message_user(request, f"{updated} categorías fueron desactivadas.")
     dar_de_baja.short_description = "Dar de Baja (Soft Delete)"
 
@@ -30,10 +122,12 @@ class UbicacionAdmin(admin.ModelAdmin):
     list_display = ('id', 'nombre', 'descripcion', 'activo')
     list_filter = ('activo',)
     search_fields = ('nombre',)
+    filter_horizontal = ('bodegueros',) # Usuarios que operan esta bodega
     actions = ['dar_de_baja']
 
     def dar_de_baja(self, request, queryset):
         updated = queryset.update(activo=False)
+        invalidar_inventario()
         self.message_user(request, f"{updated} ubicaciones fueron desactivadas.")
     dar_de_baja.short_description = "Dar de Baja (Soft Delete)"
 
@@ -41,13 +135,68 @@ class UbicacionAdmin(admin.ModelAdmin):
 # 2. ACTORES
 # ==============================================================================
 
+class NominaForm(forms.Form):
+    archivo = forms.FileField(label="Nómina (CSV)", help_text="Columnas rut, nombre, apellido y cargo; separadas por ';' o ','.")
+    desactivar = forms.BooleanField(label="Desactivar a los que no aparecen", required=False, initial=True)
+    simular = forms.BooleanField(label="Sólo simular (no guarda cambios)", required=False, initial=True)
+    forzar = forms.BooleanField(label="Aplicar aunque desactive a más de la mitad", required=False)
+
+
+class TrabajadorForm(forms.ModelForm):
+    class Meta:
+        model = Trabajador
+        fields = '__all__'
+
+    def clean_rut(self):
+        # Mismo formato que la nómina ('12345678-K'), o la API por RUT no lo encuentra
+        rut = normalizar_rut(self.cleaned_data['rut'])
+        if rut is None:
+            raise forms.ValidationError("RUT inválido: revise el dígito verificador.")
+        return rut
+
+
 @admin.register(Trabajador)
-class TrabajadorAdmin(admin.ModelAdmin):
+class TrabajadorAdmin(ListadoRapidoAdmin):
+    form = TrabajadorForm
     list_display = ('rut', 'nombre', 'apellido', 'cargo', 'activo')
     list_filter = ('cargo', 'activo')
     search_fields = ('rut', 'nombre', 'apellido')
     ordering = ('nombre',)
     actions = ['desactivar_trabajador']
+    change_list_template = 'admin/bodega/trabajador/change_list.html'
+
+    def get_urls(self):
+        return [
+            path('sincronizar/', self.admin_site.admin_view(self.sincronizar_nomina),
+                 name='bodega_trabajador_sincronizar'),
+        ] + super().get_urls()
+
+    def sincronizar_nomina(self, request):
+        """Sube la nómina de RR.HH. (mismo proceso que manage.py sincronizar_trabajadores)."""
+        if not self.has_change_permission(request):
+            return redirect('admin:bodega_trabajador_changelist')
+
+        form = NominaForm(request.POST or None, request.FILES or None)
+        plan = None
+        if request.method == 'POST' and form.is_valid():
+            datos = form.cleaned_data
+            try:
+                plan = sincronizar(datos['archivo'].file, desactivar=datos['desactivar'],
+                                   simular=datos['simular'], forzar=datos['forzar'])
+            except NominaInvalida as error:
+                self.message_user(request, str(error), messages.ERROR)
+            else:
+                if not datos['simular']:
+                    self.message_user(request, f"Nómina sincronizada: {plan.resumen()}.")
+                    return redirect('admin:bodega_trabajador_changelist')
+
+        return TemplateResponse(request, 'admin/bodega/trabajador/sincronizar.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': "Sincronizar nómina",
+            'form': form,
+            'plan': plan,
+        })
 
     def desactivar_trabajador(self, request, queryset):
         updated = queryset.update(activo=False)
@@ -59,18 +208,35 @@ class TrabajadorAdmin(admin.ModelAdmin):
 # ==============================================================================
 
 @admin.register(Herramienta)
-class HerramientaAdmin(admin.ModelAdmin):
+class HerramientaAdmin(ListadoRapidoAdmin):
     list_display = ('codigo_qr', 'nombre', 'marca', 'estado', 'ubicacion', 'activo')
-    list_filter = ('activo', 'estado', 'categoria', 'ubicacion', 'marca')
+    list_select_related = ('ubicacion',)
+    list_filter = ('activo', 'estado', 'categoria', 'ubicacion', FiltroMarca)
     search_fields = ('nombre', 'marca', 'codigo_qr')
     readonly_fields = ('codigo_qr',) 
-    actions = ['dar_de_baja_herramienta']
+    autocomplete_fields = ('categoria', 'ubicacion')
+    actions = ['dar_de_baja_herramienta', 'reactivar_herramienta']
+
+    def save_model(self, request, obj, form, change):
+        # Autor del movimiento que registra signals.registrar_movimiento
+        obj._usuario_movimiento = request.user
+        super().save_model(request, obj, form, change)
 
     def dar_de_baja_herramienta(self, request, queryset):
-        updated = queryset.update(activo=False)
-        self.message_user(request, f"{updated} herramientas dadas de baja correctamente.")
+        # Un solo UPDATE con el estado de baja correcto y un solo INSERT de auditoría
+        bajas, motivos = dar_de_baja(queryset, request.user)
+        detalle = ", ".join(f"{motivo}: {cantidad}" for motivo, cantidad in motivos.items())
+        self.message_user(request, f"{len(bajas)} herramientas dadas de baja correctamente. {detalle}")
     dar_de_baja_herramienta.short_description = "Dar de Baja (Soft Delete)"
 
+    def reactivar_herramienta(self, request, queryset):
+        reactivadas, cerrados = reactivar(queryset, request.user)
+        self.message_user(
+            request,
+            f"{len(reactivadas)} herramientas reactivadas ({cerrados} préstamos pendientes cerrados)."
+        )
+    reactivar_herramienta.short_description = "Reactivar (Reincorporar al Inventario)"
+
 # ==============================================================================
 # 4. TRANSACCIONES (Préstamos y Detalles con FOTOS)
 # ==============================================================================
@@ -83,19 +249,21 @@ class DetallePrestamoInline(admin.TabularInline):
     fields = ('herramienta', 'devuelto', 'estado_devolucion', 'mostrar_evidencia', 'observacion_falla', 'fecha_devolucion')
     can_delete = False 
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('herramienta')
+
     def mostrar_evidencia(self, obj):
-        try:
-            if obj.foto_evidencia:
-                return format_html('<img src="{}" style="width: 80px; height: auto; border-radius: 5px; border: 1px solid #ccc;" />', obj.foto_evidencia.url)
-        except Exception:
-            return "Error al cargar img"
-        return "Sin foto"
+        if not obj.foto_evidencia:
+            return "Sin foto"
+        return miniatura_html(obj.foto_evidencia, 80, "border-radius: 5px; border: 1px solid #ccc;") or "Error al cargar img"
     mostrar_evidencia.short_description = "Evidencia Visual"
 
 
 @admin.register(Prestamo)
-class PrestamoAdmin(admin.ModelAdmin):
+class PrestamoAdmin(ListadoRapidoAdmin):
     list_display = ('id', 'trabajador', 'bodeguero', 'fecha_solicitud', 'fecha_devolucion', 'estado_visual')
+    list_select_related = ('trabajador', 'bodeguero')
+    autocomplete_fields = ('trabajador', 'bodeguero')
     list_filter = ('fecha_solicitud', 'bodeguero')
     search_fields = ('trabajador__nombre', 'trabajador__rut')
     inlines = [DetallePrestamoInline]
@@ -110,27 +278,78 @@ class PrestamoAdmin(admin.ModelAdmin):
 
 
 @admin.register(DetallePrestamo)
-class DetallePrestamoAdmin(admin.ModelAdmin):
+class DetallePrestamoAdmin(ListadoRapidoAdmin):
     """Vista individual de cada ítem prestado, útil para reportes de fallas"""
-    list_display = ('prestamo', 'herramienta', 'devuelto', 'estado_devolucion', 'ver_foto', 'fecha_devolucion')
+    list_display = ('prestamo', 'herramienta', 'devuelto', 'estado_devolucion', 'ver_foto', 'fecha_limite', 'fecha_devolucion')
+    list_select_related = ('prestamo__trabajador', 'herramienta')
+    autocomplete_fields = ('prestamo', 'herramienta')
     list_filter = ('devuelto', 'estado_devolucion')
     search_fields = ('herramienta__nombre', 'herramienta__codigo_qr')
     readonly_fields = ('ver_foto_grande',)
 
     def ver_foto(self, obj):
-        try:
-            if obj.foto_evidencia:
-                return format_html('<img src="{}" style="width: 50px; height: auto; border-radius: 3px;" />', obj.foto_evidencia.url)
-        except Exception:
-            return "Error"
-        return "-"
+        if not obj.foto_evidencia:
+            return "-"
+        return miniatura_html(obj.foto_evidencia, 50, "border-radius: 3px;") or "Error"
     ver_foto.short_description = "Miniatura"
 
     def ver_foto_grande(self, obj):
-        try:
-            if obj.foto_evidencia:
-                return format_html('<a href="{0}" target="_blank"><img src="{0}" style="width: 300px; height: auto; border-radius: 5px;" /></a>', obj.foto_evidencia.url)
-        except Exception:
+        # Se muestra una miniatura de 300 px; el original sólo se abre al hacer clic
+        if not obj.foto_evidencia:
+            return "No hay evidencia cargada"
+        miniatura = miniatura_html(obj.foto_evidencia, 300, "border-radius: 5px;")
+        if miniatura is None:
             return "Error cargando imagen grande"
-        return "No hay evidencia cargada"
-    ver_foto_grande.short_description = "Evidencia Tamaño Real"
\ No newline at end of file
+        return format_html('<a href="{}" target="_blank">{}</a>', obj.foto_evidencia.url, miniatura)
+    ver_foto_grande.short_description = "Evidencia Tamaño Real"
+
+
+@admin.register(AlertaAtraso)
+class AlertaAtrasoAdmin(ListadoRapidoAdmin):
+    """Alertas generadas por el comando detectar_atrasos"""
+    list_display = ('detalle', 'trabajador', 'fecha_limite', 'fecha_deteccion', 'resuelta', 'fecha_resolucion')
+    list_select_related = ('detalle__herramienta', 'detalle__prestamo__trabajador')
+    list_filter = ('resuelta',)
+    search_fields = ('detalle__herramienta__codigo_qr', 'detalle__prestamo__trabajador__rut')
+    autocomplete_fields = ('detalle',)
+
+    def trabajador(self, obj):
+        return obj.detalle.prestamo.trabajador
+    trabajador.short_description = "Trabajador"
+
+
+@admin.register(Mantencion)
+class MantencionAdmin(ListadoRapidoAdmin):
+    """Pasos por el taller (se abren al devolver con falla y se cierran al liberar)"""
+    list_display = ('herramienta', 'fecha_inicio', 'fecha_fin', 'duracion_horas', 'usuario_cierre')
+    list_select_related = ('herramienta', 'usuario_cierre')
+    list_filter = (('fecha_fin', admin.EmptyFieldListFilter), 'fecha_inicio')
+    search_fields = ('herramienta__codigo_qr', 'herramienta__nombre')
+    autocomplete_fields = ('herramienta', 'detalle', 'usuario_cierre')
+
+    def duracion_horas(self, obj):
+        return round(obj.duracion.total_seconds() / 3600, 1)
+    duracion_horas.short_description = "Horas en Taller"
+
+
+# ==============================================================================
+# 5. BITÁCORA DE MOVIMIENTOS (SÓLO LECTURA)
+# ==============================================================================
+
+@admin.register(MovimientoHerramienta)
+class MovimientoHerramientaAdmin(ListadoRapidoAdmin):
+    """Bitácora de sólo inserción: se consulta pero no se edita"""
+    list_display = ('fecha', 'herramienta', 'origen', 'estado_anterior', 'estado', 'activo', 'ubicacion', 'usuario')
+    list_select_related = ('herramienta', 'ubicacion', 'usuario')
+    list_filter = ('origen', 'estado', 'fecha')
+    search_fields = ('herramienta__codigo_qr', 'herramienta__nombre')
+    date_hierarchy = 'fecha'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
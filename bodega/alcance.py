@@ -0,0 +1,65 @@
+"""
+Alcance por ubicación (multi-bodega).
+
+Un usuario asignado a una o más Ubicaciones sólo ve y opera las herramientas
+de esas bodegas: consultas, cachés y eventos en vivo se particionan con las
+funciones de este módulo. Un usuario sin asignaciones conserva la vista global.
+"""
+
+def _memo(user):
+    """
+    Dónde memorizar el alcance: el memo_cache de los usuarios que vienen del
+    caché de autenticacion.py (dura hasta que el usuario cambie) o el propio
+    objeto (dura la petición).
+    """
+    memo = getattr(user, 'memo_cache', None)
+    if memo is None:
+        memo = getattr(user, '_memo_alcance', None)
+    if memo is None:
+        memo = user._memo_alcance = {}
+    return memo
+
+
+def ubicaciones_usuario(user):
+    """
+    Lista de ids de Ubicacion del usuario, o None si no tiene restricción.
+    Se memoriza en el objeto user para no repetir la consulta en la petición.
+    """
+    if not user.is_authenticated:
+        return None
+    memo = _memo(user)
+    if 'ubicaciones' not in memo:
+        ids = sorted(user.ubicaciones.values_list('id', flat=True))
+        memo['ubicaciones'] = ids or None
+    return memo['ubicaciones']
+
+
+async def aubicaciones_usuario(user):
+    """Variante para las vistas async."""
+    if not user.is_authenticated:
+        return None
+    memo = _memo(user)
+    if 'ubicaciones' not in memo:
+        ids = sorted([i async for i in user.ubicaciones.values_list('id', flat=True)])
+        memo['ubicaciones'] = ids or None
+    return memo['ubicaciones']
+
+
+def filtrar_por_ubicacion(queryset, ubicaciones, campo='ubicacion'):
+    """Restringe un queryset a las ubicaciones dadas (None = sin filtro)."""
+    if ubicaciones is None:
+        return queryset
+    return queryset.filter(**{f'{campo}__in': ubicaciones})
+
+
+def herramientas_de(user):
+    """Herramientas visibles para el usuario."""
+    from .models import Herramienta
+    return filtrar_por_ubicacion(Herramienta.objects.all(), ubicaciones_usuario(user))
+
+
+def evento_visible(evento, ubicaciones):
+    """Los eventos sin ubicación (p. ej. trabajadores) llegan a todos."""
+    if ubicaciones is None or evento.get('ubicacion_id') is None:
+        return True
+    return evento['ubicacion_id'] in ubicaciones
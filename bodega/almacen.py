@@ -0,0 +1,241 @@
+"""
+Storage de media direccionado por contenido.
+
+codigos_qr/ y evidencias/ eran carpetas planas con un archivo por herramienta
+y por foto. Este storage guarda cada archivo una sola vez, nombrado por el
+SHA-256 de su contenido y repartido en dos niveles de subcarpetas:
+
+    contenido/3f/a2/3fa2...c1.jpg
+
+Ese nombre es el que queda en el FileField, así que url(), open() y exists()
+no consultan la base. Dos archivos iguales (la misma foto subida dos veces)
+comparten el archivo y ContenidoArchivo cuenta cuántos campos lo usan: save()
+suma una referencia y delete() la resta, pero no borra. El comando
+limpiar_almacen borra los que llevan un tiempo en cero, después de confirmar
+que ningún campo de archivo los nombra.
+
+Los bytes se escriben en otro storage ('interno'): FileSystemStorage en
+MEDIA_ROOT por defecto, o uno compatible con S3 (django-storages con AWS,
+MinIO o R2, ver MEDIA_S3_BUCKET en settings). Los nombres derivados
+('miniaturas/...', que ya llevan el hash del original) y los nombres antiguos
+que todavía no pasan por migrar_almacen van directo al interno.
+"""
+import hashlib
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import Storage, default_storage
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+from django.utils.module_loading import import_string
+
+PREFIJO = 'contenido/'
+LOTE = 500
+
+
+def _huella(nombre):
+    """Hash de un nombre por contenido: el nombre del archivo sin extensión."""
+    return os.path.splitext(os.path.basename(nombre))[0]
+
+# ==============================================================================
+# 1. STORAGE
+# ==============================================================================
+
+@deconstructible
+class AlmacenContenido(Storage):
+
+    def __init__(self, interno='django.core.files.storage.FileSystemStorage', opciones=None,
+                 derivados=('miniaturas/',)):
+        try:
+            clase = import_string(interno)
+        except ImportError as error:
+            raise ImproperlyConfigured(f"No se pudo cargar el storage interno {interno}: {error}")
+        self.interno = clase(**(opciones or {}))
+        self.derivados = tuple(derivados)
+
+    def _derivado(self, name):
+        return name.startswith(self.derivados)
+
+    def get_available_name(self, name, max_length=None):
+        # El nombre final lo da el contenido: dos nombres iguales son el mismo archivo
+        return name
+
+    def _save(self, name, content):
+        if self._derivado(name):
+            return self.interno.save(name, content)
+
+        huella = hashlib.sha256()
+        tamano = 0
+        for trozo in content.chunks():
+            huella.update(trozo)
+            tamano += len(trozo)
+        huella = huella.hexdigest()
+        nombre = f"{PREFIJO}{huella[:2]}/{huella[2:4]}/{huella}{os.path.splitext(name)[1].lower()}"
+
+        # Primero la referencia y después el archivo: limpiar() borra el archivo
+        # con la fila bloqueada, así que si la fila sigue ahí el archivo también
+        nombre = _referenciar(huella, nombre, tamano)
+        if not self.interno.exists(nombre):
+            guardado = self.interno.save(nombre, content)
+            if guardado != nombre:  # Otro proceso escribió el mismo contenido a la vez
+                self.interno.delete(guardado)
+        return nombre
+
+    def delete(self, name):
+        if not name.startswith(PREFIJO):
+            return self.interno.delete(name)
+        # Sólo se descuenta; el archivo lo borra limpiar() pasado el margen
+        from .models import ContenidoArchivo
+        ContenidoArchivo.objects.filter(hash=_huella(name), referencias__gt=0).update(
+            referencias=F('referencias') - 1, actualizado=timezone.now()
+        )
+
+    def _open(self, name, mode='rb'):
+        return self.interno.open(name, mode)
+
+    def exists(self, name):
+        return self.interno.exists(name)
+
+    def url(self, name):
+        return self.interno.url(name)
+
+    def size(self, name):
+        return self.interno.size(name)
+
+    def path(self, name):
+        return self.interno.path(name)
+
+    def listdir(self, path):
+        return self.interno.listdir(path)
+
+    def get_accessed_time(self, name):
+        return self.interno.get_accessed_time(name)
+
+    def get_created_time(self, name):
+        return self.interno.get_created_time(name)
+
+    def get_modified_time(self, name):
+        return self.interno.get_modified_time(name)
+
+
+def _referenciar(huella, nombre, tamano):
+    """Suma una referencia al contenido (o lo registra) y devuelve su nombre."""
+    # Import diferido: el storage se instancia antes de que carguen los modelos
+    from .models import ContenidoArchivo
+
+    ahora = timezone.now()
+    if ContenidoArchivo.objects.filter(hash=huella).update(referencias=F('referencias') + 1, actualizado=ahora):
+        # Ya existía, quizás con otra extensión: se usa el nombre registrado
+        return ContenidoArchivo.objects.values_list('nombre', flat=True).get(hash=huella)
+    try:
+        with transaction.atomic():
+            ContenidoArchivo.objects.create(hash=huella, nombre=nombre, tamano=tamano, referencias=1, actualizado=ahora)
+    except IntegrityError:  # Lo registró otro proceso entre el UPDATE y el INSERT
+        return _referenciar(huella, nombre, tamano)
+    return nombre
+
+# ==============================================================================
+# 2. REFERENCIAS DESDE LOS MODELOS
+# ==============================================================================
+
+def campos_de_archivo():
+    """(modelo, campo) de todos los FileField/ImageField guardados en default_storage."""
+    return [
+        (modelo, campo.name)
+        for modelo in apps.get_models()
+        for campo in modelo._meta.concrete_fields
+        if isinstance(campo, models.FileField) and campo.storage is default_storage
+    ]
+
+
+def en_uso(nombres):
+    """Counter {nombre: filas que lo usan} entre 'nombres', sumando todos los campos de archivo."""
+    conteo = Counter()
+    for modelo, campo in campos_de_archivo():
+        for inicio in range(0, len(nombres), LOTE):
+            conteo.update(modelo._default_manager.filter(
+                **{f'{campo}__in': nombres[inicio:inicio + LOTE]}
+            ).values_list(campo, flat=True))
+    return conteo
+
+
+def recontar():
+    """
+    Rehace los contadores desde los campos de archivo (filas borradas sin
+    delete() del archivo, nombres asignados sin save()). Devuelve cuántos cambió.
+    """
+    from .models import ContenidoArchivo
+
+    conteo = Counter()
+    for modelo, campo in campos_de_archivo():
+        conteo.update(modelo._default_manager.filter(
+            **{f'{campo}__startswith': PREFIJO}
+        ).values_list(campo, flat=True).iterator(chunk_size=LOTE))
+
+    diferencias = [
+        (huella, referencias, conteo[nombre])
+        for huella, nombre, referencias in ContenidoArchivo.objects.values_list(
+            'hash', 'nombre', 'referencias'
+        ).iterator(chunk_size=LOTE)
+        if referencias != conteo[nombre]
+    ]
+    cambiados = 0
+    for huella, referencias, reales in diferencias:
+        # Condicional: si entre medio llegó un save() se deja su cuenta
+        cambiados += ContenidoArchivo.objects.filter(hash=huella, referencias=referencias).update(referencias=reales)
+    return cambiados
+
+# ==============================================================================
+# 3. LIMPIEZA
+# ==============================================================================
+
+def anchos_miniaturas(storage):
+    """Anchos con miniaturas generadas en 'storage' (una carpeta 'miniaturas/<ancho>/' por cada uno)."""
+    try:
+        anchos, _ = storage.listdir('miniaturas')
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+    return anchos
+
+
+def limpiar(almacen, horas=24, simular=False):
+    """
+    Borra los archivos sin referencias desde hace más de 'horas', con sus
+    miniaturas. Antes confirma que ningún campo los nombre: un contador mal
+    llevado se corrige en vez de borrar una foto en uso. Devuelve (archivos, bytes).
+    """
+    from .miniaturas import _nombre_miniatura
+    from .models import ContenidoArchivo
+
+    corte = timezone.now() - timedelta(hours=horas)
+    candidatos = list(ContenidoArchivo.objects.filter(
+        referencias__lte=0, actualizado__lt=corte
+    ).values_list('hash', 'nombre'))
+    usados = en_uso([nombre for _, nombre in candidatos])
+    anchos = anchos_miniaturas(almacen.interno) if candidatos else []
+
+    borrados = liberados = 0
+    for huella, nombre in candidatos:
+        if usados[nombre]:
+            ContenidoArchivo.objects.filter(hash=huella).update(referencias=usados[nombre])
+            continue
+        with transaction.atomic():
+            # Bloqueada: un save() del mismo contenido espera a que terminemos
+            contenido = ContenidoArchivo.objects.select_for_update().filter(
+                hash=huella, referencias__lte=0, actualizado__lt=corte
+            ).first()
+            if contenido is None:
+                continue  # Se volvió a usar mientras tanto
+            if not simular:
+                for ancho in anchos:
+                    almacen.interno.delete(_nombre_miniatura(nombre, ancho))
+                almacen.interno.delete(nombre)
+                contenido.delete()
+        borrados += 1
+        liberados += contenido.tamano
+    return borrados, liberados
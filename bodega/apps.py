@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class BodegaConfig(AppConfig):
     name = 'bodega'
+
+    def ready(self):
+        from . import signals  # noqa: F401 (registra los receivers)
+        from . import assets  # noqa: F401 (registra el check de paquetes)
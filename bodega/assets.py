@@ -0,0 +1,216 @@
+"""
+Assets de front-end servidos desde nuestro propio static en vez de CDNs.
+
+Las librerías de terceros se guardan en bodega/static/bodega/vendor/ (versiones
+fijadas en VENDOR) y se empaquetan por página en bodega/static/bodega/dist/:
+todas las páginas cargan base.css + base.js, las del escáner agregan
+escaner.js con html5-qrcode y la devolución devolucion.js (subida de fotos). collectstatic (CompressedManifestStaticFilesStorage
+de WhiteNoise) les pone hash en el nombre y genera .gz/.br, así que se sirven
+precomprimidos y con caché de un año. El comando construir_assets descarga lo
+que falte y arma los paquetes.
+
+Mientras un paquete no esté construido, el tag {% paquete %} enlaza cada
+archivo por separado: el local si existe y si no la URL de origen (CDN). Eso
+es sólo un respaldo para desarrollo: `manage.py check --deploy` falla si falta
+un paquete que se puede construir con lo que hay en el repositorio o si quedó
+desactualizado respecto de sus fuentes, y avisa de los que esperan archivos de
+vendor sin descargar (esas páginas siguen usando el CDN).
+"""
+import os
+import re
+from functools import lru_cache
+
+from django.contrib.staticfiles import finders
+from django.core import checks
+
+VENDOR_DIR = 'bodega/vendor'
+DIST_DIR = 'bodega/dist'
+
+# Archivo dentro de VENDOR_DIR -> URL de origen (versión fijada)
+VENDOR = {
+    'bootstrap.min.css': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
+    'bootstrap.bundle.min.js': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
+    'bootstrap-icons.css': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.0/font/bootstrap-icons.css',
+    'fonts/bootstrap-icons.woff2': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.0/font/fonts/bootstrap-icons.woff2',
+    'fonts/bootstrap-icons.woff': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.0/font/fonts/bootstrap-icons.woff',
+    'sweetalert2.all.min.js': 'https://cdn.jsdelivr.net/npm/sweetalert2@11.10.5/dist/sweetalert2.all.min.js',
+    'html5-qrcode.min.js': 'https://unpkg.com/html5-qrcode@2.3.8/html5-qrcode.min.js',
+    'beep_short.ogg': 'https://actions.google.com/sounds/v1/alarms/beep_short.ogg',
+}
+
+# Paquete dentro de DIST_DIR -> archivos (rutas de static) que se concatenan en orden
+PAQUETES = {
+    'base.css': [
+        f'{VENDOR_DIR}/bootstrap.min.css',
+        f'{VENDOR_DIR}/bootstrap-icons.css',
+        'bodega/css/smartstock.css',
+    ],
+    'base.js': [
+        f'{VENDOR_DIR}/bootstrap.bundle.min.js',
+        f'{VENDOR_DIR}/sweetalert2.all.min.js',
+        'bodega/js/smartstock.js',
+    ],
+    'escaner.js': [
+        f'{VENDOR_DIR}/html5-qrcode.min.js',
+    ],
+    'devolucion.js': [
+        'bodega/js/subida_fotos.js',
+    ],
+    'conteo.js': [
+        'bodega/js/conteo.js',
+    ],
+}
+
+# ==============================================================================
+# 1. RESOLUCIÓN (LOCAL O CDN)
+# ==============================================================================
+
+@lru_cache(maxsize=None)
+def existe(ruta):
+    """True si 'ruta' (relativa a static) está en algún directorio de estáticos."""
+    return finders.find(ruta) is not None
+
+
+def origen(ruta):
+    """URL de origen de un archivo vendorizado, o None si es propio."""
+    prefijo = f'{VENDOR_DIR}/'
+    return VENDOR.get(ruta[len(prefijo):]) if ruta.startswith(prefijo) else None
+
+
+def archivos_de(paquete):
+    """
+    Lista de (ruta_static, url_externa) para enlazar un paquete: el paquete
+    construido si existe; si no cada archivo, local o desde su CDN.
+    """
+    construido = f'{DIST_DIR}/{paquete}'
+    if existe(construido):
+        return [(construido, None)]
+    return [
+        (ruta, None) if existe(ruta) or not origen(ruta) else (None, origen(ruta))
+        for ruta in PAQUETES[paquete]
+    ]
+
+# ==============================================================================
+# 2. EMPAQUETADO
+# ==============================================================================
+
+URL_CSS = re.compile(r'url\(\s*([\'"]?)(?!data:|https?:|/)([^\'")?#]+)[^\'")]*\1\s*\)')
+
+
+def reubicar_urls(css, ruta_origen, ruta_destino):
+    """
+    Corrige los url() relativos de un CSS que se mueve de carpeta (las fuentes
+    de bootstrap-icons) y quita los "?v=..." que sobran con nombres con hash.
+    """
+    base_origen = os.path.dirname(ruta_origen)
+    base_destino = os.path.dirname(ruta_destino)
+
+    def reemplazar(m):
+        destino = os.path.normpath(os.path.join(base_origen, m.group(2)))
+        return f'url("{os.path.relpath(destino, base_destino).replace(os.sep, "/")}")'
+    return URL_CSS.sub(reemplazar, css)
+
+
+SOURCE_MAP = re.compile(r'^\s*(//|/\*)# sourceMappingURL=.*$', re.M)
+
+
+def quitar_source_maps(texto):
+    """
+    Borra los comentarios sourceMappingURL: no publicamos los .map y
+    ManifestStaticFilesStorage aborta collectstatic si no los encuentra.
+    """
+    return SOURCE_MAP.sub('', texto)
+
+
+def compactar(texto, extension):
+    """
+    Minificación conservadora de nuestros propios archivos (los de vendor ya
+    vienen minificados): comentarios de bloque en CSS, comentarios de línea
+    completa en JS, indentación y líneas vacías.
+    """
+    if extension == '.css':
+        texto = re.sub(r'/\*.*?\*/', '', texto, flags=re.S)
+    lineas = (linea.strip() for linea in texto.splitlines())
+    if extension == '.js':
+        lineas = (linea for linea in lineas if not linea.startswith('//'))
+    return '\n'.join(linea for linea in lineas if linea) + '\n'
+
+
+def construir(paquete, leer):
+    """
+    Contenido del paquete. 'leer(ruta)' devuelve el texto de un archivo de
+    static; los que no vienen de vendor se compactan.
+    """
+    extension = os.path.splitext(paquete)[1]
+    destino = f'{DIST_DIR}/{paquete}'
+    partes = []
+    for ruta in PAQUETES[paquete]:
+        texto = quitar_source_maps(leer(ruta))
+        if not ruta.startswith(f'{VENDOR_DIR}/'):
+            texto = compactar(texto, extension)
+        if extension == '.css':
+            texto = reubicar_urls(texto, ruta, destino)
+        # ';' entre scripts: un archivo sin punto y coma final no se pega al siguiente
+        partes.append(f"/* {os.path.basename(ruta)} */\n{texto}" + (';\n' if extension == '.js' else '\n'))
+    return ''.join(partes)
+
+# ==============================================================================
+# 3. VERIFICACIÓN
+# ==============================================================================
+
+def revisar(leer):
+    """
+    (faltantes, desactualizados): paquetes de PAQUETES sin construir, y los
+    construidos que ya no coinciden con lo que generan sus fuentes (se editó
+    un archivo y no se volvió a correr construir_assets). 'leer(ruta)'
+    devuelve el texto de un archivo de static o None si no existe.
+    """
+    faltantes, desactualizados = [], []
+    for paquete, rutas in PAQUETES.items():
+        construido = leer(f'{DIST_DIR}/{paquete}')
+        if construido is None:
+            faltantes.append(paquete)
+        elif all(leer(ruta) is not None for ruta in rutas) and construido != construir(paquete, leer):
+            desactualizados.append(paquete)
+    return faltantes, desactualizados
+
+
+def leer_static(ruta):
+    """Texto de un archivo de static (vía finders), o None si no existe."""
+    encontrado = finders.find(ruta)
+    if encontrado is None:
+        return None
+    with open(encontrado, encoding='utf-8') as f:
+        return f.read()
+
+
+@checks.register(checks.Tags.staticfiles, deploy=True)
+def revisar_paquetes(app_configs=None, **kwargs):
+    """Sin los paquetes construidos las páginas (y el escáner sin internet) dependen de los CDN."""
+    faltantes, desactualizados = revisar(leer_static)
+    errores = []
+    for paquete in faltantes:
+        sin_descargar = [ruta for ruta in PAQUETES[paquete] if origen(ruta) and leer_static(ruta) is None]
+        if sin_descargar:
+            # No hay cómo armarlo sin internet: las páginas usan el respaldo del CDN
+            errores.append(checks.Warning(
+                f"El paquete {DIST_DIR}/{paquete} espera archivos de vendor sin descargar: "
+                + ", ".join(sin_descargar) + ". Se cargan desde el CDN.",
+                hint="Ejecute 'python manage.py construir_assets --descargar' y versione vendor/ y dist/.",
+                id='bodega.W001',
+            ))
+        else:
+            errores.append(checks.Error(
+                f"Falta el paquete {DIST_DIR}/{paquete}.",
+                hint="Ejecute 'python manage.py construir_assets' y versione dist/.",
+                id='bodega.E001',
+            ))
+    errores += [
+        checks.Error(
+            f"El paquete {DIST_DIR}/{paquete} no coincide con sus fuentes.",
+            hint="Ejecute 'python manage.py construir_assets' y versione dist/.",
+            id='bodega.E002',
+        )
+        for paquete in desactualizados
+    ]
+    return errores
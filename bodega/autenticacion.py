@@ -0,0 +1,88 @@
+"""
+Backend de autenticación con caché de usuarios por worker.
+
+Cada petición autenticada carga request.user desde la sesión; con ModelBackend
+eso es un SELECT a auth_user (más el de las bodegas asignadas) incluso para un
+escaneo de /api/verificar/. Aquí cada worker guarda los usuarios en memoria y
+sólo consulta la caché compartida para saber si alguno cambió: las señales de
+signals.py incrementan la versión del usuario (o la global) cuando se edita,
+cambia de grupos/permisos o de bodegas, y todos los workers lo recargan en su
+siguiente petición.
+
+AUTH_CACHE_SEGUNDOS acota además cuánto vive cada entrada (0 = sin caché).
+"""
+import copy
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+CLAVE_GLOBAL = 'auth:usuarios:version'
+
+
+def _clave_usuario(user_id):
+    return f'auth:usuario:{user_id}:version'
+
+
+_usuarios = {}  # user_id -> (versión, expira, usuario)
+_candado = threading.Lock()
+
+
+def _version(user_id):
+    """Versión (global, del usuario) en la caché compartida."""
+    claves = [CLAVE_GLOBAL, _clave_usuario(user_id)]
+    versiones = cache.get_many(claves)
+    faltantes = [c for c in claves if c not in versiones]
+    if faltantes:
+        # Igual que inventario.py: una clave perdida nunca vuelve a un valor ya usado
+        inicial = int(time.time() * 1000)
+        for clave in faltantes:
+            cache.add(clave, inicial, None)
+        versiones.update(cache.get_many(faltantes))
+    return tuple(versiones.get(c) for c in claves)
+
+
+def invalidar_usuarios(user_ids=None):
+    """Fuerza la recarga de esos usuarios en todos los workers (None = todos)."""
+    claves = [CLAVE_GLOBAL] if user_ids is None else [_clave_usuario(i) for i in user_ids]
+    with _candado:
+        if user_ids is None:
+            _usuarios.clear()
+        for user_id in user_ids or ():
+            _usuarios.pop(user_id, None)
+    for clave in claves:
+        try:
+            cache.incr(clave)
+        except ValueError:
+            # No existía: quien la lea después parte de la hora actual
+            pass
+
+
+class BackendUsuariosCacheados(ModelBackend):
+    """ModelBackend cuyo get_user() responde desde memoria mientras el usuario no cambie."""
+
+    def get_user(self, user_id):
+        segundos = settings.AUTH_CACHE_SEGUNDOS
+        if not segundos:
+            return super().get_user(user_id)
+
+        version = _version(user_id)
+        ahora = time.monotonic()
+        entrada = _usuarios.get(user_id)
+        if entrada is None or entrada[0] != version or entrada[1] < ahora:
+            usuario = super().get_user(user_id)
+            if usuario is None:
+                return None
+            # Memo compartido por las copias (alcance.py guarda aquí las bodegas)
+            usuario.memo_cache = {}
+            entrada = (version, ahora + segundos, usuario)
+            with _candado:
+                _usuarios[user_id] = entrada
+        # Copia por petición: atributos como .backend o _perm_cache no se pisan entre hilos
+        return copy.copy(entrada[2])
+
+    async def aget_user(self, user_id):
+        return await sync_to_async(self.get_user)(user_id)
@@ -0,0 +1,75 @@
+"""
+Compresión de respuestas streaming de la API.
+
+El catálogo completo de herramientas se envía como StreamingHttpResponse, así
+que no sirve GZipMiddleware de forma global (también comprimiría páginas con
+token CSRF). Cada trozo se comprime apenas se genera: Brotli si está instalado
+y el cliente lo acepta, si no gzip.
+"""
+import zlib
+
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # Dependencia opcional
+    brotli = None
+
+
+class _Gzip:
+    def __init__(self):
+        self._compresor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def comprimir(self, datos):
+        return self._compresor.compress(datos)
+
+    def terminar(self):
+        return self._compresor.flush()
+
+
+class _Brotli:
+    def __init__(self):
+        self._compresor = brotli.Compressor(quality=5)
+
+    def comprimir(self, datos):
+        return self._compresor.process(datos)
+
+    def terminar(self):
+        return self._compresor.finish()
+
+
+def codificacion_aceptada(request):
+    """'br', 'gzip' o None según Accept-Encoding y lo disponible."""
+    aceptadas = {
+        parte.split(';')[0].strip().lower()
+        for parte in request.headers.get('Accept-Encoding', '').split(',')
+    }
+    if brotli is not None and 'br' in aceptadas:
+        return 'br'
+    if 'gzip' in aceptadas:
+        return 'gzip'
+    return None
+
+
+def comprimir_stream(trozos, codificacion):
+    """Comprime un iterable de bytes trozo a trozo."""
+    compresor = _Brotli() if codificacion == 'br' else _Gzip()
+    for trozo in trozos:
+        salida = compresor.comprimir(trozo)
+        if salida:
+            yield salida
+    yield compresor.terminar()
+
+
+def respuesta_comprimida(request, response):
+    """
+    Aplica la compresión acordada con el cliente a una StreamingHttpResponse
+    cuyo contenido son bytes.
+    """
+    # Se suma a lo que ya varíe (Cookie si se leyó la sesión), no lo reemplaza
+    patch_vary_headers(response, ('Accept-Encoding',))
+    codificacion = codificacion_aceptada(request)
+    if codificacion:
+        response.streaming_content = comprimir_stream(response.streaming_content, codificacion)
+        response.headers['Content-Encoding'] = codificacion
+    return response
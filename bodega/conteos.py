@@ -0,0 +1,161 @@
+"""
+Conteo físico de inventario (toma cíclica) por ubicación.
+
+Se abre un conteo para una bodega y el escáner manda los códigos leídos en
+lotes: cada lote es una consulta para resolver los códigos y un bulk_create
+de las lecturas (los repetidos los descarta el índice único conteo+código),
+nunca una consulta por escaneo. Varios bodegueros pueden escanear la misma
+bodega a la vez: comparten el conteo abierto.
+
+Al conciliar se leen una vez las herramientas de la ubicación y las lecturas
+como arreglos de ids, y los conjuntos salen de operaciones de NumPy (isin,
+setdiff1d) en vez de comparar objeto por objeto; un conteo de 10 mil
+herramientas se concilia en milisegundos.
+"""
+import numpy as np
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import ConteoInventario, Herramienta, LecturaConteo
+
+# Deben estar en el estante; si no se escanean, faltan
+ESTADOS_EN_ESTANTE = ('DISPONIBLE',)
+# Pueden estar o no (el taller suele estar en la misma bodega): no son error
+ESTADOS_TOLERADOS = ('EN_MANTENCION',)
+# Detalle de las herramientas de otras ubicaciones, en trozos para no armar un IN gigante
+LOTE_DETALLE = 1000
+
+
+class ConteoInvalido(Exception):
+    """Operación rechazada. 'status' es el código HTTP que corresponde."""
+
+    def __init__(self, mensaje, status=400):
+        super().__init__(mensaje)
+        self.status = status
+
+
+def abrir(ubicacion, usuario):
+    """Devuelve el conteo abierto de la ubicación, o abre uno."""
+    abiertos = ConteoInventario.objects.filter(ubicacion=ubicacion, estado='ABIERTO')
+    conteo = abiertos.first()
+    if conteo is not None:
+        return conteo
+    try:
+        with transaction.atomic():
+            return ConteoInventario.objects.create(ubicacion=ubicacion, usuario=usuario)
+    except IntegrityError:
+        # Otro bodeguero lo abrió al mismo tiempo (índice conteo_abierto_por_ubicacion_uniq): se comparte
+        return abiertos.get()
+
+# ==============================================================================
+# 1. LECTURAS
+# ==============================================================================
+
+def _clasificar(conteo, herramienta):
+    """Aviso inmediato para el escáner: (clave, texto)."""
+    if herramienta is None:
+        return 'DESCONOCIDO', "Código sin herramienta"
+    herramienta_id, ubicacion_id, estado, activo = herramienta
+    if ubicacion_id != conteo.ubicacion_id:
+        return 'OTRA_UBICACION', "Pertenece a otra ubicación"
+    if not activo or estado not in ESTADOS_EN_ESTANTE + ESTADOS_TOLERADOS:
+        return 'ESTADO', dict(Herramienta.ESTADOS).get(estado, estado) if activo else "Está dada de baja"
+    return 'OK', "Registrada"
+
+
+def registrar_lecturas(conteo, codigos, usuario):
+    """
+    Guarda un lote de códigos escaneados. Devuelve {codigo: (clave, texto)}
+    para que el escáner marque cada uno.
+    """
+    if conteo.estado != 'ABIERTO':
+        raise ConteoInvalido("El conteo ya está cerrado.", status=409)
+    codigos = list(dict.fromkeys(c.strip() for c in codigos if isinstance(c, str) and c.strip()))
+    if not codigos:
+        return {}
+
+    herramientas = {
+        fila[0]: fila[1:] for fila in Herramienta.objects.filter(codigo_qr__in=codigos).values_list(
+            'codigo_qr', 'id', 'ubicacion_id', 'estado', 'activo'
+        )
+    }
+    LecturaConteo.objects.bulk_create(
+        [LecturaConteo(conteo=conteo, codigo=codigo, usuario=usuario,
+                       herramienta_id=herramientas[codigo][0] if codigo in herramientas else None)
+         for codigo in codigos],
+        ignore_conflicts=True,
+    )
+    return {codigo: _clasificar(conteo, herramientas.get(codigo)) for codigo in codigos}
+
+# ==============================================================================
+# 2. CONCILIACIÓN
+# ==============================================================================
+
+def _detalle(filas, ubicacion=None):
+    return [
+        {'id': f[0], 'codigo': f[1], 'nombre': f[2], 'estado': f[3], 'activo': f[4],
+         'ubicacion': ubicacion if ubicacion is not None else f[5]}
+        for f in filas
+    ]
+
+
+def conciliar(conteo):
+    """
+    Compara las lecturas con lo que el sistema espera en la ubicación:
+
+    - faltantes: activas en ESTADOS_EN_ESTANTE que nadie escaneó
+    - inesperadas: escaneadas que pertenecen a otra ubicación
+    - estado_incorrecto: escaneadas de esta ubicación que no deberían estar
+      (en préstamo o dadas de baja)
+    - desconocidos: códigos que no son de ninguna herramienta
+    """
+    filas = list(
+        Herramienta.objects.filter(ubicacion_id=conteo.ubicacion_id).order_by('id')
+        .values_list('id', 'codigo_qr', 'nombre', 'estado', 'activo')
+    )
+    ids = np.fromiter((f[0] for f in filas), dtype=np.int64, count=len(filas))
+    estados = np.array([f[3] for f in filas], dtype=object)
+    activas = np.fromiter((f[4] for f in filas), dtype=bool, count=len(filas))
+
+    lecturas = list(conteo.lecturas.values_list('herramienta_id', 'codigo'))
+    leidas = np.unique(np.fromiter((h for h, _ in lecturas if h is not None), dtype=np.int64))
+    desconocidos = sorted(codigo for h, codigo in lecturas if h is None)
+
+    esperadas = activas & np.isin(estados, ESTADOS_EN_ESTANTE)
+    toleradas = activas & np.isin(estados, ESTADOS_TOLERADOS)
+    escaneadas = np.isin(ids, leidas, assume_unique=True)
+
+    faltantes = np.flatnonzero(esperadas & ~escaneadas)
+    estado_incorrecto = np.flatnonzero(escaneadas & ~esperadas & ~toleradas)
+    inesperadas = np.setdiff1d(leidas, ids, assume_unique=True).tolist()
+
+    nombre_ubicacion = conteo.ubicacion.nombre
+    detalle_inesperadas = []
+    for desde in range(0, len(inesperadas), LOTE_DETALLE):
+        detalle_inesperadas += _detalle(
+            Herramienta.objects.filter(id__in=inesperadas[desde:desde + LOTE_DETALLE]).order_by('id')
+            .values_list('id', 'codigo_qr', 'nombre', 'estado', 'activo', 'ubicacion__nombre')
+        )
+
+    return {
+        'esperadas': int(esperadas.sum()),
+        'encontradas': int((esperadas & escaneadas).sum()),
+        'lecturas': int(leidas.size) + len(desconocidos),
+        'faltantes': _detalle((filas[i] for i in faltantes), nombre_ubicacion),
+        'inesperadas': detalle_inesperadas,
+        'estado_incorrecto': _detalle((filas[i] for i in estado_incorrecto), nombre_ubicacion),
+        'desconocidos': desconocidos,
+    }
+
+
+def cerrar(conteo):
+    """Concilia, guarda el resultado y cierra el conteo."""
+    with transaction.atomic():
+        conteo = ConteoInventario.objects.select_for_update().select_related('ubicacion').get(pk=conteo.pk)
+        if conteo.estado != 'ABIERTO':
+            raise ConteoInvalido("El conteo ya está cerrado.", status=409)
+        conteo.resultado = conciliar(conteo)
+        conteo.estado = 'CERRADO'
+        conteo.cerrado = timezone.now()
+        conteo.save(update_fields=['resultado', 'estado', 'cerrado'])
+    return conteo
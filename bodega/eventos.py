@@ -0,0 +1,251 @@
+"""
+Bus de eventos para el canal de actualizaciones en vivo.
+
+Los flujos de préstamo, devolución, baja, reactivación y liberación publican
+aquí cada cambio de estado de una herramienta. El dashboard y la consulta de
+stock se suscriben vía SSE (ASGI) o polling corto (Gunicorn) y actualizan los
+KPIs sin volver a consultar MySQL.
+
+Los eventos viven en la caché compartida (Redis en producción), así todos los
+workers ven la misma secuencia. Sin Redis la caché de archivos sólo es
+compartida dentro del mismo servidor y su incr no es atómico entre procesos:
+dos workers entregarían el mismo id y se pisarían los eventos. Por eso
+gunicorn.conf.py se niega a arrancar más de un worker sin REDIS_URL.
+"""
+import asyncio
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .inventario import invalidar_inventario
+
+# ==============================================================================
+# 1. KPIs AFECTADOS POR CADA ESTADO
+# ==============================================================================
+
+def _kpis_de(estado, activo):
+    """Indica en qué contadores del dashboard/stock suma una herramienta."""
+    if not activo:
+        return {'bajas'}
+    kpis = {'activas'}
+    if estado == 'DISPONIBLE':
+        kpis.add('disponibles')
+    elif estado == 'EN_USO':
+        kpis.add('en_uso')
+    elif estado == 'EN_MANTENCION':
+        kpis.add('en_mantencion')
+    return kpis
+
+
+def calcular_deltas(estado_anterior, activo_anterior, estado, activo):
+    """Diferencia en los KPIs que produce una transición de estado."""
+    antes = _kpis_de(estado_anterior, activo_anterior)
+    despues = _kpis_de(estado, activo)
+    deltas = {}
+    for kpi in antes - despues:
+        deltas[kpi] = -1
+    for kpi in despues - antes:
+        deltas[kpi] = 1
+    return deltas
+
+# ==============================================================================
+# 2. BUS DE EVENTOS
+# ==============================================================================
+
+CLAVE_SECUENCIA = 'eventos:secuencia'
+# Último id ya escrito: distingue un evento reservado que aún no se guarda
+# (no se espera por él) de uno que venció (el cliente recarga)
+CLAVE_ESCRITO = 'eventos:escrito'
+# Relecturas de un id que falta entre otros ya escritos (otro worker lo
+# reservó antes y lo está guardando) y pausa entre ellas, en segundos
+REINTENTOS_LECTURA = 3
+PAUSA_REINTENTO = 0.02
+
+
+def _clave_evento(evento_id):
+    return f'eventos:{evento_id}'
+
+
+class BusEventos:
+    """
+    Eventos numerados guardados en la caché compartida, con una secuencia
+    común a todos los workers (cache.incr). Un id entregado por un worker
+    sirve en cualquier otro: el polling de Gunicorn reparte las peticiones
+    entre procesos sin perder ni repetir eventos.
+
+    Los consumidores piden "todo lo posterior a mi último id". Los streams
+    SSE del mismo proceso además se despiertan al instante cuando se publica
+    aquí; lo publicado por otros procesos lo ven en la siguiente revisión.
+    """
+
+    def __init__(self, capacidad=500):
+        self.capacidad = capacidad
+        self._candado = threading.Lock()
+        self._esperas_async = set()
+
+    @property
+    def ultimo_id(self):
+        actual = cache.get(CLAVE_SECUENCIA)
+        if actual is None:
+            # Partimos desde la hora actual (como las versiones del inventario):
+            # si la clave se pierde, los ids nuevos quedan lejos de los viejos y
+            # los clientes desfasados recargan en vez de mezclar secuencias.
+            cache.add(CLAVE_SECUENCIA, int(time.time() * 1000), None)
+            actual = cache.get(CLAVE_SECUENCIA)
+        return actual
+
+    def _reservar(self, cantidad):
+        """Reserva 'cantidad' ids consecutivos; devuelve el primero."""
+        try:
+            ultimo = cache.incr(CLAVE_SECUENCIA, cantidad)
+        except ValueError:
+            self.ultimo_id  # La caché perdió la secuencia: la vuelve a crear
+            ultimo = cache.incr(CLAVE_SECUENCIA, cantidad)
+        return ultimo - cantidad + 1
+
+    def publicar_lote(self, lote):
+        """Publica varios (tipo, datos) con ids consecutivos. Devuelve los eventos."""
+        if not lote:
+            return []
+        primero = self._reservar(len(lote))
+        fecha = timezone.now().isoformat()
+        eventos = [
+            dict(datos, id=primero + i, tipo=tipo, fecha=fecha)
+            for i, (tipo, datos) in enumerate(lote)
+        ]
+        cache.set_many(
+            {_clave_evento(e['id']): e for e in eventos},
+            settings.EVENTOS_RETENCION_SEGUNDOS,
+        )
+        # Sin max atómico: si otro worker escribió uno mayor recién, gana el último
+        # set. Sólo retrasa la detección de eventos vencidos, no pierde ninguno.
+        cache.set(CLAVE_ESCRITO, eventos[-1]['id'], None)
+
+        # Despertamos a los streams SSE de este proceso
+        with self._candado:
+            esperas = list(self._esperas_async)
+        for loop, senal in esperas:
+            try:
+                loop.call_soon_threadsafe(senal.set)
+            except RuntimeError:
+                pass  # El loop ya se cerró
+        return eventos
+
+    def publicar(self, tipo, datos):
+        return self.publicar_lote([(tipo, datos)])[0]
+
+    def desde(self, ultimo_id):
+        """
+        Devuelve (eventos, recargar). 'recargar' es True cuando el cliente
+        quedó desfasado (la caché perdió la secuencia, o ya venció o quedó
+        fuera de la capacidad algún evento que le falta) y debe volver a pedir
+        la página completa.
+
+        Un id se reserva (incr) antes de guardar el evento, así que al final
+        de la secuencia puede faltar alguno que otro worker está escribiendo:
+        se entrega hasta el anterior y el resto llega en la próxima consulta.
+        """
+        actual = self.ultimo_id
+        if ultimo_id > actual or actual - ultimo_id > self.capacidad:
+            return [], True
+        if ultimo_id == actual:
+            return [], False
+        claves = [_clave_evento(i) for i in range(ultimo_id + 1, actual + 1)]
+        encontrados = cache.get_many(claves)
+        for _ in range(REINTENTOS_LECTURA):
+            faltan = [clave for clave in claves if clave not in encontrados]
+            # Si todo lo que falta está al final no hay por qué esperar; si hay
+            # eventos escritos después del hueco, probablemente se está guardando
+            if not faltan or len(faltan) == len(claves) - claves.index(faltan[0]):
+                break
+            time.sleep(PAUSA_REINTENTO)
+            encontrados.update(cache.get_many(faltan))
+
+        eventos = []
+        for clave in claves:
+            if clave not in encontrados:
+                break
+            eventos.append(encontrados[clave])
+        if len(eventos) == len(claves):
+            return eventos, False
+
+        hueco = ultimo_id + 1 + len(eventos)
+        escrito = max(cache.get(CLAVE_ESCRITO) or 0, max((e['id'] for e in encontrados.values()), default=0))
+        if hueco <= escrito:
+            # Ya se escribió y no está: venció, o su publicador murió a medias
+            return [], True
+        return eventos, False
+
+    async def esperar_async(self, ultimo_id, timeout):
+        """
+        Para el stream SSE bajo ASGI (no ocupa threads): espera hasta
+        'timeout' a que este proceso publique algo y vuelve a revisar la caché.
+        """
+        senal = asyncio.Event()
+        registro = (asyncio.get_running_loop(), senal)
+        with self._candado:
+            self._esperas_async.add(registro)
+        try:
+            eventos, recargar = await sync_to_async(self.desde)(ultimo_id)
+            if eventos or recargar:
+                return eventos, recargar
+            await asyncio.wait_for(senal.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._candado:
+                self._esperas_async.discard(registro)
+        return await sync_to_async(self.desde)(ultimo_id)
+
+
+bus = BusEventos()
+
+# ==============================================================================
+# 3. PUBLICACIÓN DESDE LAS VISTAS
+# ==============================================================================
+
+def _datos_cambio(herramienta, estado_anterior, activo_anterior):
+    return {
+        'herramienta_id': herramienta.id,
+        'codigo_qr': herramienta.codigo_qr,
+        'nombre': herramienta.nombre,
+        'ubicacion_id': herramienta.ubicacion_id,
+        'estado_anterior': estado_anterior,
+        'estado': herramienta.estado,
+        'activo': herramienta.activo,
+        'kpis': calcular_deltas(estado_anterior, activo_anterior, herramienta.estado, herramienta.activo),
+    }
+
+
+def publicar_cambios(transiciones):
+    """
+    Publica varias transiciones (herramienta, estado_anterior, activo_anterior)
+    una vez confirmada la transacción, para no anunciar cambios que terminan
+    en rollback. También invalida los fragmentos cacheados de las listas (las
+    actualizaciones masivas con .update() no disparan post_save), una sola vez
+    por bodega aunque el lote traiga miles de herramientas.
+    """
+    lote = [_datos_cambio(*transicion) for transicion in transiciones]
+    if not lote:
+        return
+
+    def al_confirmar():
+        invalidar_inventario(list({datos['ubicacion_id'] for datos in lote}))
+        bus.publicar_lote([('herramienta', datos) for datos in lote])
+
+    transaction.on_commit(al_confirmar)
+
+
+def publicar_cambio(herramienta, estado_anterior, activo_anterior):
+    """Publica la transición de una sola herramienta (ver publicar_cambios)."""
+    publicar_cambios([(herramienta, estado_anterior, activo_anterior)])
+
+
+def publicar_trabajadores(delta):
+    """Publica un cambio en la cantidad de trabajadores activos."""
+    transaction.on_commit(lambda: bus.publicar('trabajadores', {'kpis': {'trabajadores': delta}}))
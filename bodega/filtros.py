@@ -0,0 +1,113 @@
+"""
+Filtros de fecha de los reportes.
+
+Los formularios mandan días (AAAA-MM-DD, ambos incluidos). Filtrar con
+campo__date__gte / campo__date__lte obliga a la base a pasar cada fila a la
+hora de Santiago y aplicarle DATE(): ningún índice sobre el timestamp sirve
+y se recorre la tabla completa. Aquí los días se convierten una sola vez, en
+Python, al rango semiabierto
+
+    [inicio del primer día, inicio del día siguiente al último)
+
+en hora local (zoneinfo resuelve los cambios de horario), y se filtra con
+campo__gte / campo__lt sobre la columna tal cual: un range scan del índice.
+"""
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+FORMATO_DIA = '%Y-%m-%d'
+# Fuera de esto es un error de tipeo (y 9999-12-31 + 1 día desborda)
+ANIO_MINIMO, ANIO_MAXIMO = 2000, 2100
+
+
+def inicio_del_dia(dia):
+    """Primer instante de 'dia' en hora local, como datetime aware."""
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def _leer_dia(valor, etiqueta, errores):
+    if not valor:
+        return None
+    try:
+        dia = datetime.strptime(valor, FORMATO_DIA).date()
+    except ValueError:
+        errores.append(f"La {etiqueta} '{valor}' no es válida (AAAA-MM-DD).")
+        return None
+    if not ANIO_MINIMO <= dia.year <= ANIO_MAXIMO:
+        errores.append(f"La {etiqueta} {valor} está fuera de rango.")
+        return None
+    return dia
+
+# ==============================================================================
+# 1. RANGO DE DÍAS
+# ==============================================================================
+
+class RangoFechas:
+    """
+    Días elegidos (ambos incluidos, None = sin límite) y su rango semiabierto
+    [inicio, fin) en hora local. 'errores' trae los valores que se ignoraron.
+    """
+
+    def __init__(self, desde=None, hasta=None, errores=None):
+        if desde and hasta and desde > hasta:
+            desde, hasta = hasta, desde
+        self.desde = desde
+        self.hasta = hasta
+        self.inicio = inicio_del_dia(desde) if desde else None
+        self.fin = inicio_del_dia(hasta + timedelta(days=1)) if hasta else None
+        self.errores = errores or []
+
+    def filtrar(self, queryset, campo):
+        """Aplica el rango a 'campo' (un DateTimeField, puede cruzar relaciones)."""
+        if self.inicio:
+            queryset = queryset.filter(**{f'{campo}__gte': self.inicio})
+        if self.fin:
+            queryset = queryset.filter(**{f'{campo}__lt': self.fin})
+        return queryset
+
+    def dias(self):
+        """Días que abarca el rango, o None si le falta algún límite (toda la historia)."""
+        if self.desde is None or self.hasta is None:
+            return None
+        return (self.hasta - self.desde).days + 1
+
+    def contexto(self):
+        """Valores para repintar los <input type="date"> del formulario."""
+        return {
+            'filtro_inicio': self.desde.isoformat() if self.desde else '',
+            'filtro_fin': self.hasta.isoformat() if self.hasta else '',
+        }
+
+
+def leer_rango(datos, dias_defecto=None):
+    """
+    RangoFechas desde ?fecha_inicio=&fecha_fin= ('datos' es request.GET). Un
+    día mal escrito se ignora y queda en rango.errores. Con 'dias_defecto' los
+    límites que falten se completan: hasta hoy y desde N días antes.
+    """
+    errores = []
+    desde = _leer_dia(datos.get('fecha_inicio', ''), 'fecha de inicio', errores)
+    hasta = _leer_dia(datos.get('fecha_fin', ''), 'fecha de término', errores)
+    if dias_defecto is not None:
+        hasta = hasta or timezone.localdate()
+        desde = desde or hasta - timedelta(days=dias_defecto)
+    return RangoFechas(desde, hasta, errores)
+
+# ==============================================================================
+# 2. UN MOMENTO
+# ==============================================================================
+
+def leer_momento(datos):
+    """
+    ?fecha=AAAA-MM-DD&hora=HH:MM -> datetime local. Sin hora se toma el cierre
+    del día (inicio del día siguiente); sin fecha o inválida, ahora.
+    """
+    dia = _leer_dia(datos.get('fecha', ''), 'fecha', [])
+    if dia is None:
+        return timezone.now()
+    try:
+        hora = datetime.strptime(datos.get('hora', ''), '%H:%M').time()
+    except ValueError:
+        return inicio_del_dia(dia + timedelta(days=1))
+    return timezone.make_aware(datetime.combine(dia, hora))
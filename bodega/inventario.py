@@ -0,0 +1,70 @@
+"""
+Versión del inventario, particionada por ubicación.
+
+Cada cambio de estado o de datos maestros incrementa un número de versión;
+los fragmentos cacheados de las listas usan la versión como parte de la clave,
+así una ráfaga de visitas cuesta un solo render hasta el siguiente cambio.
+
+Hay una versión global (vista sin restricción), una por Ubicacion (vista de
+un bodeguero asignado) y una de maestros (nombres de categorías/ubicaciones)
+que afecta a todas. Un cambio en la bodega A no invalida la caché de la B.
+"""
+import time
+
+from django.core.cache import cache
+
+CLAVE_GLOBAL = 'inventario:version'
+CLAVE_MAESTROS = 'inventario:version:maestros'
+
+
+def _clave_ubicacion(ubicacion_id):
+    return f'inventario:version:u{ubicacion_id}'
+
+
+def _leer(claves):
+    versiones = cache.get_many(claves)
+    faltantes = [c for c in claves if c not in versiones]
+    if faltantes:
+        # Partimos desde la hora actual: si la clave se pierde (reinicio o
+        # desalojo) nunca se reutiliza una versión que ya tenga fragmentos.
+        inicial = int(time.time() * 1000)
+        for clave in faltantes:
+            cache.add(clave, inicial, None)
+        versiones.update(cache.get_many(faltantes))
+    return [versiones[c] for c in claves]
+
+
+def _incrementar(clave):
+    try:
+        cache.incr(clave)
+    except ValueError:
+        _leer([clave])
+
+
+def version_inventario(ubicaciones=None):
+    """
+    Devuelve un string que identifica el estado del inventario visible para
+    el alcance dado (None = todas las ubicaciones).
+    """
+    if ubicaciones is None:
+        globales, maestros = _leer([CLAVE_GLOBAL, CLAVE_MAESTROS])
+        return f'g{globales}.m{maestros}'
+
+    claves = [_clave_ubicacion(u) for u in ubicaciones] + [CLAVE_MAESTROS]
+    *locales, maestros = _leer(claves)
+    partes = [f'u{u}.{v}' for u, v in zip(ubicaciones, locales)]
+    return '-'.join(partes) + f'.m{maestros}'
+
+
+def invalidar_inventario(ubicaciones=None):
+    """
+    Invalida la vista global y las de las ubicaciones afectadas. Sin
+    ubicaciones conocidas (cambio de datos maestros) invalida todo.
+    """
+    _incrementar(CLAVE_GLOBAL)
+    if ubicaciones is None:
+        _incrementar(CLAVE_MAESTROS)
+        return
+    for ubicacion_id in set(ubicaciones):
+        if ubicacion_id is not None:
+            _incrementar(_clave_ubicacion(ubicacion_id))
@@ -0,0 +1,138 @@
+"""
+Mide el motor de analítica (bodega/analitica.py).
+
+Contra la base configurada cronometra por separado la lectura (consultas y
+conversión a arreglos), el cálculo y el reporte completo de analizar(): la
+lectura es la parte que más pesa. Correrlo contra una copia de producción o
+una base con datos de prueba, no contra una vacía.
+
+Además genera en memoria un año de préstamos para N herramientas (por
+defecto 20 mil con ~50 préstamos cada una, un millón de filas) y cronometra
+sólo el cálculo, para comparar el motor sin depender de la base.
+
+    python manage.py benchmark_analitica
+    python manage.py benchmark_analitica --dias 90 --sin-sinteticos
+    python manage.py benchmark_analitica --sin-bd --herramientas 50000 --prestamos 80
+"""
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from bodega import analitica
+
+SEGUNDOS_DIA = 86400
+
+
+def _sinteticos(n, por_herramienta, dias, ahora, semilla=0):
+    """Tuplas (herramientas, prestamos, mantenciones) con el mismo formato que cargar_*."""
+    rng = np.random.default_rng(semilla)
+    ids = np.arange(1, n + 1, dtype=np.int64)
+    categorias = rng.integers(1, 40, n)
+    ubicaciones = rng.integers(1, 12, n)
+
+    total = n * por_herramienta
+    herramienta_id = rng.integers(1, n + 1, total)
+    inicio = ahora - rng.random(total) * dias * SEGUNDOS_DIA
+    fin = inicio + rng.exponential(8 * 3600, total)
+    fin[fin > ahora] = np.nan  # Préstamos que siguen abiertos
+    falla = rng.random(total) < 0.02
+
+    # Cada devolución con falla abre una mantención de ~3 días
+    con_falla = falla & ~np.isnan(fin)
+    inicio_taller = fin[con_falla]
+    fin_taller = inicio_taller + rng.exponential(3 * SEGUNDOS_DIA, len(inicio_taller))
+    fin_taller[fin_taller > ahora] = np.nan
+    return (
+        (ids, categorias, ubicaciones),
+        (herramienta_id, inicio, fin, falla),
+        (herramienta_id[con_falla], inicio_taller, fin_taller),
+    )
+
+
+class Command(BaseCommand):
+    help = "Cronometra la analítica de utilización: lectura desde la BD, cálculo y reporte completo."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--herramientas', type=int, default=20000)
+        parser.add_argument('--prestamos', type=int, default=50, help="Préstamos por herramienta")
+        parser.add_argument('--dias', type=int, default=365, help="Largo del período analizado")
+        parser.add_argument('--repeticiones', type=int, default=3)
+        parser.add_argument('--sin-bd', action='store_true', help="Sólo el cálculo con datos sintéticos")
+        parser.add_argument('--sin-sinteticos', action='store_true', help="Sólo la medición contra la base")
+
+    def _mejor(self, funcion, repeticiones):
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            resultado = funcion()
+            tiempos.append(time.perf_counter() - inicio)
+        return min(tiempos), resultado
+
+    def handle(self, *args, **opciones):
+        if not opciones['sin_bd']:
+            self._base_de_datos(opciones['dias'], opciones['repeticiones'])
+        if not opciones['sin_sinteticos']:
+            self._sinteticos(opciones)
+
+    def _base_de_datos(self, dias, repeticiones):
+        hasta = timezone.now()
+        desde = hasta - timedelta(days=dias)
+
+        t_lectura, datos = self._mejor(lambda: (
+            analitica.cargar_herramientas(),
+            analitica.cargar_prestamos(desde, hasta),
+            analitica.cargar_mantenciones(desde, hasta),
+        ), repeticiones)
+        herramientas, prestamos, mantenciones = datos
+        t_calculo, _ = self._mejor(
+            lambda: analitica.calcular(
+                herramientas, prestamos, mantenciones, desde.timestamp(), hasta.timestamp(), hasta.timestamp()
+            ),
+            repeticiones
+        )
+        t_total, _ = self._mejor(lambda: analitica.analizar(desde, hasta), repeticiones)
+
+        filas = len(prestamos[0]) + len(mantenciones[0])
+        self.stdout.write(
+            f"Base de datos ({dias} días): {len(herramientas[0])} herramientas, {len(prestamos[0])} préstamos, "
+            f"{len(mantenciones[0])} mantenciones"
+        )
+        self.stdout.write(
+            f"  Lectura y conversión a arreglos: {t_lectura:.2f} s"
+            + (f" ({filas / t_lectura:,.0f} filas/s)" if t_lectura and filas else "")
+        )
+        self.stdout.write(f"  Cálculo: {t_calculo:.3f} s")
+        self.stdout.write(f"  Reporte completo (analizar): {t_total:.2f} s")
+        if not filas:
+            self.stdout.write(self.style.WARNING("  La base no tiene préstamos en el período: la medición no dice nada."))
+
+    def _sinteticos(self, opciones):
+        ahora = timezone.now().timestamp()
+        desde = ahora - opciones['dias'] * SEGUNDOS_DIA
+        repeticiones = opciones['repeticiones']
+
+        inicio = time.perf_counter()
+        herramientas, prestamos, mantenciones = _sinteticos(
+            opciones['herramientas'], opciones['prestamos'], opciones['dias'], ahora
+        )
+        self.stdout.write(
+            f"Datos sintéticos: {len(herramientas[0])} herramientas, {len(prestamos[0])} préstamos "
+            f"({time.perf_counter() - inicio:.2f} s en generarlos, sin lectura desde la base)"
+        )
+
+        t_calculo, metricas = self._mejor(
+            lambda: analitica.calcular(herramientas, prestamos, mantenciones, desde, ahora, ahora), repeticiones
+        )
+        t_grupos, _ = self._mejor(
+            lambda: (analitica.agrupar(metricas, herramientas[1]), analitica.agrupar(metricas, herramientas[2])),
+            repeticiones
+        )
+        self.stdout.write(f"  Métricas por herramienta: {t_calculo:.3f} s")
+        self.stdout.write(f"  Agrupación por categoría y ubicación: {t_grupos:.3f} s")
+        self.stdout.write(
+            f"  Utilización media: {metricas['utilizacion'].mean() * 100:.1f}%  "
+            f"Tasa de falla global: {metricas['fallas'].sum() / max(metricas['devoluciones'].sum(), 1) * 100:.1f}%"
+        )
@@ -0,0 +1,123 @@
+"""
+Mide el costo de arranque de un proceso de SmartStock.
+
+  - import: ejecuta 'python -X importtime manage.py check' en subprocesos y
+    resume el tiempo total de imports y los módulos más pesados.
+  - worker: levanta Gunicorn (con y sin GUNICORN_PRELOAD) y mide cuánto tarda
+    en responder la primera petición a la página de login.
+
+    python manage.py benchmark_arranque --repeticiones 5
+    python manage.py benchmark_arranque --worker
+"""
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+LINEA_IMPORTTIME = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = "Tiempo de imports de 'manage.py check' y primera respuesta de un worker."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument('--top', type=int, default=15, help="Imports más pesados a listar")
+        parser.add_argument('--worker', action='store_true',
+                            help="Mide también la primera respuesta de Gunicorn")
+        parser.add_argument('--timeout', type=float, default=30.0)
+
+    # --------------------------------------------------------------------------
+    # 1. IMPORTS
+    # --------------------------------------------------------------------------
+
+    def _importtime(self):
+        """Devuelve (segundos_de_pared, {modulo_raiz: microsegundos_acumulados})."""
+        manage = os.path.join(settings.BASE_DIR, 'manage.py')
+        inicio = time.perf_counter()
+        proceso = subprocess.run(
+            [sys.executable, '-X', 'importtime', manage, 'check'],
+            capture_output=True, text=True, cwd=settings.BASE_DIR,
+        )
+        pared = time.perf_counter() - inicio
+        if proceso.returncode != 0:
+            raise CommandError(proceso.stderr[-2000:])
+
+        raices = {}
+        for linea in proceso.stderr.splitlines():
+            coincidencia = LINEA_IMPORTTIME.match(linea)
+            # Sólo los imports de primer nivel: su acumulado ya incluye a los hijos
+            if coincidencia and len(coincidencia.group(3)) == 1:
+                raices[coincidencia.group(4)] = int(coincidencia.group(2))
+        return pared, raices
+
+    def _medir_imports(self, repeticiones, top):
+        paredes, totales, acumulado = [], [], {}
+        for _ in range(repeticiones):
+            pared, raices = self._importtime()
+            paredes.append(pared)
+            totales.append(sum(raices.values()) / 1000)
+            for modulo, us in raices.items():
+                acumulado.setdefault(modulo, []).append(us / 1000)
+
+        self.stdout.write(self.style.MIGRATE_HEADING("manage.py check"))
+        self.stdout.write(f"  proceso completo  mediana {statistics.median(paredes) * 1000:8.1f} ms")
+        self.stdout.write(f"  imports           mediana {statistics.median(totales):8.1f} ms")
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Imports más pesados (top {top})"))
+        pesados = sorted(acumulado.items(), key=lambda par: -statistics.median(par[1]))
+        for modulo, tiempos in pesados[:top]:
+            self.stdout.write(f"  {statistics.median(tiempos):8.1f} ms  {modulo}")
+
+    # --------------------------------------------------------------------------
+    # 2. PRIMERA RESPUESTA DE UN WORKER
+    # --------------------------------------------------------------------------
+
+    def _primera_respuesta(self, preload, timeout):
+        puerto = _puerto_libre()
+        url = f'http://127.0.0.1:{puerto}{reverse("login")}'
+        entorno = dict(os.environ, GUNICORN_PRELOAD='1' if preload else '0', WEB_CONCURRENCY='1')
+        inicio = time.perf_counter()
+        proceso = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py',
+             '--bind', f'127.0.0.1:{puerto}'],
+            cwd=settings.BASE_DIR, env=entorno,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            while time.perf_counter() - inicio < timeout:
+                try:
+                    with urllib.request.urlopen(url, timeout=1) as respuesta:
+                        if respuesta.status == 200:
+                            return time.perf_counter() - inicio
+                except OSError:
+                    time.sleep(0.02)
+            raise CommandError(f"Gunicorn no respondió en {timeout:.0f} s")
+        finally:
+            proceso.terminate()
+            proceso.wait()
+
+    def _medir_worker(self, repeticiones, timeout):
+        self.stdout.write(self.style.MIGRATE_HEADING("Primera respuesta de Gunicorn (1 worker)"))
+        for preload in (False, True):
+            tiempos = [self._primera_respuesta(preload, timeout) for _ in range(repeticiones)]
+            etiqueta = 'con preload' if preload else 'sin preload'
+            self.stdout.write(f"  {etiqueta:12s} mediana {statistics.median(tiempos) * 1000:8.1f} ms")
+
+    def handle(self, *args, **opciones):
+        self._medir_imports(opciones['repeticiones'], opciones['top'])
+        if opciones['worker']:
+            self._medir_worker(opciones['repeticiones'], opciones['timeout'])
@@ -0,0 +1,63 @@
+"""
+Mide cuánto cuesta abrir la conexión a la base de datos en cada petición.
+
+Compara tres escenarios sobre el alias elegido:
+  - nueva: cerrar y abrir conexión en cada "petición" (CONN_MAX_AGE=0 sin pool)
+  - pool: igual que 'nueva' pero con el backend smartstock.mysql_pool
+  - persistente: reutilizar la conexión abierta (CONN_MAX_AGE > 0)
+
+    python manage.py benchmark_conexiones --iteraciones 200
+"""
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.utils import load_backend
+
+
+class Command(BaseCommand):
+    help = "Costo de conexión por petición: conexión nueva vs pool vs persistente."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alias', default='default')
+        parser.add_argument('--iteraciones', type=int, default=200)
+
+    def _medir(self, conexion, iteraciones, reconectar):
+        tiempos = []
+        for _ in range(iteraciones):
+            inicio = time.perf_counter()
+            with conexion.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+            if reconectar:
+                conexion.close()
+            tiempos.append(time.perf_counter() - inicio)
+        conexion.close()
+        return tiempos
+
+    def _wrapper(self, alias, engine):
+        ajustes = dict(connections.settings[alias], ENGINE=engine)
+        return load_backend(engine).DatabaseWrapper(ajustes, alias)
+
+    def handle(self, *args, **opciones):
+        alias, n = opciones['alias'], opciones['iteraciones']
+        engine = connections.settings[alias]['ENGINE']
+
+        escenarios = [('nueva', self._wrapper(alias, engine), True)]
+        if 'mysql' in engine:
+            escenarios[0] = ('nueva', self._wrapper(alias, 'smartstock.mysql'), True)
+            escenarios.append(('pool', self._wrapper(alias, 'smartstock.mysql_pool'), True))
+        escenarios.append(('persistente', self._wrapper(alias, engine), False))
+
+        resultados = {}
+        for nombre, conexion, reconectar in escenarios:
+            tiempos = self._medir(conexion, n, reconectar)
+            resultados[nombre] = statistics.mean(tiempos) * 1000
+            self.stdout.write(
+                f"{nombre:12s} media {resultados[nombre]:7.3f} ms   "
+                f"p95 {sorted(tiempos)[int(n * 0.95) - 1] * 1000:7.3f} ms"
+            )
+
+        costo = resultados['nueva'] - resultados['persistente']
+        self.stdout.write(f"Costo de abrir conexión por petición: {costo:.3f} ms")
@@ -0,0 +1,93 @@
+"""
+Simula varios escáneres golpeando la API al mismo tiempo y mide el throughput.
+
+Uso típico, en la misma máquina y contra la misma base de datos:
+
+    SMARTSTOCK_SERVIDOR=wsgi gunicorn --config gunicorn.conf.py -b 127.0.0.1:8000
+    python manage.py benchmark_escaner --url http://127.0.0.1:8000 --codigo HER-1
+
+    SMARTSTOCK_SERVIDOR=asgi gunicorn --config gunicorn.conf.py -b 127.0.0.1:8000
+    python manage.py benchmark_escaner --url http://127.0.0.1:8000 --codigo HER-1
+
+y comparar las dos salidas.
+"""
+import itertools
+import json
+import statistics
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Mide peticiones/segundo de /api/verificar/ con N escáneres concurrentes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Servidor a medir")
+        parser.add_argument('--codigo', action='append', required=True, help="Código QR a verificar (repetible)")
+        parser.add_argument('--escaneres', type=int, default=32, help="Clientes concurrentes")
+        parser.add_argument('--peticiones', type=int, default=50, help="Peticiones por cliente")
+        parser.add_argument('--lote', action='store_true', help="Usar /api/verificar/lote/ con todos los códigos")
+
+    def handle(self, *args, **opciones):
+        base = opciones['url'].rstrip('/')
+        codigos = opciones['codigo']
+
+        if opciones['lote']:
+            cuerpo = json.dumps({'codigos': codigos}).encode()
+
+            def peticion():
+                req = urllib.request.Request(
+                    f"{base}/api/verificar/lote/", data=cuerpo,
+                    headers={'Content-Type': 'application/json'}
+                )
+                return urllib.request.urlopen(req, timeout=30)
+        else:
+            # next() sobre itertools.count es atómico: los hilos no repiten ni saltan códigos
+            turnos = itertools.count()
+
+            def peticion():
+                codigo = codigos[next(turnos) % len(codigos)]
+                return urllib.request.urlopen(f"{base}/api/verificar/?codigo={codigo}", timeout=30)
+
+        def escaner(_):
+            latencias, errores = [], 0
+            for _ in range(opciones['peticiones']):
+                inicio = time.perf_counter()
+                try:
+                    with peticion() as respuesta:
+                        respuesta.read()
+                except OSError:
+                    errores += 1
+                    continue
+                latencias.append(time.perf_counter() - inicio)
+            return latencias, errores
+
+        # Calentamiento: que los workers ya tengan conexión a la BD
+        try:
+            peticion().read()
+        except OSError as e:
+            raise CommandError(f"No se pudo contactar {base}: {e}")
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=opciones['escaneres']) as pool:
+            resultados = list(pool.map(escaner, range(opciones['escaneres'])))
+        total = time.perf_counter() - inicio
+
+        latencias = sorted(l for lista, _ in resultados for l in lista)
+        errores = sum(e for _, e in resultados)
+        if not latencias:
+            raise CommandError("Todas las peticiones fallaron.")
+
+        def percentil(p):
+            return latencias[min(len(latencias) - 1, int(len(latencias) * p))] * 1000
+
+        self.stdout.write(f"Escáneres concurrentes: {opciones['escaneres']}")
+        self.stdout.write(f"Peticiones OK: {len(latencias)}  Errores: {errores}")
+        self.stdout.write(f"Throughput: {len(latencias) / total:.1f} req/s")
+        self.stdout.write(
+            f"Latencia ms  p50: {statistics.median(latencias) * 1000:.1f}  "
+            f"p95: {percentil(0.95):.1f}  p99: {percentil(0.99):.1f}"
+        )
@@ -0,0 +1,108 @@
+"""
+Compara el plan y el tiempo de los filtros de fecha de los reportes: el
+antiguo (campo__date__gte/lte, conversión de zona y DATE() por fila) contra
+el rango semiabierto de bodega/filtros.py (campo__gte/__lt sobre el índice).
+
+    python manage.py benchmark_rangos
+    python manage.py benchmark_rangos --sembrar 3000000 --anios 3   # OJO: escribe en la base
+    python manage.py benchmark_rangos --dias 7 --repeticiones 5
+
+--sembrar inserta filas sintéticas en historial de bajas y préstamos
+(repartidas en --anios) usando la primera herramienta, trabajador y usuario
+existentes; conviene correrlo contra una copia de la base. En MySQL el EXPLAIN
+del filtro antiguo muestra type=ALL (tabla completa) y el nuevo type=range
+con key=historial_fecha_idx / prestamo_fecha_idx; en SQLite, SCAN contra
+SEARCH ... USING INDEX.
+"""
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from bodega.filtros import RangoFechas
+from bodega.models import DetallePrestamo, Herramienta, HistorialBaja, Prestamo, Trabajador
+
+LOTE = 20000
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN y tiempos de los filtros de fecha con __date contra el rango semiabierto indexado."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sembrar', type=int, default=0,
+                            help="Filas sintéticas a insertar en cada tabla antes de medir")
+        parser.add_argument('--anios', type=int, default=3, help="Años que abarcan las filas sembradas")
+        parser.add_argument('--dias', type=int, default=7, help="Largo del rango consultado (hasta hoy)")
+        parser.add_argument('--repeticiones', type=int, default=3)
+
+    def _sembrar(self, filas, anios):
+        herramienta = Herramienta.objects.order_by('id').first()
+        trabajador = Trabajador.objects.order_by('id').first()
+        usuario = User.objects.order_by('id').first()
+        if not (herramienta and trabajador and usuario):
+            raise CommandError("Se necesita al menos una herramienta, un trabajador y un usuario para sembrar.")
+
+        # SQL directo: bulk_create pisaría las fechas con auto_now_add
+        tabla_historial = connection.ops.quote_name(HistorialBaja._meta.db_table)
+        tabla_prestamo = connection.ops.quote_name(Prestamo._meta.db_table)
+        ahora = timezone.now()
+        segundos = anios * 365 * 86400
+        rng = random.Random(0)
+        adaptar = connection.ops.adapt_datetimefield_value
+
+        inicio = time.perf_counter()
+        for desde in range(0, filas, LOTE):
+            fechas = [adaptar(ahora - timedelta(seconds=rng.random() * segundos))
+                      for _ in range(min(LOTE, filas - desde))]
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(
+                    f"INSERT INTO {tabla_historial} (herramienta_id, fecha_evento, accion, motivo, usuario_id) "
+                    f"VALUES (%s, %s, %s, %s, %s)",
+                    [(herramienta.id, fecha, 'BAJA', 'Benchmark', usuario.id) for fecha in fechas]
+                )
+                cursor.executemany(
+                    f"INSERT INTO {tabla_prestamo} (fecha_solicitud, trabajador_id, bodeguero_id, observacion) "
+                    f"VALUES (%s, %s, %s, %s)",
+                    [(fecha, trabajador.id, usuario.id, 'Benchmark') for fecha in fechas]
+                )
+        self.stdout.write(f"Sembradas {filas} filas por tabla en {time.perf_counter() - inicio:.1f} s")
+
+    def _medir(self, queryset, repeticiones):
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            total = queryset.count()
+            tiempos.append(time.perf_counter() - inicio)
+        return min(tiempos), total
+
+    def handle(self, *args, **opciones):
+        if opciones['sembrar']:
+            self._sembrar(opciones['sembrar'], opciones['anios'])
+
+        hasta = timezone.localdate()
+        desde = hasta - timedelta(days=opciones['dias'] - 1)
+        rango = RangoFechas(desde, hasta)
+        casos = (
+            ('Reporte de bajas', 'historial_fecha_idx',
+             HistorialBaja.objects.filter(fecha_evento__date__gte=desde, fecha_evento__date__lte=hasta),
+             rango.filtrar(HistorialBaja.objects.all(), 'fecha_evento')),
+            ('Historial de transacciones', 'prestamo_fecha_idx',
+             DetallePrestamo.objects.filter(prestamo__fecha_solicitud__date__gte=desde,
+                                            prestamo__fecha_solicitud__date__lte=hasta),
+             rango.filtrar(DetallePrestamo.objects.all(), 'prestamo__fecha_solicitud')),
+        )
+
+        self.stdout.write(f"Rango: {desde} a {hasta} ({connection.vendor})")
+        for titulo, indice, antiguo, nuevo in casos:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n{titulo}"))
+            for etiqueta, queryset in (('__date (antes)', antiguo), ('rango [inicio, fin)', nuevo)):
+                plan = queryset.explain()
+                segundos, total = self._medir(queryset, opciones['repeticiones'])
+                usa = "usa el índice" if indice in plan else "NO usa el índice"
+                self.stdout.write(f"  {etiqueta:<22} {segundos * 1000:9.1f} ms  {total:>9} filas  {usa}")
+                for linea in plan.splitlines():
+                    self.stdout.write(f"      {linea}")
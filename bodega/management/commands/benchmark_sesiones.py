@@ -0,0 +1,66 @@
+"""
+Mide las consultas SQL y el tiempo que cuesta cada petición autenticada antes
+de llegar a la vista, con distintos perfiles de sesión/autenticación.
+
+    python manage.py benchmark_sesiones --usuario admin
+    python manage.py benchmark_sesiones --usuario bodeguero --url /api/verificar/?codigo=HER-1
+
+Se usa el cliente de pruebas dentro del mismo proceso, contra la base y la
+caché configuradas. La vista por defecto (menú de reportes) no hace consultas
+propias, así que lo medido es el piso por petición.
+"""
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+PERFILES = (
+    ('db + ModelBackend (Django por defecto)',
+     'django.contrib.sessions.backends.db', 'django.contrib.auth.backends.ModelBackend'),
+    ('cached_db + usuarios cacheados',
+     'django.contrib.sessions.backends.cached_db', 'bodega.autenticacion.BackendUsuariosCacheados'),
+    ('signed_cookies + usuarios cacheados',
+     'django.contrib.sessions.backends.signed_cookies', 'bodega.autenticacion.BackendUsuariosCacheados'),
+)
+
+
+class Command(BaseCommand):
+    help = "Consultas y ms por petición autenticada según el motor de sesiones y el backend de autenticación."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', required=True, help="Usuario con el que se inicia sesión")
+        parser.add_argument('--url', help="URL a pedir (por defecto el menú de reportes)")
+        parser.add_argument('--peticiones', type=int, default=200)
+
+    def handle(self, *args, **opciones):
+        try:
+            usuario = User.objects.get(username=opciones['usuario'])
+        except User.DoesNotExist:
+            raise CommandError(f"No existe el usuario {opciones['usuario']}")
+        url = opciones['url'] or reverse('menu_reportes')
+        peticiones = opciones['peticiones']
+
+        for nombre, motor, backend in PERFILES:
+            with override_settings(
+                SESSION_ENGINE=motor, AUTHENTICATION_BACKENDS=[backend], ALLOWED_HOSTS=['*'],
+            ):
+                cliente = Client()
+                cliente.force_login(usuario, backend=backend)
+                cliente.get(url)  # Calentamiento: llena cachés
+
+                inicio = time.perf_counter()
+                with CaptureQueriesContext(connection) as consultas:
+                    for _ in range(peticiones):
+                        respuesta = cliente.get(url)
+                total = time.perf_counter() - inicio
+
+            if respuesta.status_code >= 400:
+                raise CommandError(f"{url} respondió {respuesta.status_code} con {nombre}")
+            self.stdout.write(
+                f"{nombre:<40} {len(consultas) / peticiones:5.2f} consultas/petición  "
+                f"{total / peticiones * 1000:6.2f} ms/petición"
+            )
@@ -0,0 +1,78 @@
+"""
+Descarga las librerías de front-end fijadas en bodega/assets.py y arma los
+paquetes por página en bodega/static/bodega/dist/.
+
+    python manage.py construir_assets --descargar   # vendor + paquetes
+    python manage.py construir_assets               # sólo re-empaquetar
+    python manage.py collectstatic                  # hash + .gz/.br (WhiteNoise)
+
+Los archivos de vendor/ y dist/ se versionan en el repositorio: el servidor
+nunca necesita internet para servirlos.
+"""
+import os
+import urllib.request
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from bodega import assets
+
+
+class Command(BaseCommand):
+    help = "Vendoriza los assets de front-end y construye los paquetes base.css, base.js y escaner.js."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--descargar', action='store_true',
+                            help="Descarga los archivos de vendor que falten")
+        parser.add_argument('--forzar', action='store_true',
+                            help="Con --descargar, vuelve a bajar aunque ya existan (cambio de versión)")
+        parser.add_argument('--timeout', type=float, default=30.0)
+
+    def handle(self, *args, **opciones):
+        static = os.path.join(apps.get_app_config('bodega').path, 'static')
+
+        if opciones['descargar']:
+            self._descargar(static, opciones['forzar'], opciones['timeout'])
+
+        def leer(ruta):
+            with open(os.path.join(static, ruta), encoding='utf-8') as f:
+                return f.read()
+
+        # Se arma lo que se pueda (p. ej. los paquetes sólo con archivos propios)
+        # y al final se informa lo que faltó, con código de salida de error
+        os.makedirs(os.path.join(static, assets.DIST_DIR), exist_ok=True)
+        faltantes = []
+        for nombre, rutas in assets.PAQUETES.items():
+            sin_fuente = [ruta for ruta in rutas if not os.path.exists(os.path.join(static, ruta))]
+            if sin_fuente:
+                faltantes += sin_fuente
+                self.stdout.write(self.style.WARNING(f"{assets.DIST_DIR}/{nombre}: sin construir"))
+                continue
+            contenido = assets.construir(nombre, leer)
+            destino = os.path.join(static, assets.DIST_DIR, nombre)
+            with open(destino, 'w', encoding='utf-8') as f:
+                f.write(contenido)
+            self.stdout.write(f"{assets.DIST_DIR}/{nombre}: {len(contenido.encode()) / 1024:.1f} KB")
+
+        if faltantes:
+            raise CommandError(
+                "Faltan archivos (ejecute con --descargar): " + ", ".join(faltantes)
+            )
+        self.stdout.write(self.style.SUCCESS("Paquetes listos. Recuerde ejecutar collectstatic."))
+
+    def _descargar(self, static, forzar, timeout):
+        for archivo, url in assets.VENDOR.items():
+            destino = os.path.join(static, assets.VENDOR_DIR, archivo)
+            if os.path.exists(destino) and not forzar:
+                continue
+            try:
+                with urllib.request.urlopen(url, timeout=timeout) as respuesta:
+                    datos = respuesta.read()
+            except OSError as e:
+                raise CommandError(f"No se pudo descargar {url}: {e}")
+            if archivo.endswith(('.css', '.js')):
+                datos = assets.quitar_source_maps(datos.decode('utf-8')).encode('utf-8')
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            with open(destino, 'wb') as f:
+                f.write(datos)
+            self.stdout.write(f"{assets.VENDOR_DIR}/{archivo}: {len(datos) / 1024:.1f} KB")
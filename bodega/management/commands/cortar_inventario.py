@@ -0,0 +1,49 @@
+"""
+Guarda un corte (estado completo comprimido) de la bitácora de movimientos.
+
+Pensado para correr una vez al día (cron / Railway scheduled job); así una
+consulta de stock histórico repite a lo más un día de movimientos:
+
+    python manage.py cortar_inventario
+    python manage.py cortar_inventario --conciliar            # muestra diferencias con la tabla
+    python manage.py cortar_inventario --conciliar --ajustar  # y las registra como AJUSTE
+
+La conciliación detecta cambios hechos sin pasar por los servicios ni por
+save() (SQL directo, .update() en el shell, bulk_create).
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from bodega.movimientos import conciliar, tomar_corte
+
+
+class Command(BaseCommand):
+    help = "Guarda un corte de inventario para acelerar las consultas de stock histórico."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conciliar', action='store_true',
+                            help="Compara la bitácora con el estado actual de las herramientas")
+        parser.add_argument('--ajustar', action='store_true',
+                            help="Con --conciliar, registra un movimiento AJUSTE por cada diferencia")
+
+    def handle(self, *args, **opciones):
+        if opciones['conciliar']:
+            with transaction.atomic():
+                diferencias = conciliar(ajustar=opciones['ajustar'])
+            for herramienta, registrado in diferencias[:50]:
+                self.stdout.write(
+                    f"  {herramienta.codigo_qr}: bitácora {registrado or 'sin registro'} / "
+                    f"actual {(herramienta.estado, herramienta.activo, herramienta.ubicacion_id)}"
+                )
+            accion = "ajustadas" if opciones['ajustar'] else "encontradas"
+            estilo = self.style.WARNING if diferencias and not opciones['ajustar'] else self.style.SUCCESS
+            self.stdout.write(estilo(f"{len(diferencias)} diferencias {accion}."))
+
+        inicio = time.perf_counter()
+        corte = tomar_corte()
+        self.stdout.write(self.style.SUCCESS(
+            f"Corte al {corte.fecha:%d/%m/%Y %H:%M}: {corte.herramientas} herramientas, "
+            f"{len(corte.datos) / 1024:.1f} KB ({time.perf_counter() - inicio:.2f} s)."
+        ))
@@ -0,0 +1,81 @@
+"""
+Detecta los ítems prestados con el plazo vencido y emite un resumen.
+
+Pensado para correr cada pocos minutos (cron / Railway scheduled job):
+
+    python manage.py detectar_atrasos
+    python manage.py detectar_atrasos --correo   # envía el resumen a ADMINS
+
+El costo no depende del tamaño del historial: los vencidos salen de un solo
+rango sobre el índice (devuelto, fecha_limite) y el resumen sólo recorre las
+alertas abiertas.
+"""
+from collections import defaultdict
+
+from django.core.mail import mail_admins
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from bodega.models import AlertaAtraso, DetallePrestamo
+
+
+class Command(BaseCommand):
+    help = "Registra alertas de préstamos atrasados y muestra el resumen."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--correo', action='store_true',
+                            help="Envía el resumen a ADMINS si hay atrasos nuevos")
+
+    def _resumen(self, ahora, nuevas, resueltas):
+        abiertas = AlertaAtraso.objects.filter(resuelta=False).select_related(
+            'detalle__herramienta__ubicacion', 'detalle__prestamo__trabajador'
+        ).order_by('fecha_limite')
+
+        por_trabajador = defaultdict(list)
+        for alerta in abiertas:
+            por_trabajador[alerta.detalle.prestamo.trabajador].append(alerta)
+
+        total = sum(len(alertas) for alertas in por_trabajador.values())
+        lineas = [
+            f"Atrasos al {timezone.localtime(ahora):%d/%m/%Y %H:%M}: {total} ítems "
+            f"({nuevas} nuevos, {resueltas} resueltos desde la última revisión)",
+        ]
+        for trabajador, alertas in sorted(por_trabajador.items(), key=lambda par: -len(par[1])):
+            lineas.append("")
+            lineas.append(f"{trabajador} ({trabajador.rut}) - {len(alertas)} atrasadas")
+            for alerta in alertas:
+                herramienta = alerta.detalle.herramienta
+                horas = (ahora - alerta.fecha_limite).total_seconds() / 3600
+                lineas.append(
+                    f"  {herramienta.codigo_qr:12s} {herramienta.nombre} "
+                    f"[{herramienta.ubicacion.nombre}] vencida hace {horas:.1f} h"
+                )
+        return "\n".join(lineas)
+
+    def handle(self, *args, **opciones):
+        ahora = timezone.now()
+
+        with transaction.atomic():
+            # Una herramienta dada de baja en préstamo sigue con devuelto=False
+            # hasta que se reactive: no es un atraso que alguien deba perseguir
+            vencidos = DetallePrestamo.objects.filter(
+                devuelto=False, fecha_limite__lt=ahora, alerta_atraso__isnull=True,
+                herramienta__activo=True
+            ).values_list('id', 'fecha_limite')
+            creadas = AlertaAtraso.objects.bulk_create(
+                [AlertaAtraso(detalle_id=detalle_id, fecha_limite=limite) for detalle_id, limite in vencidos],
+                ignore_conflicts=True  # Otra ejecución concurrente pudo crearla
+            )
+            # Las devoluciones cierran sus alertas en la siguiente pasada (las
+            # bajas ya lo hacen en dar_de_baja; esto cubre las hechas a mano)
+            resueltas = AlertaAtraso.objects.filter(resuelta=False).filter(
+                Q(detalle__devuelto=True) | Q(detalle__herramienta__activo=False)
+            ).update(resuelta=True, fecha_resolucion=ahora)
+
+        resumen = self._resumen(ahora, len(creadas), resueltas)
+        self.stdout.write(resumen)
+
+        if opciones['correo'] and creadas:
+            mail_admins(f"SmartStockQR: {len(creadas)} préstamos atrasados", resumen)
@@ -0,0 +1,40 @@
+"""
+Borra del storage por contenido los archivos que ya nadie usa.
+
+Pensado para correr una vez al día (cron / Railway scheduled job):
+
+    python manage.py limpiar_almacen
+    python manage.py limpiar_almacen --recontar    # rehace los contadores desde la base
+    python manage.py limpiar_almacen --simular     # sólo informa
+
+Un archivo se borra cuando su contador lleva más de --horas en cero y ningún
+campo de archivo lo nombra; si alguno lo nombra se corrige el contador.
+"""
+from django.core.files.storage import storages
+from django.core.management.base import BaseCommand, CommandError
+
+from bodega.almacen import AlmacenContenido, limpiar, recontar
+
+
+class Command(BaseCommand):
+    help = "Borra los archivos del storage por contenido sin referencias."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horas', type=int, default=24,
+                            help="Tiempo mínimo sin referencias antes de borrar")
+        parser.add_argument('--recontar', action='store_true',
+                            help="Rehace los contadores desde los campos de archivo antes de limpiar")
+        parser.add_argument('--simular', action='store_true',
+                            help="Muestra lo que se borraría sin borrar nada")
+
+    def handle(self, *args, **opciones):
+        almacen = storages['default']
+        if not isinstance(almacen, AlmacenContenido):
+            raise CommandError("STORAGES['default'] no es bodega.almacen.AlmacenContenido.")
+        if opciones['recontar']:
+            self.stdout.write(f"{recontar()} contadores corregidos.")
+        borrados, liberados = limpiar(almacen, opciones['horas'], opciones['simular'])
+        accion = "se borrarían" if opciones['simular'] else "borrados"
+        self.stdout.write(self.style.SUCCESS(
+            f"{borrados} archivos {accion} ({liberados / 1024 / 1024:.1f} MB)."
+        ))
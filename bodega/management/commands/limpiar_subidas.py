@@ -0,0 +1,24 @@
+"""
+Borra las subidas de fotos abandonadas: las que no se terminaron (se cortó la
+señal y nadie volvió) y las terminadas que nunca se usaron en una devolución.
+
+Pensado para correr una vez al día (cron / Railway scheduled job):
+
+    python manage.py limpiar_subidas
+    python manage.py limpiar_subidas --horas 6
+"""
+from django.core.management.base import BaseCommand
+
+from bodega.subidas import limpiar
+
+
+class Command(BaseCommand):
+    help = "Borra las subidas de fotos sin terminar o sin usar."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horas', type=int, default=24,
+                            help="Antigüedad mínima de las subidas que se borran")
+
+    def handle(self, *args, **opciones):
+        borradas = limpiar(opciones['horas'])
+        self.stdout.write(self.style.SUCCESS(f"{borradas} subidas abandonadas borradas."))
@@ -0,0 +1,68 @@
+"""
+Pasa los archivos existentes (carpetas planas codigos_qr/, evidencias/) al
+storage por contenido:
+
+    python manage.py migrar_almacen
+    python manage.py migrar_almacen --origen /data/media --conservar
+
+Cada archivo se lee desde --origen (por defecto MEDIA_ROOT), se guarda por su
+hash y la fila se actualiza con .update() (sin señales ni save()). Los nombres
+repetidos se copian una sola vez. Se puede volver a correr: las filas que ya
+apuntan a 'contenido/' se saltan. Al final se recuentan las referencias.
+"""
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, storages
+from django.core.management.base import BaseCommand, CommandError
+
+from bodega.almacen import PREFIJO, AlmacenContenido, anchos_miniaturas, campos_de_archivo, recontar
+from bodega.miniaturas import _nombre_miniatura
+
+
+class Command(BaseCommand):
+    help = "Copia los archivos de media existentes al storage por contenido."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--origen', help="Carpeta con los archivos actuales (por defecto MEDIA_ROOT)")
+        parser.add_argument('--conservar', action='store_true',
+                            help="No borra los archivos originales después de copiarlos")
+
+    def handle(self, *args, **opciones):
+        almacen = storages['default']
+        if not isinstance(almacen, AlmacenContenido):
+            raise CommandError("STORAGES['default'] no es bodega.almacen.AlmacenContenido.")
+        origen = FileSystemStorage(location=opciones['origen'] or settings.MEDIA_ROOT)
+
+        nuevos = {}
+        faltantes = set()
+        for modelo, campo in campos_de_archivo():
+            pendientes = modelo._default_manager.exclude(**{f'{campo}__startswith': PREFIJO}).exclude(
+                **{f'{campo}__isnull': True}
+            ).exclude(**{campo: ''}).values_list('pk', campo)
+            filas = 0
+            for pk, nombre in pendientes.iterator(chunk_size=500):
+                if nombre not in nuevos:
+                    try:
+                        with origen.open(nombre, 'rb') as archivo:
+                            nuevos[nombre] = almacen.save(nombre, archivo)
+                    except FileNotFoundError:
+                        faltantes.add(nombre)
+                        continue
+                modelo._default_manager.filter(pk=pk).update(**{campo: nuevos[nombre]})
+                filas += 1
+            if filas:
+                self.stdout.write(f"  {modelo._meta.label}.{campo}: {filas} filas")
+
+        if not opciones['conservar']:
+            anchos = anchos_miniaturas(origen)
+            for nombre in nuevos:
+                origen.delete(nombre)
+                # Las miniaturas se vuelven a generar con el nombre nuevo
+                for ancho in anchos:
+                    origen.delete(_nombre_miniatura(nombre, ancho))
+
+        for nombre in sorted(faltantes)[:20]:
+            self.stdout.write(self.style.WARNING(f"  No existe: {nombre}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(nuevos)} archivos migrados, {len(faltantes)} faltantes, "
+            f"{recontar()} contadores ajustados."
+        ))
@@ -0,0 +1,111 @@
+"""
+Ejecuta los reportes encolados (TrabajoReporte) en un pool de procesos.
+
+Corre como servicio aparte del web (otro servicio de Railway, systemd...),
+contra la misma base; no necesita broker:
+
+    python manage.py procesar_trabajos
+    python manage.py procesar_trabajos --procesos 4
+    python manage.py procesar_trabajos --una-vez     # vacía la cola y termina (cron)
+
+Sólo se toma un trabajo cuando hay un proceso libre, así los demás quedan en
+la cola para otros procesar_trabajos. Cada ciclo también reencola los
+trabajos colgados y borra los terminados hace más de TRABAJOS_RETENCION_DIAS.
+"""
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from bodega import trabajos
+from bodega.models import TrabajoReporte
+
+# Cada cuántos segundos se revisan los colgados y los vencidos
+INTERVALO_MANTENCION = 60
+
+
+class Command(BaseCommand):
+    help = "Genera los reportes encolados en segundo plano."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, default=settings.TRABAJOS_PROCESOS)
+        parser.add_argument('--espera', type=float, default=2, help="Segundos entre revisiones de la cola vacía")
+        parser.add_argument('--una-vez', action='store_true', help="Termina cuando la cola queda vacía")
+
+    def _mantencion(self):
+        reencolados, fallidos = trabajos.reencolar_colgados()
+        borrados = trabajos.limpiar(settings.TRABAJOS_RETENCION_DIAS)
+        if reencolados or fallidos or borrados:
+            self.stdout.write(f"{reencolados} reencolados, {fallidos} fallidos por falta de latido, {borrados} borrados")
+
+    def _terminado(self, trabajo_id, futuro):
+        """Informa el resultado. Devuelve False si el proceso murió (el pool quedó roto)."""
+        try:
+            estado, mensaje = futuro.result()
+        except BrokenProcessPool:
+            # Sigue EN_CURSO: reencolar_colgados lo reintenta hasta TRABAJOS_INTENTOS veces
+            self.stdout.write(self.style.ERROR(f"{trabajo_id}: el proceso terminó abruptamente"))
+            return False
+        except Exception as error:  # Falló antes de poder marcarlo (proceso, base)
+            estado, mensaje = 'ERROR', f"{type(error).__name__}: {error}"[:255]
+            TrabajoReporte.objects.filter(id=trabajo_id).update(
+                estado='ERROR', mensaje=mensaje, terminado=timezone.now()
+            )
+        estilo = self.style.SUCCESS if estado == 'LISTO' else self.style.ERROR
+        self.stdout.write(estilo(f"{trabajo_id} {estado}: {mensaje}"))
+        return True
+
+    def _pool(self, procesos):
+        # 'spawn': cada proceso arranca limpio, sin heredar conexiones abiertas del padre.
+        # El inicializador es django.setup tal cual: uno definido en este módulo
+        # importaría los modelos antes de que las apps estén cargadas.
+        return ProcessPoolExecutor(
+            max_workers=procesos, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup
+        )
+
+    def handle(self, *args, **opciones):
+        procesos = opciones['procesos']
+        self.stdout.write(f"Procesando trabajos con {procesos} procesos (Ctrl+C para detener)")
+        connections.close_all()
+        pool = self._pool(procesos)
+        en_curso = {}
+        ultima_mantencion = 0
+        try:
+            while True:
+                if time.monotonic() - ultima_mantencion > INTERVALO_MANTENCION:
+                    self._mantencion()
+                    ultima_mantencion = time.monotonic()
+
+                while len(en_curso) < procesos:
+                    trabajo_id = trabajos.tomar()
+                    if trabajo_id is None:
+                        break
+                    self.stdout.write(f"{trabajo_id} tomado")
+                    en_curso[pool.submit(trabajos.ejecutar, trabajo_id)] = trabajo_id
+
+                if not en_curso:
+                    if opciones['una_vez']:
+                        break
+                    time.sleep(opciones['espera'])
+                    continue
+
+                listos, _ = wait(en_curso, timeout=opciones['espera'], return_when=FIRST_COMPLETED)
+                sano = all([self._terminado(en_curso.pop(futuro), futuro) for futuro in listos])
+                if not sano:
+                    # Un proceso roto arrastra a todo el pool: se descartan y se arranca otro
+                    for futuro in list(en_curso):
+                        self._terminado(en_curso.pop(futuro), futuro)
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = self._pool(procesos)
+        except KeyboardInterrupt:
+            self.stdout.write("Deteniendo: se esperan los trabajos en curso...")
+            for futuro in list(en_curso):
+                self._terminado(en_curso.pop(futuro), futuro)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,26 @@
+"""
+Reconstruye los saldos por trabajador desde el historial de préstamos.
+
+Los saldos se mantienen solos en cada préstamo y devolución; este comando
+sirve para repararlos si se editaron préstamos a mano (admin, SQL directo).
+
+    python manage.py recalcular_saldos
+    python manage.py recalcular_saldos --trabajador 12 --trabajador 40
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from bodega.saldos import recalcular
+
+
+class Command(BaseCommand):
+    help = "Recalcula SaldoTrabajador desde Prestamo/DetallePrestamo."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trabajador', type=int, action='append', dest='trabajadores',
+                            help="Id de trabajador (repetible). Por defecto, todos.")
+
+    def handle(self, *args, **opciones):
+        with transaction.atomic():
+            total = recalcular(opciones['trabajadores'])
+        self.stdout.write(self.style.SUCCESS(f"{total} saldos recalculados."))
@@ -0,0 +1,55 @@
+"""
+Sincroniza los trabajadores con la nómina diaria de RR.HH. (CSV con las
+columnas rut, nombre, apellido y cargo; ver bodega/nomina.py):
+
+    python manage.py sincronizar_trabajadores nomina.csv
+    python manage.py sincronizar_trabajadores nomina.csv --simular          # sólo informa
+    python manage.py sincronizar_trabajadores nomina.csv --sin-desactivar   # nómina parcial
+
+Los que no aparecen en la nómina se desactivan. Si eso afecta a más de la
+mitad de los activos se detiene, salvo con --forzar.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bodega.nomina import NominaInvalida, sincronizar
+
+# Errores de fila que se listan (el total va en el resumen)
+MAXIMO_ERRORES = 20
+
+
+class Command(BaseCommand):
+    help = "Crea, actualiza y desactiva trabajadores según la nómina de RR.HH."
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help="CSV de la nómina")
+        parser.add_argument('--codificacion', help="Por defecto se prueba utf-8 y luego cp1252")
+        parser.add_argument('--sin-desactivar', action='store_true',
+                            help="No desactiva a los que faltan (nómina parcial)")
+        parser.add_argument('--simular', action='store_true', help="Muestra los cambios sin aplicarlos")
+        parser.add_argument('--forzar', action='store_true',
+                            help="Aplica aunque desactive a más de la mitad de los activos")
+
+    def handle(self, *args, **opciones):
+        inicio = time.perf_counter()
+        try:
+            with open(opciones['archivo'], 'rb') as binario:
+                plan = sincronizar(
+                    binario, desactivar=not opciones['sin_desactivar'], simular=opciones['simular'],
+                    forzar=opciones['forzar'], codificacion=opciones['codificacion'],
+                )
+        except (OSError, NominaInvalida) as error:
+            raise CommandError(str(error))
+
+        for error in plan.errores[:MAXIMO_ERRORES]:
+            self.stderr.write(error)
+        if len(plan.errores) > MAXIMO_ERRORES:
+            self.stderr.write(f"... y {len(plan.errores) - MAXIMO_ERRORES} errores más.")
+        if opciones['simular'] and plan.excesivo():
+            self.stderr.write(self.style.WARNING("Sin --forzar esta nómina no se aplicaría: desactiva demasiados."))
+
+        accion = "Simulación" if opciones['simular'] else "Sincronizado"
+        self.stdout.write(self.style.SUCCESS(
+            f"{accion}: {plan.resumen()} ({time.perf_counter() - inicio:.1f} s)."
+        ))
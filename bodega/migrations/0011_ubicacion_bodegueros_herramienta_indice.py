@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-19 11:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bodega', '0010_historialbaja'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ubicacion',
+            name='bodegueros',
+            field=models.ManyToManyField(blank=True, related_name='ubicaciones', to=settings.AUTH_USER_MODEL, verbose_name='Bodegueros asignados'),
+        ),
+        migrations.AddIndex(
+            model_name='herramienta',
+            index=models.Index(fields=['ubicacion', 'activo', 'estado'], name='herramienta_ubic_estado_idx'),
+        ),
+    ]
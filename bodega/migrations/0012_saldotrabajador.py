@@ -0,0 +1,60 @@
+# Generated by Django 6.0.1 on 2026-10-19 11:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+
+def calcular_saldos(apps, schema_editor):
+    """Llena los saldos con el historial existente (mismo cálculo que saldos.recalcular)."""
+    Prestamo = apps.get_model('bodega', 'Prestamo')
+    DetallePrestamo = apps.get_model('bodega', 'DetallePrestamo')
+    SaldoTrabajador = apps.get_model('bodega', 'SaldoTrabajador')
+
+    saldos = {}
+    for fila in Prestamo.objects.values('trabajador_id').annotate(total=Count('id'), ultimo=Max('fecha_solicitud')):
+        saldos[fila['trabajador_id']] = SaldoTrabajador(
+            trabajador_id=fila['trabajador_id'],
+            prestamos_totales=fila['total'],
+            ultimo_prestamo=fila['ultimo'],
+        )
+    for fila in DetallePrestamo.objects.values('prestamo__trabajador_id').annotate(
+        total=Count('id'), abiertos=Count('id', filter=Q(devuelto=False))
+    ):
+        saldo = saldos[fila['prestamo__trabajador_id']]
+        saldo.herramientas_prestadas = fila['total']
+        saldo.herramientas_en_poder = fila['abiertos']
+        saldo.devoluciones = fila['total'] - fila['abiertos']
+    for trabajador_id, solicitud, devolucion in DetallePrestamo.objects.filter(
+        devuelto=True, fecha_devolucion__isnull=False
+    ).values_list('prestamo__trabajador_id', 'prestamo__fecha_solicitud', 'fecha_devolucion').iterator():
+        saldos[trabajador_id].segundos_en_prestamo += max(int((devolucion - solicitud).total_seconds()), 0)
+
+    SaldoTrabajador.objects.bulk_create(saldos.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bodega', '0011_ubicacion_bodegueros_herramienta_indice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaldoTrabajador',
+            fields=[
+                ('trabajador', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='saldo', serialize=False, to='bodega.trabajador')),
+                ('herramientas_en_poder', models.PositiveIntegerField(default=0)),
+                ('prestamos_totales', models.PositiveIntegerField(default=0)),
+                ('herramientas_prestadas', models.PositiveIntegerField(default=0)),
+                ('devoluciones', models.PositiveIntegerField(default=0)),
+                ('segundos_en_prestamo', models.BigIntegerField(default=0)),
+                ('ultimo_prestamo', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Saldo de Trabajador',
+                'verbose_name_plural': 'Saldos de Trabajadores',
+            },
+        ),
+        migrations.RunPython(calcular_saldos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:01
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def asignar_plazos(apps, schema_editor):
+    """Fecha límite para los ítems que ya estaban prestados al migrar."""
+    DetallePrestamo = apps.get_model('bodega', 'DetallePrestamo')
+    abiertos = list(DetallePrestamo.objects.filter(devuelto=False).select_related('prestamo', 'herramienta__categoria'))
+    for detalle in abiertos:
+        horas = detalle.herramienta.categoria.horas_prestamo or settings.PRESTAMO_HORAS_DEFECTO
+        detalle.fecha_limite = detalle.prestamo.fecha_solicitud + timedelta(hours=horas)
+    DetallePrestamo.objects.bulk_update(abiertos, ['fecha_limite'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bodega', '0012_saldotrabajador'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertaAtraso',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_limite', models.DateTimeField()),
+                ('fecha_deteccion', models.DateTimeField(auto_now_add=True)),
+                ('resuelta', models.BooleanField(db_index=True, default=False)),
+                ('fecha_resolucion', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Alerta de Atraso',
+                'verbose_name_plural': 'Alertas de Atraso',
+            },
+        ),
+        migrations.AddField(
+            model_name='categoria',
+            name='horas_prestamo',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Plazo de préstamo (horas)'),
+        ),
+        migrations.AddField(
+            model_name='detalleprestamo',
+            name='fecha_limite',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='detalleprestamo',
+            index=models.Index(fields=['devuelto', 'fecha_limite'], name='detalle_atraso_idx'),
+        ),
+        migrations.AddField(
+            model_name='alertaatraso',
+            name='detalle',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='alerta_atraso', to='bodega.detalleprestamo'),
+        ),
+        migrations.RunPython(asignar_plazos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:06
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from bisect import bisect_right
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def reconstruir_mantenciones(apps, schema_editor):
+    """
+    Historial de taller a partir de las devoluciones con falla. Cada una abre
+    una mantención que se cierra con el siguiente préstamo de la herramienta
+    (la fecha de liberación no se guardaba). Queda abierta si la herramienta
+    sigue EN_MANTENCION; si se liberó y nunca volvió a prestarse no hay fecha
+    de cierre confiable y no se registra.
+    """
+    DetallePrestamo = apps.get_model('bodega', 'DetallePrestamo')
+    Herramienta = apps.get_model('bodega', 'Herramienta')
+    Mantencion = apps.get_model('bodega', 'Mantencion')
+
+    inicios = defaultdict(list)
+    for herramienta_id, solicitud in DetallePrestamo.objects.order_by(
+        'herramienta_id', 'prestamo__fecha_solicitud'
+    ).values_list('herramienta_id', 'prestamo__fecha_solicitud').iterator():
+        inicios[herramienta_id].append(solicitud)
+
+    en_taller = set(Herramienta.objects.filter(estado='EN_MANTENCION', activo=True).values_list('id', flat=True))
+    mantenciones = []
+    abiertas = set()
+    for detalle_id, herramienta_id, devolucion, observacion in DetallePrestamo.objects.filter(
+        devuelto=True, estado_devolucion='EN_MANTENCION', fecha_devolucion__isnull=False
+    ).order_by('herramienta_id', 'fecha_devolucion').values_list(
+        'id', 'herramienta_id', 'fecha_devolucion', 'observacion_falla'
+    ).iterator():
+        prestamos = inicios[herramienta_id]
+        siguiente = bisect_right(prestamos, devolucion)
+        if siguiente < len(prestamos):
+            fin = prestamos[siguiente]
+        elif herramienta_id in en_taller and herramienta_id not in abiertas:
+            fin = None
+            abiertas.add(herramienta_id)
+        else:
+            continue
+        mantenciones.append(Mantencion(
+            herramienta_id=herramienta_id, detalle_id=detalle_id,
+            fecha_inicio=devolucion, fecha_fin=fin, observacion=observacion
+        ))
+
+    # Herramientas en el taller sin devolución con falla (cambio manual de estado)
+    mantenciones.extend(
+        Mantencion(herramienta_id=herramienta_id, observacion="Abierta al migrar (sin devolución registrada)")
+        for herramienta_id in en_taller - abiertas
+    )
+    Mantencion.objects.bulk_create(mantenciones, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bodega', '0013_plazos_y_alertas_atraso'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Mantencion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_inicio', models.DateTimeField(default=django.utils.timezone.now)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('observacion', models.TextField(blank=True, null=True)),
+                ('detalle', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='mantencion', to='bodega.detalleprestamo')),
+                ('herramienta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mantenciones', to='bodega.herramienta')),
+                ('usuario_cierre', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Mantención',
+                'verbose_name_plural': 'Mantenciones',
+                'indexes': [models.Index(fields=['herramienta', 'fecha_fin'], name='mantencion_abierta_idx'), models.Index(fields=['fecha_fin'], name='mantencion_cierre_idx')],
+            },
+        ),
+        migrations.RunPython(reconstruir_mantenciones, migrations.RunPython.noop),
+    ]
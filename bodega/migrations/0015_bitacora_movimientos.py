@@ -0,0 +1,129 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:18
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from collections import defaultdict
+
+from django.db import migrations, models
+
+# Estado de baja según el motivo registrado en HistorialBaja (servicios.BAJA_POR_ESTADO)
+BAJA_POR_MOTIVO = {
+    "Daño Irreparable": 'BAJA_POR_DANO',
+    "Pérdida en Obra": 'BAJA_POR_PERDIDA',
+}
+
+
+def reconstruir_bitacora(apps, schema_editor):
+    """
+    Bitácora inicial a partir de préstamos, devoluciones, mantenciones y
+    bajas. Cada herramienta parte DISPONIBLE y activa en su primer evento
+    (al migrar si no tiene ninguno) y en su bodega actual (los traslados no
+    se guardaban). Si lo reconstruido no calza con el estado actual se cierra
+    con un AJUSTE, así la bitácora siempre termina en la tabla real.
+    """
+    Herramienta = apps.get_model('bodega', 'Herramienta')
+    DetallePrestamo = apps.get_model('bodega', 'DetallePrestamo')
+    Mantencion = apps.get_model('bodega', 'Mantencion')
+    HistorialBaja = apps.get_model('bodega', 'HistorialBaja')
+    MovimientoHerramienta = apps.get_model('bodega', 'MovimientoHerramienta')
+
+    # herramienta_id -> [(fecha, orden, origen, estado, activo o None = sin cambio, usuario_id)]
+    # 'orden' desempata eventos con la misma fecha: liberación, préstamo, devolución, baja, reactivación
+    eventos = defaultdict(list)
+    for herramienta_id, solicitud, bodeguero_id, devuelto, devolucion, estado in DetallePrestamo.objects.values_list(
+        'herramienta_id', 'prestamo__fecha_solicitud', 'prestamo__bodeguero_id',
+        'devuelto', 'fecha_devolucion', 'estado_devolucion'
+    ).iterator():
+        eventos[herramienta_id].append((solicitud, 1, 'PRESTAMO', 'EN_USO', None, bodeguero_id))
+        if devuelto and devolucion:
+            eventos[herramienta_id].append((devolucion, 2, 'DEVOLUCION', estado or 'DISPONIBLE', None, None))
+    for herramienta_id, fin, usuario_id in Mantencion.objects.filter(fecha_fin__isnull=False).values_list(
+        'herramienta_id', 'fecha_fin', 'usuario_cierre_id'
+    ).iterator():
+        eventos[herramienta_id].append((fin, 0, 'LIBERACION', 'DISPONIBLE', None, usuario_id))
+    for herramienta_id, fecha, accion, motivo, usuario_id in HistorialBaja.objects.values_list(
+        'herramienta_id', 'fecha_evento', 'accion', 'motivo', 'usuario_id'
+    ).iterator():
+        if accion == 'BAJA':
+            eventos[herramienta_id].append((fecha, 3, 'BAJA', BAJA_POR_MOTIVO.get(motivo, 'DE_BAJA'), False, usuario_id))
+        else:
+            eventos[herramienta_id].append((fecha, 4, 'REACTIVACION', 'DISPONIBLE', True, usuario_id))
+
+    ahora = django.utils.timezone.now()
+    lote = []
+    for herramienta_id, estado_actual, activo_actual, ubicacion_id in Herramienta.objects.values_list(
+        'id', 'estado', 'activo', 'ubicacion_id'
+    ).iterator():
+        propios = sorted(eventos.pop(herramienta_id, []), key=lambda e: (e[0], e[1]))
+        actual = ('DISPONIBLE', True)
+
+        def movimiento(fecha, origen, nuevo, anterior, usuario_id=None):
+            return MovimientoHerramienta(
+                herramienta_id=herramienta_id, fecha=fecha, origen=origen,
+                estado_anterior=anterior[0] if anterior else None,
+                activo_anterior=anterior[1] if anterior else None,
+                estado=nuevo[0], activo=nuevo[1], ubicacion_id=ubicacion_id, usuario_id=usuario_id,
+            )
+
+        lote.append(movimiento(propios[0][0] if propios else ahora, 'ALTA', actual, None))
+        for fecha, _, origen, estado, activo, usuario_id in propios:
+            if activo is None and not actual[1]:
+                continue  # Préstamo "zombie" cerrado al reactivar: lo cubre la reactivación
+            nuevo = (estado, actual[1] if activo is None else activo)
+            if nuevo != actual:
+                lote.append(movimiento(fecha, origen, nuevo, actual, usuario_id))
+                actual = nuevo
+        if actual != (estado_actual, activo_actual):
+            lote.append(movimiento(ahora, 'AJUSTE', (estado_actual, activo_actual), actual))
+
+        if len(lote) >= 5000:
+            MovimientoHerramienta.objects.bulk_create(lote)
+            lote = []
+    MovimientoHerramienta.objects.bulk_create(lote)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bodega', '0014_mantenciones'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorteInventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField(unique=True)),
+                ('herramientas', models.PositiveIntegerField(default=0)),
+                ('datos', models.BinaryField()),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Corte de Inventario',
+                'verbose_name_plural': 'Cortes de Inventario',
+            },
+        ),
+        migrations.CreateModel(
+            name='MovimientoHerramienta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('origen', models.CharField(choices=[('ALTA', 'Alta'), ('PRESTAMO', 'Préstamo'), ('DEVOLUCION', 'Devolución'), ('LIBERACION', 'Liberación del Taller'), ('BAJA', 'Baja'), ('REACTIVACION', 'Reactivación'), ('EDICION', 'Edición Manual'), ('AJUSTE', 'Ajuste de Conciliación')], max_length=20)),
+                ('estado_anterior', models.CharField(blank=True, choices=[('DISPONIBLE', 'Disponible'), ('EN_USO', 'En Uso'), ('EN_MANTENCION', 'En Mantención'), ('DE_BAJA', 'De Baja Administrativa'), ('BAJA_POR_DANO', 'Baja por Daño'), ('BAJA_POR_PERDIDA', 'Baja por Pérdida')], max_length=20, null=True)),
+                ('activo_anterior', models.BooleanField(null=True)),
+                ('estado', models.CharField(choices=[('DISPONIBLE', 'Disponible'), ('EN_USO', 'En Uso'), ('EN_MANTENCION', 'En Mantención'), ('DE_BAJA', 'De Baja Administrativa'), ('BAJA_POR_DANO', 'Baja por Daño'), ('BAJA_POR_PERDIDA', 'Baja por Pérdida')], max_length=20)),
+                ('activo', models.BooleanField()),
+                ('herramienta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimientos', to='bodega.herramienta')),
+                ('ubicacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bodega.ubicacion')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Movimiento de Herramienta',
+                'verbose_name_plural': 'Movimientos de Herramientas',
+                'indexes': [models.Index(fields=['fecha', 'id'], name='movimiento_fecha_idx'), models.Index(fields=['herramienta', 'fecha'], name='movimiento_herramienta_idx')],
+            },
+        ),
+        migrations.RunPython(reconstruir_bitacora, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:25
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bodega', '0015_bitacora_movimientos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubidaFoto',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('nombre', models.CharField(max_length=255)),
+                ('tamano', models.PositiveIntegerField()),
+                ('recibido', models.PositiveIntegerField(default=0)),
+                ('archivo', models.ImageField(blank=True, null=True, upload_to='evidencias/')),
+                ('creada', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Subida de Foto',
+                'verbose_name_plural': 'Subidas de Fotos',
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:29
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bodega', '0016_subidafoto'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContenidoArchivo',
+            fields=[
+                ('hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('nombre', models.CharField(max_length=255)),
+                ('tamano', models.PositiveBigIntegerField()),
+                ('referencias', models.IntegerField(default=0)),
+                ('actualizado', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Contenido de Archivo',
+                'verbose_name_plural': 'Contenidos de Archivos',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bodega', '0017_contenidoarchivo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='historialbaja',
+            index=models.Index(fields=['fecha_evento'], name='historial_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(fields=['fecha_solicitud'], name='prestamo_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:36
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bodega', '0018_indices_fechas_reportes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoReporte',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('tipo', models.CharField(choices=[('TRANSACCIONES', 'Historial de Transacciones'), ('BAJAS', 'Bajas y Reactivaciones'), ('ANALITICA', 'Analítica de Uso')], max_length=20)),
+                ('parametros', models.JSONField(default=dict)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_CURSO', 'En Curso'), ('LISTO', 'Listo'), ('ERROR', 'Error')], default='PENDIENTE', max_length=20)),
+                ('progreso', models.PositiveSmallIntegerField(default=0)),
+                ('mensaje', models.CharField(blank=True, max_length=255)),
+                ('archivo', models.FileField(blank=True, null=True, upload_to='reportes/')),
+                ('filas', models.PositiveIntegerField(default=0)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('iniciado', models.DateTimeField(blank=True, null=True)),
+                ('terminado', models.DateTimeField(blank=True, null=True)),
+                ('latido', models.DateTimeField(blank=True, null=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Trabajo de Reporte',
+                'verbose_name_plural': 'Trabajos de Reportes',
+                'indexes': [models.Index(fields=['estado', 'creado'], name='trabajo_cola_idx')],
+            },
+        ),
+    ]
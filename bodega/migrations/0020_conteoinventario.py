@@ -0,0 +1,48 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bodega', '0019_trabajoreporte'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConteoInventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('ABIERTO', 'Abierto'), ('CERRADO', 'Cerrado')], default='ABIERTO', max_length=10)),
+                ('abierto', models.DateTimeField(auto_now_add=True)),
+                ('cerrado', models.DateTimeField(blank=True, null=True)),
+                ('resultado', models.JSONField(blank=True, null=True)),
+                ('ubicacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conteos', to='bodega.ubicacion')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Conteo de Inventario',
+                'verbose_name_plural': 'Conteos de Inventario',
+            },
+        ),
+        migrations.CreateModel(
+            name='LecturaConteo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo', models.CharField(max_length=100)),
+                ('leido', models.DateTimeField(auto_now_add=True)),
+                ('conteo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lecturas', to='bodega.conteoinventario')),
+                ('herramienta', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='bodega.herramienta')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Lectura de Conteo',
+                'verbose_name_plural': 'Lecturas de Conteo',
+                'constraints': [models.UniqueConstraint(fields=('conteo', 'codigo'), name='lectura_conteo_codigo_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def unir_conteos_duplicados(apps, schema_editor):
+    """
+    Sin el índice, dos aperturas simultáneas podían dejar dos conteos ABIERTO
+    en la misma ubicación. Se conserva el más antiguo y recibe las lecturas
+    de los otros (las de códigos que ya tiene se descartan).
+    """
+    ConteoInventario = apps.get_model('bodega', 'ConteoInventario')
+    LecturaConteo = apps.get_model('bodega', 'LecturaConteo')
+
+    conservado = {}
+    for conteo_id, ubicacion_id in ConteoInventario.objects.filter(estado='ABIERTO').order_by(
+        'abierto', 'id'
+    ).values_list('id', 'ubicacion_id'):
+        if ubicacion_id not in conservado:
+            conservado[ubicacion_id] = conteo_id
+            continue
+        destino = conservado[ubicacion_id]
+        # En lista y no como subconsulta: MySQL no deja leer la tabla que se actualiza
+        ya_leidos = list(LecturaConteo.objects.filter(conteo_id=destino).values_list('codigo', flat=True))
+        LecturaConteo.objects.filter(conteo_id=conteo_id).exclude(codigo__in=ya_leidos).update(conteo_id=destino)
+        ConteoInventario.objects.filter(id=conteo_id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bodega', '0020_conteoinventario'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(unir_conteos_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='conteoinventario',
+            constraint=models.UniqueConstraint(models.Case(models.When(estado='ABIERTO', then=models.F('ubicacion')), default=None, output_field=models.BigIntegerField()), name='conteo_abierto_por_ubicacion_uniq'),
+        ),
+    ]
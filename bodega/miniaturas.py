@@ -0,0 +1,53 @@
+"""
+Miniaturas de las fotos de evidencia.
+
+Las fotos que sube el celular pesan varios MB; el admin y las listas sólo
+necesitan una versión chica. La miniatura se genera la primera vez que se
+pide (JPEG, bajo 'miniaturas/<ancho>/') y desde ahí se sirve como archivo
+estático más del storage. Que ya exista se recuerda en la caché para no
+consultar el storage en cada fila.
+"""
+import os
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+MINIATURA_ANCHO = 80
+CALIDAD_JPEG = 80
+
+
+def _nombre_miniatura(nombre, ancho):
+    return f"miniaturas/{ancho}/{os.path.splitext(nombre)[0]}.jpg"
+
+
+def _generar(imagen, destino, ancho):
+    # Import diferido: PIL sólo se carga cuando hay que generar una miniatura
+    from PIL import Image, ImageOps
+
+    with imagen.open('rb') as original:
+        foto = ImageOps.exif_transpose(Image.open(original))
+        foto.thumbnail((ancho, ancho * 4))
+        salida = BytesIO()
+        foto.convert('RGB').save(salida, format='JPEG', quality=CALIDAD_JPEG, optimize=True)
+    default_storage.save(destino, ContentFile(salida.getvalue()))
+
+
+def url_miniatura(imagen, ancho=MINIATURA_ANCHO):
+    """
+    URL de la miniatura de 'imagen' (un FieldFile), generándola si hace falta.
+    Devuelve None si no hay imagen o el original no se puede leer.
+    """
+    if not imagen:
+        return None
+    destino = _nombre_miniatura(imagen.name, ancho)
+    clave = f"miniatura:{destino}"
+    if not cache.get(clave):
+        if not default_storage.exists(destino):
+            try:
+                _generar(imagen, destino, ancho)
+            except (OSError, ValueError):
+                return None
+        cache.set(clave, True, None)
+    return default_storage.url(destino)
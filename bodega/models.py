@@ -1,6 +1,9 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User
-import qrcode
+from datetime import timedelta
+from django.utils import timezone
 from io import BytesIO
 from django.core.files import File
 
@@ -12,6 +15,9 @@ class Categoria(models.Model):
     nombre = models.CharField(max_length=50)
     descripcion = models.CharField(max_length=255, blank=True, null=True)
     activo = models.BooleanField(default=True, verbose_name="Activa") 
+    # Política de préstamo: horas que puede estar fuera una herramienta de esta
+    # categoría. Vacío = PRESTAMO_HORAS_DEFECTO de settings.
+    horas_prestamo = models.PositiveIntegerField(blank=True, null=True, verbose_name="Plazo de préstamo (horas)")
 
     def __str__(self):
         return self.nombre
@@ -24,6 +30,10 @@ class Ubicacion(models.Model):
     descripcion = models.CharField(max_length=255, blank=True, null=True)
     activo = models.BooleanField(default=True, verbose_name="Activa")
 
+    # Bodegueros que operan esta bodega. Un usuario con asignaciones sólo ve y
+    # mueve herramientas de sus ubicaciones; sin asignaciones ve todo.
+    bodegueros = models.ManyToManyField(User, blank=True, related_name='ubicaciones', verbose_name="Bodegueros asignados")
+
     def __str__(self):
         return self.nombre
 
@@ -44,11 +54,45 @@ class Trabajador(models.Model):
     def __str__(self):
         return f"{self.nombre} {self.apellido}"
 
+class SaldoTrabajador(models.Model):
+    """
+    Contadores precalculados de préstamos por trabajador. Se actualizan en
+    cada préstamo y devolución (ver bodega/saldos.py) para que el perfil no
+    tenga que recorrer todo el historial.
+    """
+    class Meta:
+        verbose_name = "Saldo de Trabajador"
+        verbose_name_plural = "Saldos de Trabajadores"
+    trabajador = models.OneToOneField(Trabajador, on_delete=models.CASCADE, primary_key=True, related_name='saldo')
+    herramientas_en_poder = models.PositiveIntegerField(default=0)
+    prestamos_totales = models.PositiveIntegerField(default=0)
+    herramientas_prestadas = models.PositiveIntegerField(default=0)
+    devoluciones = models.PositiveIntegerField(default=0)
+    # Suma de (devolución - solicitud) de los ítems devueltos, para el promedio
+    segundos_en_prestamo = models.BigIntegerField(default=0)
+    ultimo_prestamo = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def duracion_promedio(self):
+        """timedelta promedio de los préstamos ya devueltos (None si no hay)."""
+        if not self.devoluciones:
+            return None
+        return timedelta(seconds=self.segundos_en_prestamo / self.devoluciones)
+
+    def __str__(self):
+        return f"Saldo de {self.trabajador}"
+
 # ==============================================================================
 # 3. INVENTARIO
 # ==============================================================================
 
 class Herramienta(models.Model):
+    class Meta:
+        indexes = [
+            # Todas las pantallas filtran por bodega + activo + estado
+            models.Index(fields=['ubicacion', 'activo', 'estado'], name='herramienta_ubic_estado_idx'),
+        ]
+
     # Definimos estados completos incluyendo las bajas por daño o pérdida
     ESTADOS = (
         ('DISPONIBLE', 'Disponible'),
@@ -77,12 +121,16 @@ class Herramienta(models.Model):
         if not self.pk:
             super().save(*args, **kwargs)
             self.codigo_qr = f"HER-{self.pk}"
+            # Import diferido: qrcode + PIL pesan ~60 ms y sólo se usan al crear
+            import qrcode
             qrcode_img = qrcode.make(self.codigo_qr)
             canvas = BytesIO()
             qrcode_img.save(canvas, format='PNG')
             file_name = f'qr_{self.codigo_qr}.png'
             self.imagen_qr.save(file_name, File(canvas), save=False)
-            super().save(*args, **kwargs)
+            # Sólo actualizamos lo generado (un force_insert de create() no debe repetirse),
+            # en la misma base donde se insertó (objects.using(alias).create())
+            super().save(using=self._state.db, update_fields=['codigo_qr', 'imagen_qr'])
         else:
             super().save(*args, **kwargs)
 
@@ -94,6 +142,12 @@ class Herramienta(models.Model):
 # ==============================================================================
 
 class Prestamo(models.Model):
+    class Meta:
+        indexes = [
+            # Filtros por rango de fechas de los reportes (ver bodega/filtros.py)
+            models.Index(fields=['fecha_solicitud'], name='prestamo_fecha_idx'),
+        ]
+
     fecha_solicitud = models.DateTimeField(auto_now_add=True)
     fecha_devolucion = models.DateTimeField(null=True, blank=True)
     trabajador = models.ForeignKey(Trabajador, on_delete=models.PROTECT)
@@ -104,11 +158,19 @@ class Prestamo(models.Model):
         return f"Prestamo #{self.id} - {self.trabajador}"
 
 class DetallePrestamo(models.Model):
+    class Meta:
+        indexes = [
+            # Detección de atrasos: ítems abiertos con plazo vencido, un solo rango
+            models.Index(fields=['devuelto', 'fecha_limite'], name='detalle_atraso_idx'),
+        ]
+
     prestamo = models.ForeignKey(Prestamo, on_delete=models.CASCADE)
     herramienta = models.ForeignKey(Herramienta, on_delete=models.PROTECT)
     
     devuelto = models.BooleanField(default=False)
     fecha_devolucion = models.DateTimeField(null=True, blank=True)
+    # Hasta cuándo debe devolverse (política de la categoría o plazo del préstamo)
+    fecha_limite = models.DateTimeField(null=True, blank=True)
     
     # Aquí definimos las opciones para que coincidan con tu HTML de devolución
     OPCIONES_ESTADO = (
@@ -130,6 +192,12 @@ class HistorialBaja(models.Model):
     Tabla de auditoría para guardar el historial de bajas y reactivaciones.
     Esto permite trazabilidad aunque la herramienta se reactive.
     """
+    class Meta:
+        indexes = [
+            # Filtros por rango de fechas de los reportes (ver bodega/filtros.py)
+            models.Index(fields=['fecha_evento'], name='historial_fecha_idx'),
+        ]
+
     herramienta = models.ForeignKey(Herramienta, on_delete=models.CASCADE)
     fecha_evento = models.DateTimeField(auto_now_add=True)
     
@@ -145,4 +213,305 @@ class HistorialBaja(models.Model):
     usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True) # Quién lo hizo
 
     def __str__(self):
-        return f"{self.herramienta.nombre} - {self.accion} ({self.fecha_evento})"
\ No newline at end of file
+        return f"{self.herramienta.nombre} - {self.accion} ({self.fecha_evento})"
+
+class AlertaAtraso(models.Model):
+    """
+    Ítem prestado que superó su fecha límite. La crea el comando
+    detectar_atrasos (una por ítem) y se marca resuelta cuando se devuelve o
+    la herramienta se da de baja.
+    """
+    class Meta:
+        verbose_name = "Alerta de Atraso"
+        verbose_name_plural = "Alertas de Atraso"
+    detalle = models.OneToOneField(DetallePrestamo, on_delete=models.CASCADE, related_name='alerta_atraso')
+    fecha_limite = models.DateTimeField()
+    fecha_deteccion = models.DateTimeField(auto_now_add=True)
+    resuelta = models.BooleanField(default=False, db_index=True)
+    fecha_resolucion = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Atraso de {self.detalle}"
+
+# ==============================================================================
+# 5. MANTENCIÓN
+# ==============================================================================
+
+class Mantencion(models.Model):
+    """
+    Paso de una herramienta por el taller. Se abre al devolverla con falla y
+    se cierra al liberarla; el tiempo medio de reparación sale directo de
+    fecha_inicio/fecha_fin sin recorrer el historial de préstamos.
+    """
+    class Meta:
+        verbose_name = "Mantención"
+        verbose_name_plural = "Mantenciones"
+        indexes = [
+            # Mantención abierta de cada herramienta (fecha_fin nula)
+            models.Index(fields=['herramienta', 'fecha_fin'], name='mantencion_abierta_idx'),
+            # Reparaciones terminadas en un período (tiempo medio de reparación)
+            models.Index(fields=['fecha_fin'], name='mantencion_cierre_idx'),
+        ]
+
+    herramienta = models.ForeignKey(Herramienta, on_delete=models.CASCADE, related_name='mantenciones')
+    # Devolución que la originó (vacío si se abrió por otra vía)
+    detalle = models.OneToOneField(DetallePrestamo, on_delete=models.SET_NULL, null=True, blank=True, related_name='mantencion')
+    fecha_inicio = models.DateTimeField(default=timezone.now)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+    observacion = models.TextField(blank=True, null=True)
+    usuario_cierre = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+
+    @property
+    def duracion(self):
+        return (self.fecha_fin or timezone.now()) - self.fecha_inicio
+
+    def __str__(self):
+        return f"Mantención de {self.herramienta} ({self.fecha_inicio:%d/%m/%Y})"
+
+# ==============================================================================
+# 6. BITÁCORA DE MOVIMIENTOS
+# ==============================================================================
+
+class MovimientoQuerySet(models.QuerySet):
+    """La bitácora sólo crece: ni UPDATE ni DELETE masivos."""
+
+    def update(self, **kwargs):
+        raise TypeError("La bitácora de movimientos es de sólo inserción.")
+
+    def delete(self):
+        raise TypeError("La bitácora de movimientos es de sólo inserción.")
+
+
+class MovimientoHerramienta(models.Model):
+    """
+    Cada cambio de estado, activo o ubicación de una herramienta, escrito en la
+    misma transacción que el cambio (ver bodega/movimientos.py). Junto con los
+    cortes de CorteInventario permite saber qué había en cada bodega en
+    cualquier fecha.
+    """
+    class Meta:
+        verbose_name = "Movimiento de Herramienta"
+        verbose_name_plural = "Movimientos de Herramientas"
+        indexes = [
+            # Repetición desde un corte: movimientos en un rango de fechas
+            models.Index(fields=['fecha', 'id'], name='movimiento_fecha_idx'),
+            # Historia de una herramienta
+            models.Index(fields=['herramienta', 'fecha'], name='movimiento_herramienta_idx'),
+        ]
+
+    ORIGENES = (
+        ('ALTA', 'Alta'),
+        ('PRESTAMO', 'Préstamo'),
+        ('DEVOLUCION', 'Devolución'),
+        ('LIBERACION', 'Liberación del Taller'),
+        ('BAJA', 'Baja'),
+        ('REACTIVACION', 'Reactivación'),
+        ('EDICION', 'Edición Manual'),
+        ('AJUSTE', 'Ajuste de Conciliación'),
+    )
+
+    herramienta = models.ForeignKey(Herramienta, on_delete=models.CASCADE, related_name='movimientos')
+    fecha = models.DateTimeField(default=timezone.now)
+    origen = models.CharField(max_length=20, choices=ORIGENES)
+    # Estado anterior vacío en el alta
+    estado_anterior = models.CharField(max_length=20, choices=Herramienta.ESTADOS, blank=True, null=True)
+    activo_anterior = models.BooleanField(null=True)
+    estado = models.CharField(max_length=20, choices=Herramienta.ESTADOS)
+    activo = models.BooleanField()
+    ubicacion = models.ForeignKey(Ubicacion, on_delete=models.CASCADE)
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+
+    objects = MovimientoQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise TypeError("La bitácora de movimientos es de sólo inserción.")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.herramienta_id}: {self.estado_anterior} -> {self.estado} ({self.fecha:%d/%m/%Y %H:%M})"
+
+
+class CorteInventario(models.Model):
+    """
+    Foto compacta del estado de todas las herramientas en una fecha. La
+    consulta de stock histórico parte del corte anterior más cercano y sólo
+    repite los movimientos posteriores. 'datos' es JSON comprimido con zlib.
+    """
+    class Meta:
+        verbose_name = "Corte de Inventario"
+        verbose_name_plural = "Cortes de Inventario"
+
+    fecha = models.DateTimeField(unique=True)
+    herramientas = models.PositiveIntegerField(default=0)
+    datos = models.BinaryField()
+    creado = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Corte del {self.fecha:%d/%m/%Y %H:%M} ({self.herramientas} herramientas)"
+
+
+# ==============================================================================
+# 7. SUBIDAS DE EVIDENCIA
+# ==============================================================================
+
+class SubidaFoto(models.Model):
+    """
+    Foto de evidencia subida por partes antes de confirmar la devolución (ver
+    bodega/subidas.py). Al terminar, 'archivo' apunta a la imagen ya unida; la
+    devolución la referencia por su id y el registro se borra al usarla.
+    """
+    class Meta:
+        verbose_name = "Subida de Foto"
+        verbose_name_plural = "Subidas de Fotos"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE)
+    nombre = models.CharField(max_length=255)
+    tamano = models.PositiveIntegerField()
+    recibido = models.PositiveIntegerField(default=0)
+    archivo = models.ImageField(upload_to='evidencias/', blank=True, null=True)
+    # Las subidas abandonadas se borran con el comando limpiar_subidas
+    creada = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.nombre} ({self.recibido}/{self.tamano} bytes)"
+
+
+# ==============================================================================
+# 8. ALMACENAMIENTO POR CONTENIDO
+# ==============================================================================
+
+class ContenidoArchivo(models.Model):
+    """
+    Un archivo del storage por contenido (bodega/almacen.py), identificado por
+    su SHA-256, y cuántos campos de archivo lo usan. Los que quedan en cero se
+    borran con el comando limpiar_almacen.
+    """
+    class Meta:
+        verbose_name = "Contenido de Archivo"
+        verbose_name_plural = "Contenidos de Archivos"
+
+    hash = models.CharField(max_length=64, primary_key=True)
+    nombre = models.CharField(max_length=255)  # Ruta dentro del storage
+    tamano = models.PositiveBigIntegerField()
+    referencias = models.IntegerField(default=0)
+    # Se mueve con cada referencia nueva: la limpieza respeta un margen desde aquí
+    actualizado = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.nombre} ({self.referencias} referencias)"
+
+
+# ==============================================================================
+# 9. REPORTES EN SEGUNDO PLANO
+# ==============================================================================
+
+class TrabajoReporte(models.Model):
+    """
+    Reporte pesado que se genera fuera de la petición web (ver
+    bodega/trabajos.py): la vista lo encola, el comando procesar_trabajos lo
+    ejecuta y deja el CSV en 'archivo'. La tabla es la cola.
+    """
+    class Meta:
+        verbose_name = "Trabajo de Reporte"
+        verbose_name_plural = "Trabajos de Reportes"
+        indexes = [
+            # Cola: el pendiente más antiguo, y los EN_CURSO sin latido
+            models.Index(fields=['estado', 'creado'], name='trabajo_cola_idx'),
+        ]
+
+    TIPOS = (
+        ('TRANSACCIONES', 'Historial de Transacciones'),
+        ('BAJAS', 'Bajas y Reactivaciones'),
+        ('ANALITICA', 'Analítica de Uso'),
+    )
+    ESTADOS = (
+        ('PENDIENTE', 'Pendiente'),
+        ('EN_CURSO', 'En Curso'),
+        ('LISTO', 'Listo'),
+        ('ERROR', 'Error'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tipo = models.CharField(max_length=20, choices=TIPOS)
+    # Los mismos filtros del formulario del reporte (q, fecha_inicio, fecha_fin, orden)
+    parametros = models.JSONField(default=dict)
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='PENDIENTE')
+    progreso = models.PositiveSmallIntegerField(default=0)  # 0 a 100
+    mensaje = models.CharField(max_length=255, blank=True)
+    archivo = models.FileField(upload_to='reportes/', blank=True, null=True)
+    filas = models.PositiveIntegerField(default=0)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    creado = models.DateTimeField(auto_now_add=True)
+    iniciado = models.DateTimeField(null=True, blank=True)
+    terminado = models.DateTimeField(null=True, blank=True)
+    # Lo mueve el proceso que lo ejecuta; si se detiene, el trabajo vuelve a la cola
+    latido = models.DateTimeField(null=True, blank=True)
+
+    def nombre_descarga(self):
+        return f"{self.tipo.lower()}_{timezone.localtime(self.creado):%Y%m%d_%H%M}.csv"
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} de {self.usuario} ({self.get_estado_display()})"
+
+
+# ==============================================================================
+# 10. CONTEO FÍSICO DE INVENTARIO
+# ==============================================================================
+
+class ConteoInventario(models.Model):
+    """
+    Toma de inventario de una ubicación: se escanea lo que hay en los estantes
+    y al cerrar se concilia contra lo que dice el sistema (ver bodega/conteos.py).
+    """
+    class Meta:
+        verbose_name = "Conteo de Inventario"
+        verbose_name_plural = "Conteos de Inventario"
+        constraints = [
+            # Un solo conteo ABIERTO por ubicación. MySQL no tiene índices parciales
+            # (un condition= se ignoraría), así que el índice es sobre una expresión:
+            # la ubicación si está abierto, NULL si no, y los NULL no chocan entre sí.
+            models.UniqueConstraint(
+                models.Case(models.When(estado='ABIERTO', then=models.F('ubicacion')),
+                            default=None, output_field=models.BigIntegerField()),
+                name='conteo_abierto_por_ubicacion_uniq',
+            ),
+        ]
+
+    ESTADOS = (
+        ('ABIERTO', 'Abierto'),
+        ('CERRADO', 'Cerrado'),
+    )
+
+    ubicacion = models.ForeignKey(Ubicacion, on_delete=models.CASCADE, related_name='conteos')
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    estado = models.CharField(max_length=10, choices=ESTADOS, default='ABIERTO')
+    abierto = models.DateTimeField(auto_now_add=True)
+    cerrado = models.DateTimeField(null=True, blank=True)
+    # Conciliación congelada al cerrar (faltantes, inesperadas, estado incorrecto...)
+    resultado = models.JSONField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Conteo {self.ubicacion} {timezone.localtime(self.abierto):%d/%m/%Y} ({self.get_estado_display()})"
+
+
+class LecturaConteo(models.Model):
+    """Un código escaneado en un conteo. Escanear dos veces el mismo no suma."""
+    class Meta:
+        verbose_name = "Lectura de Conteo"
+        verbose_name_plural = "Lecturas de Conteo"
+        constraints = [
+            models.UniqueConstraint(fields=['conteo', 'codigo'], name='lectura_conteo_codigo_uniq'),
+        ]
+
+    conteo = models.ForeignKey(ConteoInventario, on_delete=models.CASCADE, related_name='lecturas')
+    codigo = models.CharField(max_length=100)
+    # Null si el código no corresponde a ninguna herramienta
+    herramienta = models.ForeignKey(Herramienta, on_delete=models.SET_NULL, null=True, blank=True)
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    leido = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.codigo} en {self.conteo_id}"
@@ -0,0 +1,148 @@
+"""
+Bitácora de movimientos de herramientas y stock en una fecha pasada.
+
+Los servicios (préstamo, devolución, baja, reactivación, liberación) y las
+ediciones hechas con save() (admin, shell) escriben un MovimientoHerramienta
+por cada herramienta que cambia de estado, activo o bodega, dentro de la
+misma transacción. Cada cierto tiempo el comando cortar_inventario guarda un
+CorteInventario con el estado completo; para saber qué había en una fecha se
+parte del corte anterior más cercano y se repiten sólo los movimientos
+posteriores, en vez de reconstruir todo el historial de préstamos.
+
+Los rangos son semiabiertos: el estado "en" un momento incluye los
+movimientos con fecha < momento.
+"""
+import json
+import zlib
+from collections import Counter
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import Herramienta, MovimientoHerramienta, CorteInventario
+
+LOTE_LECTURA = 20000
+
+# Los cortes se toman con este desfase para que las transacciones que ya
+# fecharon un movimiento pero todavía no confirman alcancen a quedar dentro
+MARGEN_CORTE = timedelta(minutes=5)
+
+# ==============================================================================
+# 1. REGISTRO
+# ==============================================================================
+
+def registrar(transiciones, origen, usuario=None, fecha=None, using=None):
+    """
+    Agrega a la bitácora varias transiciones (herramienta, estado_anterior,
+    activo_anterior), el mismo formato de eventos.publicar_cambios: la
+    herramienta ya tiene su estado nuevo. Un solo INSERT por lote.
+    """
+    fecha = fecha or timezone.now()
+    MovimientoHerramienta.objects.db_manager(using).bulk_create([
+        MovimientoHerramienta(
+            herramienta_id=herramienta.id, fecha=fecha, origen=origen,
+            estado_anterior=estado_anterior, activo_anterior=activo_anterior,
+            estado=herramienta.estado, activo=herramienta.activo,
+            ubicacion_id=herramienta.ubicacion_id, usuario=usuario,
+        )
+        for herramienta, estado_anterior, activo_anterior in transiciones
+    ], batch_size=1000)
+
+# ==============================================================================
+# 2. CORTES (ESTADO COMPLETO COMPRIMIDO)
+# ==============================================================================
+
+def _comprimir(estados):
+    """{id: (estado, activo, ubicacion_id)} -> bytes. Columnas con ids en diferencias."""
+    ids = sorted(estados)
+    columnas = {
+        'id': [b - a for a, b in zip([0] + ids, ids)],
+        'estado': [estados[i][0] for i in ids],
+        'activo': [int(estados[i][1]) for i in ids],
+        'ubicacion': [estados[i][2] for i in ids],
+    }
+    return zlib.compress(json.dumps(columnas, separators=(',', ':')).encode(), 6)
+
+
+def _descomprimir(datos):
+    columnas = json.loads(zlib.decompress(bytes(datos)))
+    estados = {}
+    herramienta_id = 0
+    for diferencia, estado, activo, ubicacion_id in zip(
+        columnas['id'], columnas['estado'], columnas['activo'], columnas['ubicacion']
+    ):
+        herramienta_id += diferencia
+        estados[herramienta_id] = (estado, bool(activo), ubicacion_id)
+    return estados
+
+
+def tomar_corte(momento=None):
+    """Guarda el estado de todas las herramientas en 'momento' (por defecto ahora - MARGEN_CORTE)."""
+    momento = momento or timezone.now() - MARGEN_CORTE
+    estados = estado_en(momento)
+    return CorteInventario.objects.create(fecha=momento, herramientas=len(estados), datos=_comprimir(estados))
+
+# ==============================================================================
+# 3. CONSULTAS EN EL TIEMPO
+# ==============================================================================
+
+def estado_en(momento=None, ubicaciones=None):
+    """
+    {herramienta_id: (estado, activo, ubicacion_id)} en 'momento' (None =
+    todo lo registrado): corte anterior más cercano + movimientos posteriores.
+    Con 'ubicaciones' se dejan sólo las herramientas que estaban en esas
+    bodegas en ese momento.
+    """
+    cortes = CorteInventario.objects.order_by('-fecha')
+    movimientos = MovimientoHerramienta.objects.all()
+    if momento is not None:
+        cortes = cortes.filter(fecha__lte=momento)
+        movimientos = movimientos.filter(fecha__lt=momento)
+
+    corte = cortes.first()
+    estados = {}
+    if corte is not None:
+        estados = _descomprimir(corte.datos)
+        movimientos = movimientos.filter(fecha__gte=corte.fecha)
+
+    for herramienta_id, estado, activo, ubicacion_id in movimientos.order_by('fecha', 'id').values_list(
+        'herramienta_id', 'estado', 'activo', 'ubicacion_id'
+    ).iterator(chunk_size=LOTE_LECTURA):
+        estados[herramienta_id] = (estado, activo, ubicacion_id)
+
+    if ubicaciones is not None:
+        permitidas = set(ubicaciones)
+        estados = {h: e for h, e in estados.items() if e[2] in permitidas}
+    return estados
+
+
+def stock_en(momento, ubicaciones=None):
+    """Counter de (ubicacion_id, estado) de las herramientas activas en 'momento', más las bajas."""
+    conteo = Counter()
+    for estado, activo, ubicacion_id in estado_en(momento, ubicaciones).values():
+        conteo[(ubicacion_id, estado if activo else 'BAJA')] += 1
+    return conteo
+
+# ==============================================================================
+# 4. CONCILIACIÓN
+# ==============================================================================
+
+def conciliar(usuario=None, ajustar=False):
+    """
+    Compara la bitácora con la tabla de herramientas (cambios hechos por SQL
+    directo o con .update() fuera de los servicios no dejan movimiento).
+    Devuelve la lista de (herramienta, registrado) que difieren; con
+    'ajustar' escribe un movimiento AJUSTE para cada una.
+    """
+    registrados = estado_en()
+    diferencias = [
+        (herramienta, registrados.get(herramienta.id))
+        for herramienta in Herramienta.objects.order_by('id').iterator(chunk_size=LOTE_LECTURA)
+        if registrados.get(herramienta.id) != (herramienta.estado, herramienta.activo, herramienta.ubicacion_id)
+    ]
+    if ajustar:
+        registrar([
+            (herramienta, *(registrado[:2] if registrado else (None, None)))
+            for herramienta, registrado in diferencias
+        ], 'AJUSTE', usuario)
+    return diferencias
@@ -0,0 +1,201 @@
+"""
+Sincronización de los trabajadores con la nómina de RR.HH.
+
+RR.HH. exporta a diario la nómina completa (varios miles de filas) en CSV con
+las columnas rut, nombre, apellido y cargo. Quien está en la nómina queda
+activo con esos datos; quien ya no aparece se desactiva (lo mismo que
+eliminar_trabajador, sin borrar su historial).
+
+El archivo se lee fila a fila y se compara contra un dict en memoria de los
+trabajadores existentes indexado por RUT normalizado; los cambios se aplican
+con bulk_create / bulk_update en lotes, dentro de una transacción. Correrlo
+dos veces con el mismo archivo no cambia nada la segunda vez.
+"""
+import csv
+import io
+import re
+from itertools import cycle
+
+from django.db import transaction
+
+from .eventos import publicar_trabajadores
+from .models import Trabajador
+
+LOTE = 1000
+COLUMNAS = ('rut', 'nombre', 'apellido', 'cargo')
+# El Excel de Windows guarda el CSV en cp1252 si no se elige "UTF-8"
+CODIFICACIONES = ('utf-8-sig', 'cp1252')
+# Una nómina que desactiva más de esta fracción de los activos probablemente
+# viene cortada o es de otra faena; hay que confirmarla con forzar=True
+MAXIMO_DESACTIVAR = 0.5
+
+
+class NominaInvalida(Exception):
+    """El archivo no se puede aplicar (encabezado, vacío o demasiadas desactivaciones)."""
+
+
+def digito_verificador(cuerpo):
+    """Dígito verificador (módulo 11) del cuerpo numérico de un RUT."""
+    suma = sum(int(digito) * factor for digito, factor in zip(reversed(cuerpo), cycle(range(2, 8))))
+    resto = 11 - suma % 11
+    return {11: '0', 10: 'K'}.get(resto, str(resto))
+
+
+def normalizar_rut(valor):
+    """
+    '12.345.678-k', '12345678K' o ' 012345678-K ' -> '12345678-K'. Devuelve
+    None si no es un RUT válido (dígito verificador incluido).
+    """
+    limpio = re.sub(r'[^0-9K]', '', str(valor).upper())
+    cuerpo, dv = limpio[:-1].lstrip('0'), limpio[-1:]
+    if not cuerpo.isdigit() or len(cuerpo) > 8 or digito_verificador(cuerpo) != dv:
+        return None
+    return f"{cuerpo}-{dv}"
+
+# ==============================================================================
+# 1. LECTURA DEL ARCHIVO
+# ==============================================================================
+
+def leer(archivo):
+    """
+    Itera (línea, {columna: valor}) de un CSV de texto abierto. El separador
+    (';' del Excel en español o ',') se deduce del encabezado.
+    """
+    encabezado = archivo.readline()
+    separador = ';' if encabezado.count(';') > encabezado.count(',') else ','
+    columnas = [c.strip().lower() for c in next(csv.reader([encabezado], delimiter=separador), [])]
+    faltan = [c for c in COLUMNAS if c not in columnas]
+    if faltan:
+        raise NominaInvalida(f"Faltan columnas en el encabezado: {', '.join(faltan)}.")
+
+    lector = csv.reader(archivo, delimiter=separador)
+    for valores in lector:
+        if any(v.strip() for v in valores):
+            # +1: el encabezado se leyó aparte
+            yield lector.line_num + 1, dict(zip(columnas, (v.strip() for v in valores)))
+
+# ==============================================================================
+# 2. PLAN Y APLICACIÓN
+# ==============================================================================
+
+class Plan:
+    """Cambios que produce una nómina. 'errores' trae las filas que se ignoraron."""
+
+    def __init__(self):
+        self.crear = []
+        self.actualizar = []
+        self.desactivar = []
+        self.reactivados = 0
+        self.sin_cambios = 0
+        self.errores = []
+        self.activos = 0
+
+    def excesivo(self):
+        """True si desactiva más de MAXIMO_DESACTIVAR de los que estaban activos."""
+        return len(self.desactivar) > MAXIMO_DESACTIVAR * self.activos
+
+    def resumen(self):
+        return (
+            f"{len(self.crear)} nuevos, {len(self.actualizar)} actualizados "
+            f"({self.reactivados} reactivados), {len(self.desactivar)} desactivados, "
+            f"{self.sin_cambios} sin cambios, {len(self.errores)} filas con error"
+        )
+
+
+def _existentes():
+    """RUT normalizado -> Trabajador, y la lista completa."""
+    todos = list(Trabajador.objects.only(*COLUMNAS, 'activo'))
+    por_rut = {}
+    for trabajador in todos:
+        clave = normalizar_rut(trabajador.rut) or trabajador.rut
+        # Si el mismo RUT quedó guardado con dos formatos, manda el ya normalizado
+        if clave not in por_rut or trabajador.rut == clave:
+            por_rut[clave] = trabajador
+    return por_rut, todos
+
+
+def planificar(archivo, desactivar=True):
+    """Compara la nómina con la base sin escribir nada. Devuelve un Plan."""
+    plan = Plan()
+    por_rut, todos = _existentes()
+    largos = {c: Trabajador._meta.get_field(c).max_length for c in COLUMNAS}
+    en_nomina = set()
+    plan.activos = sum(t.activo for t in todos)
+
+    for linea, fila in leer(archivo):
+        rut = normalizar_rut(fila.get('rut', ''))
+        if rut is None:
+            plan.errores.append(f"Línea {linea}: RUT inválido '{fila.get('rut', '')}'.")
+            continue
+        if rut in en_nomina:
+            plan.errores.append(f"Línea {linea}: el RUT {rut} está repetido, se usa su primera fila.")
+            continue
+        datos = {c: fila.get(c, '')[:largos[c]] for c in COLUMNAS if c != 'rut'}
+        if not datos['nombre']:
+            plan.errores.append(f"Línea {linea}: el RUT {rut} no trae nombre.")
+            continue
+        en_nomina.add(rut)
+
+        trabajador = por_rut.get(rut)
+        if trabajador is None:
+            plan.crear.append(Trabajador(rut=rut, activo=True, **datos))
+            continue
+        nuevos = dict(datos, rut=rut, activo=True)
+        if all(getattr(trabajador, campo) == valor for campo, valor in nuevos.items()):
+            plan.sin_cambios += 1
+            continue
+        if not trabajador.activo:
+            plan.reactivados += 1
+        for campo, valor in nuevos.items():
+            setattr(trabajador, campo, valor)
+        plan.actualizar.append(trabajador)
+
+    if not en_nomina:
+        raise NominaInvalida("La nómina no trae ninguna fila válida.")
+    if desactivar:
+        vigentes = {por_rut[rut].pk for rut in en_nomina if rut in por_rut}
+        plan.desactivar = [t for t in todos if t.activo and t.pk not in vigentes]
+    return plan
+
+
+@transaction.atomic
+def aplicar(plan, forzar=False):
+    """Escribe el plan en lotes de LOTE filas."""
+    if plan.excesivo() and not forzar:
+        raise NominaInvalida(
+            f"La nómina desactivaría {len(plan.desactivar)} de {plan.activos} trabajadores activos. "
+            f"Revise el archivo o confírmela forzando."
+        )
+
+    Trabajador.objects.bulk_create(plan.crear, batch_size=LOTE)
+    Trabajador.objects.bulk_update(plan.actualizar, COLUMNAS + ('activo',), batch_size=LOTE)
+    for trabajador in plan.desactivar:
+        trabajador.activo = False
+    Trabajador.objects.bulk_update(plan.desactivar, ['activo'], batch_size=LOTE)
+
+    delta = len(plan.crear) + plan.reactivados - len(plan.desactivar)
+    if delta:
+        publicar_trabajadores(delta)
+
+
+def planificar_binario(binario, desactivar=True, codificacion=None):
+    """planificar() sobre un archivo binario; sin 'codificacion' prueba CODIFICACIONES."""
+    codificaciones = (codificacion,) if codificacion else CODIFICACIONES
+    for intento, codificacion in enumerate(codificaciones, start=1):
+        binario.seek(0)
+        texto = io.TextIOWrapper(binario, encoding=codificacion, newline='')
+        try:
+            return planificar(texto, desactivar)
+        except UnicodeDecodeError:
+            if intento == len(codificaciones):
+                raise NominaInvalida(f"El archivo no está en {', '.join(codificaciones)}.")
+        finally:
+            texto.detach()  # El binario es del que llama: no se cierra aquí
+
+
+def sincronizar(binario, desactivar=True, simular=False, forzar=False, codificacion=None):
+    """Planifica y (salvo 'simular') aplica la nómina de 'binario'. Devuelve el Plan."""
+    plan = planificar_binario(binario, desactivar, codificacion)
+    if not simular:
+        aplicar(plan, forzar)
+    return plan
@@ -0,0 +1,283 @@
+"""
+Perfilado bajo demanda de peticiones en producción.
+
+Con PERFILADOR_ACTIVO el middleware perfila:
+  - las peticiones de usuarios staff que traen ?_perfilar=1 o la cabecera
+    X-Perfilar: 1 (o el nombre del modo: 'muestreo' / 'cprofile'), y
+  - una fracción PERFILADOR_MUESTREO de todas las peticiones.
+
+Modo 'muestreo' (por defecto): un hilo toma la pila del hilo de la petición
+cada PERFILADOR_INTERVALO_MS y guarda las pilas agregadas en formato "folded"
+(flamegraph.pl, speedscope.app). Su costo no depende de cuántas funciones se
+llamen, así que es seguro en reportes pesados. Modo 'cprofile': perfil
+determinista de la stdlib (.prof, para pstats o snakeviz).
+
+Cada perfil se guarda en PERFILADOR_DIR junto con un resumen JSON (tiempo
+total, consultas SQL con su duración, tiempo en templates). El directorio es
+un buffer circular: sólo se conservan los últimos PERFILADOR_MAXIMO perfiles.
+Desactivado, el middleware se descarta al arrancar (MiddlewareNotUsed) y no
+cuesta nada por petición.
+
+OJO: sólo se perfila el hilo que atiende la petición. En vistas async bajo
+ASGI el trabajo de la base corre en otro hilo y aparece como espera.
+"""
+import cProfile
+import io
+import json
+import marshal
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.utils import timezone
+
+MODOS = ('muestreo', 'cprofile')
+EXTENSIONES = {'muestreo': 'folded', 'cprofile': 'prof'}
+NOMBRE_ARCHIVO = re.compile(r'^\d+-\d+\.(json|folded|prof)$')
+
+# ==============================================================================
+# 1. PERFILADORES
+# ==============================================================================
+
+def _archivo_corto(ruta):
+    """Ruta relativa a site-packages o al proyecto, para pilas legibles."""
+    for base in (os.sep + 'site-packages' + os.sep, str(settings.BASE_DIR) + os.sep):
+        posicion = ruta.find(base)
+        if posicion != -1:
+            return ruta[posicion + len(base):]
+    return os.path.basename(ruta)
+
+
+class Muestreador(threading.Thread):
+    """Perfilador estadístico: cuenta las pilas del hilo observado a intervalos fijos."""
+
+    def __init__(self, hilo_id, intervalo):
+        super().__init__(name='perfilador', daemon=True)
+        self.hilo_id = hilo_id
+        self.intervalo = intervalo
+        self.pilas = Counter()
+        self._detener = threading.Event()
+
+    def run(self):
+        while not self._detener.wait(self.intervalo):
+            frame = sys._current_frames().get(self.hilo_id)
+            marcos = []
+            while frame is not None:
+                codigo = frame.f_code
+                marcos.append(f"{codigo.co_name} ({_archivo_corto(codigo.co_filename)}:{codigo.co_firstlineno})")
+                frame = frame.f_back
+            if marcos:
+                self.pilas[';'.join(reversed(marcos))] += 1
+
+    def detener(self):
+        self._detener.set()
+        self.join()
+
+    def folded(self):
+        return ''.join(f"{pila} {veces}\n" for pila, veces in self.pilas.most_common())
+
+    def ms_en(self, fragmento):
+        """Tiempo aproximado de las muestras con algún marco cuyo archivo contiene 'fragmento'."""
+        muestras = sum(veces for pila, veces in self.pilas.items() if fragmento in pila)
+        return round(muestras * self.intervalo * 1000, 1)
+
+
+def _bytes_cprofile(perfil):
+    """Contenido del .prof (mismo formato que Profile.dump_stats)."""
+    perfil.create_stats()
+    return marshal.dumps(perfil.stats)
+
+
+def _top_cprofile(perfil, cantidad=25):
+    salida = io.StringIO()
+    pstats.Stats(perfil, stream=salida).sort_stats('cumulative').print_stats(cantidad)
+    return salida.getvalue()
+
+
+def _ms_templates_cprofile(perfil):
+    """Tiempo acumulado del Template.render más externo."""
+    estadisticas = pstats.Stats(perfil).stats
+    return round(max(
+        (acumulado for (archivo, _, funcion), (_, _, _, acumulado, _) in estadisticas.items()
+         if funcion == 'render' and archivo.endswith(os.path.join('django', 'template', 'base.py'))),
+        default=0
+    ) * 1000, 1)
+
+# ==============================================================================
+# 2. SQL
+# ==============================================================================
+
+class _RegistroSQL:
+    """execute_wrapper que anota alias, SQL y duración de cada consulta."""
+
+    def __init__(self):
+        self.consultas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas.append({
+                'alias': context['connection'].alias,
+                'sql': sql[:1000],
+                'ms': round((time.perf_counter() - inicio) * 1000, 2),
+            })
+
+# ==============================================================================
+# 3. BUFFER CIRCULAR EN DISCO
+# ==============================================================================
+
+def _directorio():
+    os.makedirs(settings.PERFILADOR_DIR, exist_ok=True)
+    return settings.PERFILADOR_DIR
+
+
+def guardar(resumen, contenido, extension):
+    """Escribe el perfil y su resumen, y descarta los más antiguos."""
+    directorio = _directorio()
+    base = os.path.join(directorio, resumen['id'])
+    modo = 'wb' if isinstance(contenido, bytes) else 'w'
+    with open(f"{base}.{extension}", modo) as archivo:
+        archivo.write(contenido)
+    with open(f"{base}.json", 'w') as archivo:
+        json.dump(resumen, archivo, cls=DjangoJSONEncoder)
+
+    resumenes = sorted(n for n in os.listdir(directorio) if n.endswith('.json'))
+    for nombre in resumenes[:-settings.PERFILADOR_MAXIMO]:
+        perfil_id = nombre[:-len('.json')]
+        for ext in ('json', *EXTENSIONES.values()):
+            try:
+                os.remove(os.path.join(directorio, f"{perfil_id}.{ext}"))
+            except FileNotFoundError:
+                pass
+
+
+def recientes():
+    """Resúmenes de los perfiles guardados, del más nuevo al más antiguo."""
+    if not os.path.isdir(settings.PERFILADOR_DIR):
+        return []
+    resumenes = []
+    for nombre in sorted(os.listdir(settings.PERFILADOR_DIR), reverse=True):
+        if not nombre.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(settings.PERFILADOR_DIR, nombre)) as archivo:
+                resumenes.append(json.load(archivo))
+        except (OSError, ValueError):
+            continue  # Rotado o a medio escribir por otro worker
+    return resumenes
+
+
+def ruta_archivo(nombre):
+    """Ruta de un archivo del buffer, o None si el nombre no es válido o ya se rotó."""
+    if not NOMBRE_ARCHIVO.match(nombre):
+        return None
+    ruta = os.path.join(settings.PERFILADOR_DIR, nombre)
+    return ruta if os.path.isfile(ruta) else None
+
+# ==============================================================================
+# 4. MIDDLEWARE
+# ==============================================================================
+
+class PerfiladorMiddleware:
+    """Perfila las peticiones pedidas por staff o sorteadas por PERFILADOR_MUESTREO."""
+    # Bajo ASGI atiende sin pasar por un hilo (ver el OJO del encabezado)
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PERFILADOR_ACTIVO:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+
+    def _modo(self, request, usuario):
+        pedido = request.GET.get('_perfilar') or request.headers.get('X-Perfilar')
+        if pedido and usuario.is_staff:
+            return pedido if pedido in MODOS else settings.PERFILADOR_MODO
+        if settings.PERFILADOR_MUESTREO and random.random() < settings.PERFILADOR_MUESTREO:
+            return settings.PERFILADOR_MODO
+        return None
+
+    @contextmanager
+    def _perfilando(self, modo):
+        """Perfila el bloque. Al salir, el dict entregado trae 'perfil', 'sql' y 'total'."""
+        medicion = {'sql': _RegistroSQL()}
+        with ExitStack() as pila:
+            for conexion in connections.all():
+                pila.enter_context(conexion.execute_wrapper(medicion['sql']))
+            inicio = time.perf_counter()
+            if modo == 'cprofile':
+                medicion['perfil'] = perfil = cProfile.Profile()
+                perfil.enable()
+                pila.callback(perfil.disable)
+            else:
+                medicion['perfil'] = muestreador = Muestreador(
+                    threading.get_ident(), settings.PERFILADOR_INTERVALO_MS / 1000
+                )
+                muestreador.start()
+                pila.callback(muestreador.detener)
+            try:
+                yield medicion
+            finally:
+                medicion['total'] = time.perf_counter() - inicio
+
+    def _guardar(self, request, usuario, response, modo, medicion):
+        perfil, sql = medicion['perfil'], medicion['sql']
+        resumen = {
+            'id': f"{time.time_ns():020d}-{os.getpid()}",
+            'fecha': timezone.now(),
+            'metodo': request.method,
+            'ruta': request.get_full_path(),
+            'usuario': usuario.get_username() if usuario.is_authenticated else None,
+            'status': response.status_code,
+            'modo': modo,
+            'ms_total': round(medicion['total'] * 1000, 1),
+            'consultas': len(sql.consultas),
+            'ms_sql': round(sum(c['ms'] for c in sql.consultas), 1),
+            'sql': sql.consultas,
+        }
+        if modo == 'cprofile':
+            resumen['ms_templates'] = _ms_templates_cprofile(perfil)
+            resumen['top'] = _top_cprofile(perfil)
+            contenido = _bytes_cprofile(perfil)
+        else:
+            resumen['ms_templates'] = perfil.ms_en(os.path.join('django', 'template') + os.sep)
+            resumen['muestras'] = sum(perfil.pilas.values())
+            contenido = perfil.folded()
+        guardar(resumen, contenido, EXTENSIONES[modo])
+        response['X-Perfil'] = resumen['id']
+        return response
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        modo = self._modo(request, request.user)
+        if modo is None:
+            return self.get_response(request)
+        with self._perfilando(modo) as medicion:
+            response = self.get_response(request)
+        return self._guardar(request, request.user, response, modo, medicion)
+
+    async def __acall__(self, request):
+        # request.user haría la consulta de la sesión dentro del loop
+        usuario = await request.auser()
+        modo = self._modo(request, usuario)
+        if modo is None:
+            return await self.get_response(request)
+        with self._perfilando(modo) as medicion:
+            response = await self.get_response(request)
+        return await sync_to_async(self._guardar)(request, usuario, response, modo, medicion)
@@ -0,0 +1,78 @@
+"""
+Consultas de los reportes con los filtros de su formulario.
+
+La página del reporte (views.py) y su versión en segundo plano
+(bodega/trabajos.py) arman la misma consulta desde los mismos parámetros:
+request.GET en la vista, o el dict guardado en TrabajoReporte.parametros.
+"""
+from django.db.models import Q
+
+from .alcance import filtrar_por_ubicacion
+from .filtros import leer_rango
+from .models import HistorialBaja, DetallePrestamo
+
+# Parámetros del formulario que se guardan al encolar un reporte
+PARAMETROS = ('q', 'fecha_inicio', 'fecha_fin', 'orden')
+
+# Traduce lo que llega de la URL a campos reales de la BD
+ORDEN_BAJAS = {
+    'fecha': 'fecha_evento',
+    '-fecha': '-fecha_evento',
+    'accion': 'accion',
+    '-accion': '-accion',
+    'herramienta': 'herramienta__nombre',
+    '-herramienta': '-herramienta__nombre',
+    'motivo': 'motivo',
+    '-motivo': '-motivo',
+    'usuario': 'usuario__username',
+    '-usuario': '-usuario__username',
+}
+
+# Como la tabla es DetallePrestamo, los campos son diferentes (usamos __ para navegar)
+ORDEN_TRANSACCIONES = {
+    'fecha': 'prestamo__fecha_solicitud', '-fecha': '-prestamo__fecha_solicitud',
+    'herramienta': 'herramienta__nombre', '-herramienta': '-herramienta__nombre',
+    'trabajador': 'prestamo__trabajador__nombre', '-trabajador': '-prestamo__trabajador__nombre',
+    'bodeguero': 'prestamo__bodeguero__username', '-bodeguero': '-prestamo__bodeguero__username',
+    'estado': 'estado_devolucion', '-estado': '-estado_devolucion',
+    'devolucion': 'fecha_devolucion', '-devolucion': '-fecha_devolucion',
+}
+
+
+def bajas(datos, ubicaciones):
+    """(consulta, rango) del reporte de bajas y reactivaciones."""
+    rango = leer_rango(datos)
+    consulta = HistorialBaja.objects.select_related('herramienta', 'usuario').order_by(
+        ORDEN_BAJAS.get(datos.get('orden', ''), '-fecha_evento')
+    )
+    consulta = filtrar_por_ubicacion(consulta, ubicaciones, 'herramienta__ubicacion')
+
+    busqueda = datos.get('q', '')
+    if busqueda:
+        consulta = consulta.filter(
+            Q(herramienta__nombre__icontains=busqueda) |
+            Q(herramienta__codigo_qr__icontains=busqueda) |
+            Q(motivo__icontains=busqueda)
+        )
+    # Rango semiabierto sobre la columna (usa historial_fecha_idx), no __date
+    return rango.filtrar(consulta, 'fecha_evento'), rango
+
+
+def transacciones(datos, ubicaciones):
+    """(consulta, rango) del historial de transacciones (un ítem prestado por fila)."""
+    rango = leer_rango(datos)
+    consulta = DetallePrestamo.objects.select_related(
+        'prestamo', 'herramienta', 'prestamo__trabajador', 'prestamo__bodeguero'
+    ).order_by(ORDEN_TRANSACCIONES.get(datos.get('orden', ''), '-prestamo__fecha_solicitud'))
+    consulta = filtrar_por_ubicacion(consulta, ubicaciones, 'herramienta__ubicacion')
+
+    busqueda = datos.get('q', '')
+    if busqueda:
+        consulta = consulta.filter(
+            Q(herramienta__nombre__icontains=busqueda) |
+            Q(herramienta__codigo_qr__icontains=busqueda) |
+            Q(prestamo__trabajador__nombre__icontains=busqueda) |
+            Q(prestamo__trabajador__rut__icontains=busqueda)
+        )
+    # Rango semiabierto sobre prestamo.fecha_solicitud (prestamo_fecha_idx), no __date
+    return rango.filtrar(consulta, 'prestamo__fecha_solicitud'), rango
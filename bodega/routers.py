@@ -0,0 +1,113 @@
+"""
+Ruteo de lecturas de reportes hacia una réplica.
+
+Las vistas marcadas con @lectura_en_replica leen desde el alias 'reportes'
+(si está configurado en DATABASES); todo lo demás sigue en 'default'.
+
+Read-your-writes: cuando una petición escribe en la base principal dejamos una
+cookie de corta duración y, mientras exista, ese usuario lee sus reportes desde
+la principal, así no ve datos atrasados por el lag de replicación.
+"""
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+ALIAS_REPORTES = 'reportes'
+COOKIE_PRIMARIA = 'smartstock_primaria'
+
+_leer_en_replica = contextvars.ContextVar('smartstock_leer_en_replica', default=False)
+_hubo_escritura = contextvars.ContextVar('smartstock_hubo_escritura', default=False)
+
+
+def replica_disponible():
+    return ALIAS_REPORTES in settings.DATABASES
+
+
+class RouterReportes:
+
+    def db_for_read(self, model, **hints):
+        if _leer_en_replica.get() and replica_disponible():
+            return ALIAS_REPORTES
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Las sesiones se guardan en cada petición; no cuentan como escritura de negocio
+        if model._meta.app_label != 'sessions':
+            _hubo_escritura.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplica y principal tienen los mismos datos
+        bases = {'default', ALIAS_REPORTES}
+        if obj1._state.db in bases and obj2._state.db in bases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+@contextmanager
+def leyendo_en_replica():
+    """Las lecturas dentro del bloque van a la réplica (código fuera de una vista)."""
+    token = _leer_en_replica.set(True)
+    try:
+        yield
+    finally:
+        _leer_en_replica.reset(token)
+
+
+def lectura_en_replica(vista):
+    """Decorador para vistas de reportes de sólo lectura."""
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        if request.COOKIES.get(COOKIE_PRIMARIA):
+            return vista(request, *args, **kwargs)
+        with leyendo_en_replica():
+            return vista(request, *args, **kwargs)
+    return envoltura
+
+
+class EscrituraRecienteMiddleware:
+    """
+    Marca con una cookie al usuario que acaba de modificar datos.
+
+    Sirve peticiones síncronas y asíncronas: bajo ASGI un middleware sólo
+    síncrono obligaría a pasar cada petición (escáner, SSE) por un hilo.
+    """
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+
+    def _marcar(self, response):
+        if _hubo_escritura.get() and replica_disponible():
+            response.set_cookie(
+                COOKIE_PRIMARIA, '1',
+                max_age=settings.REPLICA_LECTURA_PROPIA_SEGUNDOS,
+                httponly=True, samesite='Lax'
+            )
+        return response
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        token = _hubo_escritura.set(False)
+        try:
+            return self._marcar(self.get_response(request))
+        finally:
+            _hubo_escritura.reset(token)
+
+    async def __acall__(self, request):
+        # sync_to_async devuelve a esta corrutina lo que el ORM marcó en su hilo
+        token = _hubo_escritura.set(False)
+        try:
+            return self._marcar(await self.get_response(request))
+        finally:
+            _hubo_escritura.reset(token)
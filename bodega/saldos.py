@@ -0,0 +1,93 @@
+"""
+Mantención de los contadores de SaldoTrabajador.
+
+Los servicios de préstamo, devolución y reactivación llaman a estas funciones
+dentro de su transacción. Los incrementos van con F() para que dos bodegueros
+atendiendo al mismo trabajador no se pisen. recalcular() reconstruye los
+saldos desde el historial (migración inicial o reparación).
+"""
+from collections import defaultdict
+
+from django.db.models import Count, F, Max, Q
+from django.db.models.functions import Greatest
+
+from .models import SaldoTrabajador, Prestamo, DetallePrestamo
+
+
+def _asegurar(trabajador_ids):
+    SaldoTrabajador.objects.bulk_create(
+        [SaldoTrabajador(trabajador_id=t) for t in trabajador_ids],
+        ignore_conflicts=True
+    )
+
+
+def registrar_prestamo(prestamo, cantidad):
+    """Suma un préstamo de 'cantidad' herramientas al saldo del trabajador."""
+    _asegurar([prestamo.trabajador_id])
+    SaldoTrabajador.objects.filter(trabajador_id=prestamo.trabajador_id).update(
+        prestamos_totales=F('prestamos_totales') + 1,
+        herramientas_prestadas=F('herramientas_prestadas') + cantidad,
+        herramientas_en_poder=F('herramientas_en_poder') + cantidad,
+        ultimo_prestamo=prestamo.fecha_solicitud,
+    )
+
+
+def registrar_devoluciones(cierres):
+    """
+    Descuenta ítems devueltos. 'cierres' es una lista de tuplas
+    (trabajador_id, fecha_solicitud, fecha_devolucion).
+    """
+    por_trabajador = defaultdict(lambda: [0, 0])
+    for trabajador_id, solicitud, devolucion in cierres:
+        acumulado = por_trabajador[trabajador_id]
+        acumulado[0] += 1
+        acumulado[1] += max(int((devolucion - solicitud).total_seconds()), 0)
+
+    _asegurar(por_trabajador)
+    for trabajador_id, (cantidad, segundos) in por_trabajador.items():
+        SaldoTrabajador.objects.filter(trabajador_id=trabajador_id).update(
+            # Greatest: un saldo desfasado no debe bloquear la devolución (se
+            # corrige con recalcular)
+            herramientas_en_poder=Greatest(F('herramientas_en_poder') - cantidad, 0),
+            devoluciones=F('devoluciones') + cantidad,
+            segundos_en_prestamo=F('segundos_en_prestamo') + segundos,
+        )
+
+
+def recalcular(trabajador_ids=None):
+    """
+    Reconstruye los saldos desde Prestamo/DetallePrestamo. La duración se
+    suma en Python porque restar fechas en SQL no es portable entre MySQL y
+    SQLite.
+    """
+    prestamos = Prestamo.objects.all()
+    detalles = DetallePrestamo.objects.all()
+    if trabajador_ids is not None:
+        prestamos = prestamos.filter(trabajador_id__in=trabajador_ids)
+        detalles = detalles.filter(prestamo__trabajador_id__in=trabajador_ids)
+
+    saldos = {}
+    for fila in prestamos.values('trabajador_id').annotate(total=Count('id'), ultimo=Max('fecha_solicitud')):
+        saldos[fila['trabajador_id']] = SaldoTrabajador(
+            trabajador_id=fila['trabajador_id'],
+            prestamos_totales=fila['total'],
+            ultimo_prestamo=fila['ultimo'],
+        )
+    for fila in detalles.values('prestamo__trabajador_id').annotate(
+        total=Count('id'), abiertos=Count('id', filter=Q(devuelto=False))
+    ):
+        saldo = saldos[fila['prestamo__trabajador_id']]
+        saldo.herramientas_prestadas = fila['total']
+        saldo.herramientas_en_poder = fila['abiertos']
+        saldo.devoluciones = fila['total'] - fila['abiertos']
+    for trabajador_id, solicitud, devolucion in detalles.filter(
+        devuelto=True, fecha_devolucion__isnull=False
+    ).values_list('prestamo__trabajador_id', 'prestamo__fecha_solicitud', 'fecha_devolucion').iterator():
+        saldos[trabajador_id].segundos_en_prestamo += max(int((devolucion - solicitud).total_seconds()), 0)
+
+    existentes = SaldoTrabajador.objects.all()
+    if trabajador_ids is not None:
+        existentes = existentes.filter(trabajador_id__in=trabajador_ids)
+    existentes.delete()
+    SaldoTrabajador.objects.bulk_create(saldos.values(), batch_size=1000)
+    return len(saldos)
@@ -0,0 +1,337 @@
+"""
+Lógica transaccional de préstamo y devolución.
+
+Se comparte entre las vistas HTML (formularios) y la API JSON asíncrona del
+escáner, para que ambas apliquen exactamente las mismas reglas. Todo cambio
+de estado queda en la bitácora de movimientos (movimientos.py) dentro de la
+misma transacción.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, When, Value
+from django.utils import timezone
+
+from .models import Herramienta, Prestamo, DetallePrestamo, HistorialBaja, Categoria, Mantencion, AlertaAtraso
+from .eventos import publicar_cambios
+from . import saldos, movimientos
+from .alcance import filtrar_por_ubicacion
+
+# ==============================================================================
+# 1. PRÉSTAMO
+# ==============================================================================
+
+def _fechas_limite(prestamo, herramientas, plazo_horas=None):
+    """
+    Fecha límite de cada herramienta: el plazo del préstamo si se indicó, si
+    no el de su categoría, si no PRESTAMO_HORAS_DEFECTO.
+    """
+    if plazo_horas:
+        limite = prestamo.fecha_solicitud + timedelta(hours=plazo_horas)
+        return {h.id: limite for h in herramientas}
+
+    horas_categoria = dict(Categoria.objects.filter(
+        id__in={h.categoria_id for h in herramientas}, horas_prestamo__isnull=False
+    ).values_list('id', 'horas_prestamo'))
+    return {
+        h.id: prestamo.fecha_solicitud + timedelta(
+            hours=horas_categoria.get(h.categoria_id, settings.PRESTAMO_HORAS_DEFECTO)
+        )
+        for h in herramientas
+    }
+
+
+@transaction.atomic
+def prestar_herramientas(trabajador, bodeguero, codigos, observacion='', ubicaciones=None, plazo_horas=None):
+    """
+    Registra un préstamo con todas las herramientas disponibles de 'codigos'.
+    Con 'ubicaciones' sólo se aceptan herramientas de esas bodegas y con
+    'plazo_horas' se reemplaza el plazo de las categorías.
+    Devuelve (prestamo, guardados, errores); prestamo es None si ninguna
+    herramienta se pudo prestar.
+    """
+    # Bloqueamos las filas para que dos escáneres no presten la misma herramienta
+    candidatas = filtrar_por_ubicacion(Herramienta.objects.select_for_update(), ubicaciones)
+    herramientas = {
+        h.codigo_qr: h
+        for h in candidatas.filter(codigo_qr__in=codigos, activo=True)
+    }
+
+    prestadas = []
+    errores = []
+    for codigo in dict.fromkeys(codigos):  # Sin duplicados, respetando el orden
+        herramienta = herramientas.get(codigo)
+        if herramienta is None:
+            errores.append(f"QR {codigo} no existe o fue dado de baja")
+        elif herramienta.estado != 'DISPONIBLE':
+            errores.append(f"{herramienta.nombre} no disponible ({herramienta.estado})")
+        else:
+            prestadas.append(herramienta)
+
+    if not prestadas:
+        return None, 0, errores
+
+    prestamo = Prestamo.objects.create(
+        trabajador=trabajador,
+        bodeguero=bodeguero,
+        fecha_solicitud=timezone.now(),
+        observacion=observacion
+    )
+    limites = _fechas_limite(prestamo, prestadas, plazo_horas)
+    DetallePrestamo.objects.bulk_create([
+        DetallePrestamo(prestamo=prestamo, herramienta=h, fecha_limite=limites[h.id]) for h in prestadas
+    ])
+    saldos.registrar_prestamo(prestamo, len(prestadas))
+    Herramienta.objects.filter(id__in=[h.id for h in prestadas]).update(estado='EN_USO')
+
+    for herramienta in prestadas:
+        herramienta.estado = 'EN_USO'
+    transiciones = [(h, 'DISPONIBLE', True) for h in prestadas]
+    movimientos.registrar(transiciones, 'PRESTAMO', bodeguero, prestamo.fecha_solicitud)
+    publicar_cambios(transiciones)
+
+    return prestamo, len(prestadas), errores
+
+# ==============================================================================
+# 2. DEVOLUCIÓN
+# ==============================================================================
+
+@transaction.atomic
+def devolver_herramientas(items, ubicaciones=None, usuario=None):
+    """
+    Procesa la devolución de varias herramientas. Cada item es un dict con
+    'codigo', 'estado' ('DISPONIBLE' o 'EN_MANTENCION'), 'observacion' y
+    opcionalmente 'foto'. Con 'ubicaciones' sólo se reciben herramientas de
+    esas bodegas; 'usuario' es quien recibe (para la bitácora).
+    Devuelve (detalles_devueltos, errores).
+    """
+    codigos = [item['codigo'] for item in items]
+    candidatas = filtrar_por_ubicacion(Herramienta.objects.select_for_update(), ubicaciones)
+    herramientas = {
+        h.codigo_qr: h
+        for h in candidatas.filter(codigo_qr__in=codigos)
+    }
+
+    # Préstamo abierto de cada herramienta (el más antiguo, igual que antes)
+    abiertos = {}
+    for detalle in DetallePrestamo.objects.filter(
+        herramienta__in=list(herramientas.values()), devuelto=False
+    ).select_related('prestamo').order_by('id'):
+        abiertos.setdefault(detalle.herramienta_id, detalle)
+
+    ahora = timezone.now()
+    devueltos = []
+    errores = []
+    por_estado = {'DISPONIBLE': [], 'EN_MANTENCION': []}
+    talleres = []  # Mantenciones que se abren con esta devolución
+
+    for item in items:
+        codigo = item['codigo']
+        herramienta = herramientas.get(codigo)
+        if herramienta is None:
+            errores.append(f"{codigo}: No existe.")
+            continue
+
+        detalle = abiertos.pop(herramienta.id, None)
+        if detalle is None:
+            errores.append(f"{codigo}: No estaba prestado.")
+            continue
+
+        detalle.devuelto = True
+        detalle.estado_devolucion = item['estado']
+        detalle.fecha_devolucion = ahora
+        detalle.observacion_falla = item.get('observacion', '')
+        if item.get('foto'):
+            detalle.foto_evidencia = item['foto']
+        detalle.save()
+        detalle.herramienta = herramienta
+        devueltos.append(detalle)
+
+        estado_nuevo = 'EN_MANTENCION' if item['estado'] == 'EN_MANTENCION' else 'DISPONIBLE'
+        por_estado[estado_nuevo].append(herramienta)
+        if estado_nuevo == 'EN_MANTENCION':
+            talleres.append(Mantencion(
+                herramienta=herramienta, detalle=detalle, fecha_inicio=ahora,
+                observacion=detalle.observacion_falla
+            ))
+
+    # Cerramos de una vez los préstamos que quedaron sin ítems pendientes
+    if devueltos:
+        Prestamo.objects.filter(
+            id__in={d.prestamo_id for d in devueltos}
+        ).exclude(detalleprestamo__devuelto=False).update(fecha_devolucion=ahora)
+        saldos.registrar_devoluciones([
+            (d.prestamo.trabajador_id, d.prestamo.fecha_solicitud, ahora) for d in devueltos
+        ])
+    Mantencion.objects.bulk_create(talleres)
+
+    transiciones = []
+    for estado_nuevo, lista in por_estado.items():
+        if not lista:
+            continue
+        Herramienta.objects.filter(id__in=[h.id for h in lista]).update(estado=estado_nuevo)
+        for herramienta in lista:
+            transiciones.append((herramienta, herramienta.estado, herramienta.activo))
+            herramienta.estado = estado_nuevo
+    movimientos.registrar(transiciones, 'DEVOLUCION', usuario, ahora)
+    publicar_cambios(transiciones)
+
+    return devueltos, errores
+
+# ==============================================================================
+# 3. BAJAS Y REACTIVACIONES (MASIVAS)
+# ==============================================================================
+
+# Estado de baja y motivo según el estado en que estaba la herramienta
+BAJA_POR_ESTADO = {
+    'EN_MANTENCION': ('BAJA_POR_DANO', "Daño Irreparable"),
+    'EN_USO': ('BAJA_POR_PERDIDA', "Pérdida en Obra"),
+}
+BAJA_ADMINISTRATIVA = ('DE_BAJA', "Baja Administrativa")
+MOTIVO_REACTIVACION = "Reincorporación al Inventario"
+OBSERVACION_CIERRE_ZOMBIE = "Cierre automático por Reactivación de Inventario"
+
+
+@transaction.atomic
+def dar_de_baja(herramientas, usuario):
+    """
+    Da de baja todas las herramientas activas del queryset 'herramientas' con
+    un solo UPDATE (el CASE elige BAJA_POR_DANO, BAJA_POR_PERDIDA o DE_BAJA
+    según el estado de cada una) y un solo INSERT en HistorialBaja.
+    Devuelve (herramientas_dadas_de_baja, Counter de motivos).
+    """
+    bajas = list(herramientas.select_for_update().filter(activo=True))
+    if not bajas:
+        return [], Counter()
+
+    Herramienta.objects.filter(id__in=[h.id for h in bajas]).update(
+        activo=False,
+        estado=Case(
+            *[When(estado=actual, then=Value(baja)) for actual, (baja, _) in BAJA_POR_ESTADO.items()],
+            default=Value(BAJA_ADMINISTRATIVA[0]),
+        ),
+    )
+
+    motivos = Counter()
+    historial = []
+    transiciones = []
+    for herramienta in bajas:
+        estado_baja, motivo = BAJA_POR_ESTADO.get(herramienta.estado, BAJA_ADMINISTRATIVA)
+        transiciones.append((herramienta, herramienta.estado, True))
+        herramienta.estado, herramienta.activo = estado_baja, False
+        motivos[motivo] += 1
+        historial.append(HistorialBaja(herramienta=herramienta, accion='BAJA', motivo=motivo, usuario=usuario))
+
+    HistorialBaja.objects.bulk_create(historial)
+    # Las que estaban en el taller salen de él (irreparables), y una perdida
+    # en obra deja de ser un atraso pendiente
+    ahora = timezone.now()
+    ids = [h.id for h in bajas]
+    Mantencion.objects.filter(herramienta_id__in=ids, fecha_fin__isnull=True).update(
+        fecha_fin=ahora, usuario_cierre=usuario
+    )
+    perdidas = [h.id for h, estado_anterior, _ in transiciones if estado_anterior == 'EN_USO']
+    if perdidas:
+        AlertaAtraso.objects.filter(detalle__herramienta_id__in=perdidas, resuelta=False).update(
+            resuelta=True, fecha_resolucion=ahora
+        )
+    movimientos.registrar(transiciones, 'BAJA', usuario, ahora)
+    publicar_cambios(transiciones)
+    return bajas, motivos
+
+
+@transaction.atomic
+def reactivar(herramientas, usuario):
+    """
+    Reincorpora al inventario las herramientas inactivas del queryset. Los
+    préstamos que quedaron abiertos ("zombies") se cierran en bloque, igual
+    que los préstamos padre que se quedan sin ítems pendientes.
+    Devuelve (herramientas_reactivadas, detalles_cerrados).
+    """
+    reactivadas = list(herramientas.select_for_update().filter(activo=False))
+    if not reactivadas:
+        return [], 0
+
+    ids = [h.id for h in reactivadas]
+    ahora = timezone.now()
+
+    # 1. Préstamos zombies
+    zombies = DetallePrestamo.objects.filter(herramienta_id__in=ids, devuelto=False)
+    abiertos = list(zombies.values_list('prestamo_id', 'prestamo__trabajador_id', 'prestamo__fecha_solicitud'))
+    prestamos = {prestamo_id for prestamo_id, _, _ in abiertos}
+    cerrados = zombies.update(
+        devuelto=True,
+        fecha_devolucion=ahora,
+        estado_devolucion='DISPONIBLE',
+        observacion_falla=OBSERVACION_CIERRE_ZOMBIE,
+    )
+    if prestamos:
+        Prestamo.objects.filter(
+            id__in=prestamos
+        ).exclude(detalleprestamo__devuelto=False).update(fecha_devolucion=ahora)
+        saldos.registrar_devoluciones([(trabajador, solicitud, ahora) for _, trabajador, solicitud in abiertos])
+
+    # 2. Reactivación y auditoría
+    Herramienta.objects.filter(id__in=ids).update(activo=True, estado='DISPONIBLE')
+
+    transiciones = []
+    for herramienta in reactivadas:
+        transiciones.append((herramienta, herramienta.estado, False))
+        herramienta.estado, herramienta.activo = 'DISPONIBLE', True
+
+    HistorialBaja.objects.bulk_create([
+        HistorialBaja(herramienta=h, accion='REACTIVACION', motivo=MOTIVO_REACTIVACION, usuario=usuario)
+        for h in reactivadas
+    ])
+    movimientos.registrar(transiciones, 'REACTIVACION', usuario, ahora)
+    publicar_cambios(transiciones)
+    return reactivadas, cerrados
+
+# ==============================================================================
+# 4. MANTENCIÓN (LIBERACIÓN MASIVA)
+# ==============================================================================
+
+@transaction.atomic
+def liberar_herramientas(codigos, usuario, ubicaciones=None):
+    """
+    Devuelve a bodega las herramientas reparadas de 'codigos'. El UPDATE es
+    condicional (sólo las que siguen EN_MANTENCION y activas), así que un
+    código escaneado dos veces o liberado desde otro equipo no se procesa de
+    nuevo. Cierra la mantención abierta de cada una.
+    Devuelve (herramientas_liberadas, errores).
+    """
+    candidatas = filtrar_por_ubicacion(Herramienta.objects.select_for_update(), ubicaciones)
+    herramientas = {
+        h.codigo_qr: h
+        for h in candidatas.filter(codigo_qr__in=codigos, activo=True)
+    }
+
+    liberadas = []
+    errores = []
+    for codigo in dict.fromkeys(codigos):
+        herramienta = herramientas.get(codigo)
+        if herramienta is None:
+            errores.append(f"{codigo}: No existe o fue dado de baja.")
+        elif herramienta.estado != 'EN_MANTENCION':
+            errores.append(f"{codigo}: No está en mantención ({herramienta.estado}).")
+        else:
+            liberadas.append(herramienta)
+
+    if not liberadas:
+        return [], errores
+
+    ids = [h.id for h in liberadas]
+    ahora = timezone.now()
+    Herramienta.objects.filter(id__in=ids, estado='EN_MANTENCION', activo=True).update(estado='DISPONIBLE')
+    Mantencion.objects.filter(herramienta_id__in=ids, fecha_fin__isnull=True).update(
+        fecha_fin=ahora, usuario_cierre=usuario
+    )
+
+    for herramienta in liberadas:
+        herramienta.estado = 'DISPONIBLE'
+    transiciones = [(h, 'EN_MANTENCION', True) for h in liberadas]
+    movimientos.registrar(transiciones, 'LIBERACION', usuario, ahora)
+    publicar_cambios(transiciones)
+    return liberadas, errores
@@ -0,0 +1,95 @@
+"""
+Invalidación de la caché de listas ante cambios hechos fuera de las vistas
+(admin, shell, migraciones de datos), del caché de usuarios de
+autenticacion.py, y bitácora de las herramientas creadas o editadas con
+save() (los servicios registran sus propios movimientos).
+"""
+from django.contrib.auth.models import User, Group
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import Herramienta, Categoria, Ubicacion
+from .inventario import invalidar_inventario
+from .autenticacion import invalidar_usuarios
+from . import movimientos
+
+
+@receiver(post_init, sender=Herramienta)
+def recordar_ubicacion(sender, instance, **kwargs):
+    # Si la herramienta cambia de bodega hay que invalidar también la de origen
+    instance._ubicacion_original = instance.ubicacion_id
+    instance._estado_original = (instance.estado, instance.activo, instance.ubicacion_id)
+
+
+@receiver(post_save, sender=Herramienta)
+@receiver(post_delete, sender=Herramienta)
+def herramienta_modificada(sender, instance, **kwargs):
+    ubicaciones = [instance._ubicacion_original, instance.ubicacion_id]
+    instance._ubicacion_original = instance.ubicacion_id
+    transaction.on_commit(lambda: invalidar_inventario(ubicaciones))
+
+
+@receiver(post_save, sender=Herramienta)
+def registrar_movimiento(sender, instance, created, raw=False, using=None, **kwargs):
+    """
+    Alta o edición manual (admin, shell). El admin deja en _usuario_movimiento
+    quién guardó; la creación hace un segundo save() sólo con el QR, que no
+    cambia nada y no se registra.
+    """
+    if raw:
+        return  # loaddata
+    anterior = instance._estado_original
+    instance._estado_original = (instance.estado, instance.activo, instance.ubicacion_id)
+    usuario = getattr(instance, '_usuario_movimiento', None)
+    if created:
+        movimientos.registrar([(instance, None, None)], 'ALTA', usuario, using=using)
+    elif anterior != instance._estado_original:
+        # Cambio de estado, de activo o de bodega
+        movimientos.registrar([(instance, *anterior[:2])], 'EDICION', usuario, using=using)
+
+
+@receiver(post_save, sender=Categoria)
+@receiver(post_save, sender=Ubicacion)
+@receiver(post_delete, sender=Categoria)
+@receiver(post_delete, sender=Ubicacion)
+def maestro_modificado(sender, **kwargs):
+    transaction.on_commit(invalidar_inventario)
+
+
+# --- Caché de usuarios (autenticacion.py) ---
+
+def _invalidar_usuarios(ids=None):
+    # Ahora y al confirmar: un worker que recargue entre medio (todavía con
+    # los datos viejos) vuelve a recargar después del commit
+    invalidar_usuarios(ids)
+    transaction.on_commit(lambda: invalidar_usuarios(ids))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def usuario_modificado(sender, instance, **kwargs):
+    # Incluye el cambio de clave: la sesión se valida contra el hash nuevo
+    _invalidar_usuarios([instance.pk])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=Ubicacion.bodegueros.through)
+def relaciones_usuario_modificadas(sender, instance, action, pk_set, **kwargs):
+    """Grupos, permisos o bodegas asignadas: vale desde el lado del usuario o del otro modelo."""
+    if not action.startswith('post_'):
+        return
+    if isinstance(instance, User):
+        ids = [instance.pk]
+    else:
+        ids = pk_set  # None en un clear() desde el grupo o la bodega: se invalidan todos
+    _invalidar_usuarios(ids)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+@receiver(post_delete, sender=Group)
+def grupo_modificado(sender, **kwargs):
+    # Afecta a todos sus miembros: se recargan todos los usuarios
+    if kwargs.get('action', 'post_').startswith('post_'):
+        _invalidar_usuarios()
@@ -0,0 +1,73 @@
+// Conteo físico de inventario: los códigos escaneados se juntan en el
+// navegador y se mandan en lotes (ver bodega/conteos.py). Si la señal se
+// corta, el lote vuelve a la cola y se reintenta; un código repetido no se
+// vuelve a enviar. La configuración llega en data-* del elemento:
+//   data-url-lecturas, data-lote-maximo
+
+function LectorConteo(elemento, csrf, alResponder) {
+    this.url = elemento.dataset.urlLecturas;
+    this.loteMaximo = parseInt(elemento.dataset.loteMaximo, 10) || 500;
+    this.csrf = csrf;
+    this.alResponder = alResponder;  // (resultados, totalLecturas) tras cada lote
+    this.vistos = new Set();
+    this.cola = [];
+    this.enviando = false;
+    this.temporizador = null;
+}
+
+// Devuelve false si el código ya se había leído en este navegador
+LectorConteo.prototype.agregar = function (codigo) {
+    codigo = (codigo || '').trim();
+    if (!codigo || this.vistos.has(codigo)) return false;
+    this.vistos.add(codigo);
+    this.cola.push(codigo);
+    // Lote lleno: se envía ya; si no, se espera un poco a juntar más lecturas
+    if (this.cola.length >= this.loteMaximo) this.enviar();
+    else if (!this.temporizador) this.temporizador = setTimeout(() => this.enviar(), 1500);
+    return true;
+};
+
+LectorConteo.prototype.pendientes = function () {
+    return this.cola.length;
+};
+
+LectorConteo.prototype.enviar = async function () {
+    clearTimeout(this.temporizador);
+    this.temporizador = null;
+    if (this.enviando || !this.cola.length) return;
+    this.enviando = true;
+    const lote = this.cola.splice(0, this.loteMaximo);
+    try {
+        const response = await fetch(this.url, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: { 'Content-Type': 'application/json', 'X-CSRFToken': this.csrf },
+            body: JSON.stringify({ codigos: lote }),
+        });
+        const data = await response.json().catch(() => ({}));
+        if (response.status === 409) throw new Error('cerrado');
+        if (!response.ok) throw new Error(data.error || 'Error ' + response.status);
+        this.alResponder(data.resultados, data.lecturas);
+    } catch (error) {
+        if (error.message === 'cerrado') {
+            this.alResponder(null, null, 'El conteo fue cerrado: las lecturas pendientes no se guardaron.');
+            this.cola = [];
+        } else {
+            // Sin red o error del servidor: el lote vuelve al principio de la cola
+            this.cola = lote.concat(this.cola);
+            this.temporizador = setTimeout(() => this.enviar(), 5000);
+        }
+    } finally {
+        this.enviando = false;
+    }
+    if (this.cola.length && !this.temporizador) this.enviar();
+};
+
+// Envía todo lo pendiente (antes de cerrar el conteo). Devuelve true si la cola quedó vacía.
+LectorConteo.prototype.vaciar = async function () {
+    for (let intento = 0; intento < 10 && (this.cola.length || this.enviando); intento++) {
+        if (this.enviando) await new Promise(listo => setTimeout(listo, 300));
+        else await this.enviar();
+    }
+    return !this.cola.length && !this.enviando;
+};
@@ -0,0 +1,54 @@
+// Código compartido por todas las páginas. Las URLs llegan en data-* del <body>
+// para que este archivo sea estático (cacheable, empaquetado en base.js).
+
+// CANAL EN VIVO: SSE si el servidor corre en ASGI, polling si corre en Gunicorn (WSGI)
+function suscribirEventos(ultimo, alRecibir) {
+    var urlStream = document.body.dataset.urlStream;
+    var urlPoll = document.body.dataset.urlPoll;
+
+    function entregar(evento) {
+        ultimo = evento.id;
+        alRecibir(evento);
+    }
+
+    function poll() {
+        fetch(urlPoll + '?desde=' + ultimo)
+            .then(response => response.json())
+            .then(data => {
+                // El servidor perdió nuestra secuencia (caché reiniciada / eventos vencidos)
+                if (data.recargar) { window.location.reload(); return; }
+                data.eventos.forEach(entregar);
+                ultimo = data.ultimo; // Avanza aunque los eventos sean de otra bodega
+                setTimeout(poll, data.reintentar);
+            })
+            .catch(() => setTimeout(poll, 5000));
+    }
+
+    if (!window.EventSource) { poll(); return; }
+
+    var fuente = new EventSource(urlStream + '?desde=' + ultimo);
+    fuente.onmessage = e => entregar(JSON.parse(e.data));
+    fuente.addEventListener('recargar', () => window.location.reload());
+    fuente.onerror = () => {
+        // CLOSED = el servidor rechazó el stream (WSGI), pasamos a polling
+        if (fuente.readyState === EventSource.CLOSED) poll();
+    };
+}
+
+// Suma los deltas de un evento a los contadores marcados con data-kpi
+function aplicarKpis(evento) {
+    Object.entries(evento.kpis || {}).forEach(([kpi, delta]) => {
+        document.querySelectorAll('[data-kpi="' + kpi + '"]').forEach(el => {
+            el.textContent = parseInt(el.textContent, 10) + delta;
+        });
+    });
+}
+
+// CACHÉ OFFLINE: el service worker guarda los assets con hash para que las
+// visitas siguientes (y el escáner sin internet) no los vuelvan a descargar
+if ('serviceWorker' in navigator && document.body.dataset.serviceWorker) {
+    window.addEventListener('load', () => {
+        navigator.serviceWorker.register(document.body.dataset.serviceWorker, { scope: '/' })
+            .catch(error => console.log('Service worker no registrado:', error));
+    });
+}
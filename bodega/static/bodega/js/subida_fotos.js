@@ -0,0 +1,102 @@
+// Fotos de evidencia: se reducen en el navegador y se suben por partes,
+// reanudando si la señal se corta (ver bodega/subidas.py). La configuración
+// llega en data-* del elemento que se pasa a new SubidorFotos(...):
+//   data-url-subidas, data-lado-maximo, data-calidad
+
+function SubidorFotos(elemento, csrf) {
+    this.url = elemento.dataset.urlSubidas;
+    this.ladoMaximo = parseInt(elemento.dataset.ladoMaximo, 10) || 1600;
+    this.calidad = parseFloat(elemento.dataset.calidad) || 0.8;
+    this.csrf = csrf;
+    this.pendientes = new Set();
+}
+
+// 1. REDUCCIÓN: la foto de la cámara (4-12 MB) queda en unos cientos de KB
+SubidorFotos.prototype.reducir = async function (archivo) {
+    if (!window.createImageBitmap) return archivo;
+    let imagen;
+    try {
+        imagen = await createImageBitmap(archivo, { imageOrientation: 'from-image' });
+    } catch (error) {
+        return archivo; // Formato que el navegador no decodifica (HEIC): va tal cual
+    }
+    const escala = Math.min(1, this.ladoMaximo / Math.max(imagen.width, imagen.height));
+    const lienzo = document.createElement('canvas');
+    lienzo.width = Math.round(imagen.width * escala);
+    lienzo.height = Math.round(imagen.height * escala);
+    lienzo.getContext('2d').drawImage(imagen, 0, 0, lienzo.width, lienzo.height);
+    imagen.close();
+    const reducida = await new Promise(ok => lienzo.toBlob(ok, 'image/jpeg', this.calidad));
+    return (reducida && reducida.size < archivo.size) ? reducida : archivo;
+};
+
+SubidorFotos.prototype._pedir = async function (url, opciones) {
+    const response = await fetch(url, Object.assign({ credentials: 'same-origin' }, opciones, {
+        headers: Object.assign({ 'X-CSRFToken': this.csrf }, opciones.headers || {}),
+    }));
+    const data = await response.json().catch(() => ({}));
+    return { status: response.status, data: data };
+};
+
+// 2. SUBIDA POR PARTES. alAvanzar(fraccion) para la barra de progreso.
+// Devuelve el id de la subida completa.
+SubidorFotos.prototype._subir = async function (blob, nombre, alAvanzar) {
+    let r = await this._pedir(this.url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ nombre: nombre, tamano: blob.size }),
+    });
+    if (r.status !== 201) throw new Error(r.data.error || 'No se pudo iniciar la subida.');
+    const id = r.data.id;
+    const tamanoParte = r.data.parte;
+    const urlSubida = this.url + id + '/';
+    let recibido = 0;
+    let intentos = 0;
+
+    while (recibido < blob.size) {
+        const parte = blob.slice(recibido, recibido + tamanoParte);
+        try {
+            r = await this._pedir(urlSubida, {
+                method: 'PUT',
+                headers: { 'Upload-Offset': String(recibido), 'Content-Type': 'application/octet-stream' },
+                body: parte,
+            });
+        } catch (error) {
+            r = { status: 0, data: {} }; // Sin red
+        }
+        if (r.status === 200) {
+            recibido = r.data.recibido;
+            intentos = 0;
+            alAvanzar(recibido / blob.size);
+            continue;
+        }
+        if (r.status === 400 || r.status === 404) throw new Error(r.data.error || 'Subida rechazada.');
+
+        // Corte de red, 409 o error del servidor: esperamos y preguntamos cuánto llegó
+        if (++intentos > 8) throw new Error('Sin conexión: la foto no se pudo subir.');
+        await new Promise(ok => setTimeout(ok, Math.min(30000, 1000 * 2 ** intentos)));
+        try {
+            const estado = await this._pedir(urlSubida, { method: 'GET' });
+            if (estado.status === 200) recibido = estado.data.recibido;
+            if (estado.status === 404) throw new Error('La subida expiró.');
+        } catch (error) {
+            if (error.message === 'La subida expiró.') throw error;
+        }
+    }
+    return id;
+};
+
+// Reduce y sube; la promesa queda en 'pendientes' hasta que termina
+SubidorFotos.prototype.subir = function (archivo, alAvanzar) {
+    const tarea = this.reducir(archivo)
+        .then(blob => this._subir(blob, archivo.name, alAvanzar || (() => {})));
+    this.pendientes.add(tarea);
+    const quitar = () => this.pendientes.delete(tarea);
+    tarea.then(quitar, quitar);
+    return tarea;
+};
+
+// Espera las subidas en curso antes de enviar el formulario
+SubidorFotos.prototype.esperar = function () {
+    return Promise.allSettled(Array.from(this.pendientes));
+};
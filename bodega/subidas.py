@@ -0,0 +1,160 @@
+"""
+Subida por partes (reanudable) de las fotos de evidencia.
+
+El navegador reduce la foto antes de enviarla (ver static/bodega/js/subida_fotos.js)
+y la sube en trozos de SUBIDA_PARTE_BYTES: cada trozo indica su posición
+(cabecera Upload-Offset) y se guarda como un archivo aparte en SUBIDAS_DIR.
+Si la conexión se corta, el cliente pregunta cuánto llegó y sigue desde ahí;
+un trozo repetido (el servidor lo guardó pero la respuesta se perdió) se
+acepta sin volver a escribirlo. Con el último trozo las partes se unen, se
+valida que sea una imagen y se guarda en 'evidencias/' como cualquier foto.
+
+La devolución ya no lleva las fotos: sólo los ids de SubidaFoto completas.
+"""
+import os
+import shutil
+import tempfile
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.utils import timezone
+
+from .models import SubidaFoto
+
+
+class SubidaInvalida(Exception):
+    """Parte rechazada. 'status' es el código HTTP que corresponde (400, 404 o 409)."""
+
+    def __init__(self, mensaje, status=400):
+        super().__init__(mensaje)
+        self.status = status
+
+
+def _directorio(subida):
+    return os.path.join(settings.SUBIDAS_DIR, str(subida.id))
+
+# ==============================================================================
+# 1. RECEPCIÓN DE PARTES
+# ==============================================================================
+
+def crear(usuario, nombre, tamano):
+    if not isinstance(tamano, int) or not 0 < tamano <= settings.SUBIDA_TAMANO_MAXIMO:
+        raise SubidaInvalida(f"El tamaño debe estar entre 1 y {settings.SUBIDA_TAMANO_MAXIMO} bytes.")
+    return SubidaFoto.objects.create(usuario=usuario, nombre=str(nombre)[:255], tamano=tamano)
+
+
+def recibir_parte(subida, offset, datos):
+    """
+    Guarda el trozo que empieza en 'offset' y devuelve la subida actualizada.
+    Sólo se acepta el trozo siguiente a lo recibido; uno ya recibido se ignora.
+    """
+    if subida.archivo:
+        return subida
+    fin = offset + len(datos)
+    if not datos or len(datos) > settings.SUBIDA_PARTE_BYTES or fin > subida.tamano:
+        raise SubidaInvalida("Parte vacía, demasiado grande o fuera del tamaño declarado.")
+    if fin <= subida.recibido:
+        return subida  # Reintento de una parte que ya llegó
+    if offset != subida.recibido:
+        raise SubidaInvalida(f"Se esperaba la parte que empieza en {subida.recibido}.", status=409)
+
+    directorio = _directorio(subida)
+    os.makedirs(directorio, exist_ok=True)
+    with open(os.path.join(directorio, f"{offset:010d}"), 'wb') as parte:
+        parte.write(datos)
+
+    # Condicional: si dos reintentos llegan juntos sólo uno avanza el contador
+    if not SubidaFoto.objects.filter(id=subida.id, recibido=offset).update(recibido=fin):
+        subida.refresh_from_db()
+        return subida
+    subida.recibido = fin
+    if fin == subida.tamano:
+        ensamblar(subida)
+    return subida
+
+
+def ensamblar(subida):
+    """Une las partes en orden, valida la imagen y la guarda en subida.archivo."""
+    # Import diferido: PIL sólo se carga al cerrar una subida
+    from PIL import Image, UnidentifiedImageError
+
+    directorio = _directorio(subida)
+    with tempfile.TemporaryFile() as unida:
+        for nombre in sorted(os.listdir(directorio)):
+            with open(os.path.join(directorio, nombre), 'rb') as parte:
+                shutil.copyfileobj(parte, unida)
+        try:
+            unida.seek(0)
+            imagen = Image.open(unida)
+            formato = imagen.format
+            imagen.verify()
+        except (UnidentifiedImageError, OSError, SyntaxError):
+            descartar(subida)
+            raise SubidaInvalida("El archivo recibido no es una imagen válida.")
+        unida.seek(0)
+        # La extensión sale del contenido, no del nombre que mandó el cliente
+        extension = 'jpg' if formato == 'JPEG' else formato.lower()
+        subida.archivo.save(f"{subida.id}.{extension}", File(unida), save=False)
+    SubidaFoto.objects.filter(id=subida.id).update(archivo=subida.archivo.name)
+    shutil.rmtree(directorio, ignore_errors=True)
+
+# ==============================================================================
+# 2. USO EN LA DEVOLUCIÓN Y LIMPIEZA
+# ==============================================================================
+
+def fotos_completas(usuario, ids):
+    """{id (str): nombre del archivo} de las subidas terminadas de 'usuario'."""
+    validos = []
+    for valor in ids:
+        try:
+            validos.append(SubidaFoto._meta.pk.to_python(valor))
+        except ValidationError:
+            continue  # Id mal formado: se ignora como si no hubiera foto
+    if not validos:
+        return {}
+    return {
+        str(subida_id): archivo
+        for subida_id, archivo in SubidaFoto.objects.filter(
+            id__in=validos, usuario=usuario
+        ).exclude(archivo='').exclude(archivo__isnull=True).values_list('id', 'archivo')
+    }
+
+
+def marcar_usadas(fotos, devueltos):
+    """
+    Las fotos que quedaron en un DetallePrestamo devuelto pasan a ser de él:
+    se borra el registro de la subida, no el archivo (la referencia es ahora
+    del detalle). Las de ítems rechazados (código errado, no estaba prestado)
+    conservan su registro para reintentar la devolución; si nadie las usa,
+    limpiar() las borra con su archivo.
+
+    Se cuenta por nombre y no por pertenencia: con el storage por contenido
+    dos subidas de la misma foto tienen el mismo nombre, y cada una aporta
+    su propia referencia.
+    """
+    en_detalles = Counter(d.foto_evidencia.name for d in devueltos if d.foto_evidencia)
+    usadas = []
+    for subida_id, archivo in fotos.items():
+        if en_detalles[archivo] > 0:
+            en_detalles[archivo] -= 1
+            usadas.append(subida_id)
+    if usadas:
+        SubidaFoto.objects.filter(id__in=usadas).delete()
+
+
+def descartar(subida, con_archivo=False):
+    shutil.rmtree(_directorio(subida), ignore_errors=True)
+    if con_archivo and subida.archivo:
+        subida.archivo.delete(save=False)
+    SubidaFoto.objects.filter(id=subida.id).delete()
+
+
+def limpiar(horas):
+    """Borra las subidas sin terminar o sin usar de hace más de 'horas'. Devuelve cuántas."""
+    viejas = list(SubidaFoto.objects.filter(creada__lt=timezone.now() - timedelta(hours=horas)))
+    for subida in viejas:
+        descartar(subida, con_archivo=True)
+    return len(viejas)
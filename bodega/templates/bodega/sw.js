@@ -0,0 +1,42 @@
+// Service worker de SmartStockQR (generado por views.service_worker).
+// Guarda los assets estáticos con hash: nunca cambian, así que se sirven desde
+// la caché sin tocar la red. Las páginas y la API siempre van al servidor.
+const VERSION = 'smartstock-{{ version }}';
+const PRECARGA = {{ precarga|safe }};
+const PREFIJO_STATIC = '{{ static_url }}';
+
+self.addEventListener('install', evento => {
+    // Uno a uno: si falta un archivo no se pierde el resto de la precarga
+    evento.waitUntil(
+        caches.open(VERSION)
+            .then(cache => Promise.all(PRECARGA.map(url => cache.add(url).catch(() => null))))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', evento => {
+    // Borra las cachés de versiones anteriores (otros hashes)
+    evento.waitUntil(
+        caches.keys()
+            .then(nombres => Promise.all(
+                nombres.filter(nombre => nombre.startsWith('smartstock-') && nombre !== VERSION)
+                    .map(nombre => caches.delete(nombre))
+            ))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', evento => {
+    const url = new URL(evento.request.url);
+    if (evento.request.method !== 'GET' || url.origin !== self.location.origin || !url.pathname.startsWith(PREFIJO_STATIC)) {
+        return;
+    }
+    evento.respondWith(
+        caches.open(VERSION).then(cache =>
+            cache.match(evento.request).then(guardada => guardada || fetch(evento.request).then(respuesta => {
+                if (respuesta.ok) cache.put(evento.request, respuesta.clone());
+                return respuesta;
+            }))
+        )
+    );
+});
@@ -0,0 +1,26 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html_join
+
+from bodega.assets import archivos_de, existe, origen, VENDOR_DIR
+
+register = template.Library()
+
+
+@register.simple_tag
+def paquete(nombre):
+    """
+    <link>/<script> de un paquete de bodega/assets.py:
+        {% paquete 'base.css' %}  {% paquete 'escaner.js' %}
+    """
+    urls = [static(ruta) if ruta else externa for ruta, externa in archivos_de(nombre)]
+    if nombre.endswith('.css'):
+        return format_html_join('\n', '<link rel="stylesheet" href="{}">', ((url,) for url in urls))
+    return format_html_join('\n', '<script src="{}"></script>', ((url,) for url in urls))
+
+
+@register.simple_tag
+def vendor(archivo):
+    """URL de un archivo vendorizado suelto (p. ej. el sonido del escáner), o su origen si falta."""
+    ruta = f'{VENDOR_DIR}/{archivo}'
+    return static(ruta) if existe(ruta) else origen(ruta)
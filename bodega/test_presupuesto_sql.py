@@ -0,0 +1,228 @@
+import json
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse, get_resolver
+from django.utils import timezone
+
+from .models import Categoria, Ubicacion, Trabajador, Herramienta, Prestamo, DetallePrestamo, HistorialBaja, ConteoInventario, SubidaFoto, TrabajoReporte
+from .nomina import digito_verificador
+from .perfilador import guardar as guardar_perfil
+from .saldos import recalcular as recalcular_saldos
+
+# ==============================================================================
+# PRESUPUESTO DE CONSULTAS SQL POR VISTA
+# ==============================================================================
+# Cada URL de bodega/urls.py tiene un máximo de consultas. Además se mide con
+# 10 y con 1000 filas por tabla: si la cantidad de consultas crece con los
+# datos, la vista volvió a tener un N+1 y el test falla.
+#
+#     python manage.py test bodega.test_presupuesto_sql --settings=smartstock.settings_test
+
+FILAS_POCAS = 10
+FILAS_MUCHAS = 1000
+
+ESTADOS_SEMBRADOS = ('DISPONIBLE', 'EN_USO', 'EN_MANTENCION', 'DE_BAJA')
+
+
+def _rut(etiqueta, i):
+    """RUT válido y distinto por siembra (la API por RUT rechaza los inválidos)."""
+    cuerpo = str(ord(etiqueta) * 100000 + i)
+    return f'{cuerpo}-{digito_verificador(cuerpo)}'
+
+
+def _sembrar(n, etiqueta, categoria, ubicacion, bodeguero):
+    """
+    Crea n trabajadores y n herramientas repartidas entre los estados, con
+    sus préstamos (abiertos para las que están en uso, cerrados para el
+    resto), los saldos por trabajador y el historial de las bajas, más n
+    subidas de fotos y n reportes terminados del bodeguero. Devuelve una
+    muestra de cada tipo para construir las URLs con parámetros.
+    """
+    trabajadores = Trabajador.objects.bulk_create([
+        Trabajador(rut=_rut(etiqueta, i), nombre=f'Nombre {i}', apellido=f'Apellido {i}', cargo='Maestro')
+        for i in range(n)
+    ])
+    herramientas = Herramienta.objects.bulk_create([
+        Herramienta(
+            codigo_qr=f'HER-{etiqueta}{i}', nombre=f'Herramienta {i}', marca=f'Marca {i % 7}',
+            categoria=categoria, ubicacion=ubicacion,
+            estado=ESTADOS_SEMBRADOS[i % len(ESTADOS_SEMBRADOS)],
+            activo=ESTADOS_SEMBRADOS[i % len(ESTADOS_SEMBRADOS)] != 'DE_BAJA',
+        )
+        for i in range(n)
+    ])
+    prestamos = Prestamo.objects.bulk_create([
+        Prestamo(trabajador=trabajadores[i], bodeguero=bodeguero) for i in range(n)
+    ])
+    DetallePrestamo.objects.bulk_create([
+        DetallePrestamo(
+            prestamo=prestamo, herramienta=herramienta,
+            devuelto=herramienta.estado != 'EN_USO',
+            estado_devolucion=None if herramienta.estado == 'EN_USO' else 'DISPONIBLE',
+        )
+        for prestamo, herramienta in zip(prestamos, herramientas)
+    ])
+    HistorialBaja.objects.bulk_create([
+        HistorialBaja(herramienta=h, accion='BAJA', motivo='Baja Administrativa', usuario=bodeguero)
+        for h in herramientas if not h.activo
+    ])
+    recalcular_saldos([t.id for t in trabajadores])
+    subidas = SubidaFoto.objects.bulk_create([
+        SubidaFoto(usuario=bodeguero, nombre=f'falla-{etiqueta}{i}.jpg', tamano=1000, recibido=i % 1000)
+        for i in range(n)
+    ])
+    trabajos = TrabajoReporte.objects.bulk_create([
+        TrabajoReporte(tipo='BAJAS', usuario=bodeguero, estado='LISTO', progreso=100, filas=i,
+                       archivo=f'reportes/{etiqueta}{i}.csv', terminado=timezone.now())
+        for i in range(n)
+    ])
+    # El que se descarga necesita el archivo de verdad
+    trabajos[0].archivo.save(f'{etiqueta}.csv', ContentFile(b'Fecha;QR\n'))
+
+    muestra = {estado: next(h for h in herramientas if h.estado == estado) for estado in ESTADOS_SEMBRADOS}
+    muestra['trabajador'] = trabajadores[0]
+    muestra['subida'] = subidas[0]
+    muestra['trabajo'] = trabajos[0]
+    return muestra
+
+
+def _json(datos):
+    return {'data': json.dumps(datos), 'content_type': 'application/json'}
+
+
+# nombre de la URL -> (máximo de consultas, método, kwargs de la URL, cuerpo)
+# Los kwargs y el cuerpo se construyen con la muestra de cada siembra, para que
+# las vistas que modifican datos actúen sobre filas "frescas" en ambas medidas.
+PRESUPUESTOS = {
+    'inicio': (7, 'get', None, None),
+    'service_worker': (0, 'get', None, None),
+    'prestamo': (3, 'get', None, None),
+    'devolucion': (2, 'get', None, None),
+    'consultar_stock': (8, 'get', None, None),
+    'reactivar_herramienta': (12, 'get', lambda m: {'id': m['DE_BAJA'].id}, None),
+    'api_verificar': (4, 'get', None, lambda m: {'data': {'codigo': m['DISPONIBLE'].codigo_qr}}),
+    'api_verificar_lote': (4, 'post', None,
+                           lambda m: _json({'codigos': [m[e].codigo_qr for e in ESTADOS_SEMBRADOS]})),
+    'api_prestamo': (14, 'post', None,
+                     lambda m: _json({'trabajador': m['trabajador'].id, 'codigos': [m['DISPONIBLE'].codigo_qr]})),
+    'api_devolucion': (13, 'post', None,
+                       lambda m: _json({'items': [{'codigo': m['EN_USO'].codigo_qr, 'estado': 'DISPONIBLE'}]})),
+    'api_liberar_mantencion': (9, 'post', None,
+                               lambda m: _json({'codigos': [m['EN_MANTENCION'].codigo_qr]})),
+    'api_crear_subida': (3, 'post', None, lambda m: _json({'nombre': 'falla.jpg', 'tamano': 100})),
+    'api_subida': (3, 'get', lambda m: {'subida_id': m['subida'].id}, None),
+    'api_trabajo': (3, 'get', lambda m: {'trabajo_id': m['trabajo'].id}, None),
+    'api_lecturas_conteo': (7, 'post', lambda m: {'conteo_id': m['conteo'].id},
+                            lambda m: _json({'codigos': [m['DISPONIBLE'].codigo_qr, m['EN_USO'].codigo_qr, 'NO-EXISTE']})),
+    'api_eventos': (3, 'get', None, None),
+    'stream_eventos': (2, 'get', None, None),
+    'api_herramientas': (4, 'get', None, lambda m: {'data': {'fields': 'codigo_qr,ubicacion_nombre'}}),
+    'menu_reportes': (2, 'get', None, None),
+    'reportes': (5, 'get', None, None),
+    'en_mantencion': (5, 'get', None, None),
+    'herramientas_disponibles': (4, 'get', None, None),
+    'herramientas_en_uso': (4, 'get', None, None),
+    'lista_trabajadores': (3, 'get', None, None),
+    'perfil_trabajador': (4, 'get', lambda m: {'id': m['trabajador'].id}, None),
+    'api_trabajador': (4, 'get', lambda m: {'rut': m['trabajador'].rut}, None),
+    'historial_transacciones': (4, 'get', None, None),
+    'estadisticas': (5, 'get', None, None),
+    'reporte_bajas': (5, 'get', None, None),
+    'analitica_uso': (9, 'get', None, None),
+    'stock_historico': (6, 'get', None, None),
+    'perfiles': (2, 'get', None, None),
+    'descargar_perfil': (2, 'get', lambda m: {'nombre': m['perfil']}, None),
+    'generar_reporte': (3, 'post', lambda m: {'tipo': 'BAJAS'}, None),
+    'trabajos': (3, 'get', None, None),
+    'descargar_trabajo': (3, 'get', lambda m: {'trabajo_id': m['trabajo'].id}, None),
+    'conteos': (5, 'get', None, None),
+    'ver_conteo': (6, 'get', lambda m: {'conteo_id': m['conteo'].id}, None),
+    'cerrar_conteo': (10, 'post', lambda m: {'conteo_id': m['conteo'].id}, None),
+    'imprimir_qr': (4, 'get', lambda m: {'herramienta_id': m['DISPONIBLE'].id}, None),
+    'liberar_herramienta': (8, 'post', lambda m: {'herramienta_id': m['EN_MANTENCION'].id}, None),
+    'liberar_lote': (7, 'post', None, lambda m: {'data': {'codigos': [m['EN_MANTENCION'].codigo_qr]}}),
+    'eliminar_herramienta': (12, 'get', lambda m: {'id': m['DISPONIBLE'].id}, None),
+    'eliminar_trabajador': (4, 'get', lambda m: {'id': m['trabajador'].id}, None),
+    'eliminar_ubicacion': (4, 'get', lambda m: {'id': m['ubicacion'].id}, None),
+    'eliminar_categoria': (4, 'get', lambda m: {'id': m['categoria'].id}, None),
+}
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    PERFILADOR_DIR=tempfile.mkdtemp(),
+    DATABASE_ROUTERS=[],  # Todo contra 'default', para contar en una sola conexión
+)
+class PresupuestoConsultasTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bodeguero = User.objects.create_user('bodeguero', password='x', is_staff=True)
+        cls.categoria = Categoria.objects.create(nombre='General')
+        cls.ubicacion = Ubicacion.objects.create(nombre='Central')
+        # Bodeguero con bodega asignada: se ejercita también el filtro por ubicación
+        cls.ubicacion.bodegueros.add(cls.bodeguero)
+
+    def setUp(self):
+        self.client.force_login(self.bodeguero)
+
+    def _muestra(self, n, etiqueta):
+        muestra = _sembrar(n, etiqueta, self.categoria, self.ubicacion, self.bodeguero)
+        # Maestros propios para las vistas que los desactivan
+        muestra['categoria'] = Categoria.objects.create(nombre=f'Categoría {etiqueta}')
+        muestra['ubicacion'] = Ubicacion.objects.create(nombre=f'Ubicación {etiqueta}')
+        muestra['conteo'] = ConteoInventario.objects.create(ubicacion=self.ubicacion, usuario=self.bodeguero)
+        # Un perfil guardado de verdad, para medir la descarga y no el 404
+        perfil_id = f"{time.time_ns():020d}-0"
+        guardar_perfil({'id': perfil_id}, 'vista;consulta 1', 'folded')
+        muestra['perfil'] = f'{perfil_id}.json'
+        return muestra
+
+    def _contar(self, nombre, muestra):
+        _, metodo, kwargs, cuerpo = PRESUPUESTOS[nombre]
+        url = reverse(nombre, kwargs=kwargs(muestra) if kwargs else None)
+        # Sin caché: queremos medir el render completo, no un fragmento guardado
+        cache.clear()
+        with CaptureQueriesContext(connections['default']) as consultas:
+            response = getattr(self.client, metodo)(url, **(cuerpo(muestra) if cuerpo else {}))
+            if response.streaming:
+                b''.join(response.streaming_content)  # Las consultas ocurren al consumirla
+        # Se mide el camino exitoso, no un 404 o un 400. stream_eventos responde 501 a propósito fuera de ASGI.
+        if nombre == 'stream_eventos':
+            self.assertEqual(response.status_code, 501)
+        else:
+            self.assertLess(response.status_code, 400, f"{nombre} respondió {response.status_code}")
+        return len(consultas), consultas
+
+    def test_todas_las_urls_tienen_presupuesto(self):
+        nombres = {
+            patron.name for patron in get_resolver('bodega.urls').url_patterns if patron.name
+        }
+        self.assertEqual(nombres - PRESUPUESTOS.keys(), set(), "URLs nuevas sin presupuesto de consultas")
+
+    def test_consultas_no_crecen_con_los_datos(self):
+        pocas = self._muestra(FILAS_POCAS, 'p')
+        medidas_pocas = {nombre: self._contar(nombre, pocas) for nombre in PRESUPUESTOS}
+
+        muchas = self._muestra(FILAS_MUCHAS, 'm')
+        for nombre, (maximo, *_) in PRESUPUESTOS.items():
+            with self.subTest(url=nombre):
+                total_pocas, _ = medidas_pocas[nombre]
+                total_muchas, consultas = self._contar(nombre, muchas)
+                detalle = "\n".join(q['sql'] for q in consultas.captured_queries)
+                self.assertEqual(
+                    total_pocas, total_muchas,
+                    f"{nombre}: {total_pocas} consultas con {FILAS_POCAS} filas y "
+                    f"{total_muchas} con {FILAS_MUCHAS} (¿N+1?)\n{detalle}"
+                )
+                self.assertLessEqual(
+                    total_muchas, maximo,
+                    f"{nombre}: {total_muchas} consultas, presupuesto {maximo}\n{detalle}"
+                )
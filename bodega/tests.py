@@ -1,3 +1,1230 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from asgiref.sync import iscoroutinefunction
+from django.contrib.auth.models import User
+from django.core import checks, mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, storages
+from django.core.management import call_command
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Categoria, Ubicacion, Herramienta, Trabajador, MovimientoHerramienta, DetallePrestamo, SubidaFoto, ContenidoArchivo, HistorialBaja, TrabajoReporte, ConteoInventario, LecturaConteo, Mantencion, SaldoTrabajador, AlertaAtraso
+from . import analitica, assets, compresion, conteos, nomina, trabajos
+from .admin import TrabajadorForm
+from .almacen import AlmacenContenido, limpiar as limpiar_almacen
+from .eventos import BusEventos
+from .filtros import leer_rango
+from .movimientos import estado_en, stock_en, tomar_corte
+from .servicios import prestar_herramientas, devolver_herramientas, liberar_herramientas, dar_de_baja, reactivar
+from .perfilador import PerfiladorMiddleware
+from .routers import COOKIE_PRIMARIA, EscrituraRecienteMiddleware
+
+# ==============================================================================
+# RÉPLICA DE REPORTES
+# ==============================================================================
+# Se ejecuta con smartstock.settings_test, donde 'reportes' es una segunda base
+# SQLite. Sembramos datos distintos en cada base para saber desde cuál leyó
+# cada vista.
+
+def _sembrar(alias, nombre, activo):
+    categoria = Categoria.objects.using(alias).create(nombre='General')
+    ubicacion = Ubicacion.objects.using(alias).create(nombre='Central')
+    # bulk_create no pasa por Herramienta.save() (no genera imágenes QR)
+    Herramienta.objects.using(alias).bulk_create([
+        Herramienta(codigo_qr=f'HER-{alias}', nombre=nombre, marca='Bosch',
+                    categoria=categoria, ubicacion=ubicacion, activo=activo,
+                    estado='DISPONIBLE' if activo else 'DE_BAJA')
+    ])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RouterReportesTests(TestCase):
+    databases = {'default', 'reportes'}
+
+    def setUp(self):
+        _sembrar('default', 'Taladro Principal', activo=True)
+        _sembrar('reportes', 'Esmeril Replica', activo=False)
+        self.admin = User.objects.create_user('admin', password='x', is_staff=True)
+        self.client.force_login(self.admin)
+
+    def test_reporte_lee_desde_replica(self):
+        response = self.client.get(reverse('reporte_bajas'))
+        self.assertContains(response, 'Esmeril Replica')
+
+    def test_vistas_operativas_leen_desde_principal(self):
+        response = self.client.get(reverse('consultar_stock'))
+        self.assertContains(response, 'Taladro Principal')
+        self.assertNotContains(response, 'Esmeril Replica')
+
+    def test_escritura_reciente_lee_propios_cambios(self):
+        herramienta = Herramienta.objects.get(codigo_qr='HER-default')
+        self.client.get(reverse('eliminar_herramienta', args=[herramienta.id]))
+        self.assertIn(COOKIE_PRIMARIA, self.client.cookies)
+
+        response = self.client.get(reverse('reporte_bajas'))
+        self.assertContains(response, 'Taladro Principal')
+        self.assertNotContains(response, 'Esmeril Replica')
+
+    def test_lectura_no_activa_lectura_propia(self):
+        self.client.get(reverse('consultar_stock'))
+        self.assertNotIn(COOKIE_PRIMARIA, self.client.cookies)
+
+    async def test_escritura_reciente_sin_hilo_bajo_asgi(self):
+        async def vista(request):
+            await Categoria.objects.acreate(nombre='Eléctricas')
+            return HttpResponse()
+        middleware = EscrituraRecienteMiddleware(vista)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(RequestFactory().get('/'))
+        self.assertIn(COOKIE_PRIMARIA, response.cookies)
+
+    def test_qr_se_guarda_en_la_base_del_insert(self):
+        herramienta = Herramienta.objects.using('reportes').create(
+            nombre='Sierra', marca='Makita', categoria=Categoria.objects.using('reportes').get(),
+            ubicacion=Ubicacion.objects.using('reportes').get()
+        )
+        guardada = Herramienta.objects.using('reportes').get(id=herramienta.id)
+        self.assertEqual(guardada.codigo_qr, f'HER-{herramienta.id}')
+        self.assertTrue(guardada.imagen_qr)
+        self.assertFalse(Herramienta.objects.using('default').filter(codigo_qr=guardada.codigo_qr).exists())
+
+
+# ==============================================================================
+# SESIONES Y USUARIOS CACHEADOS
+# ==============================================================================
+# Con cached_db + BackendUsuariosCacheados una petición repetida no debe tocar
+# la base para cargar la sesión ni request.user, y un cambio en el usuario
+# debe verse en la petición siguiente.
+
+@override_settings(
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+    AUTHENTICATION_BACKENDS=['bodega.autenticacion.BackendUsuariosCacheados'],
+    AUTH_CACHE_SEGUNDOS=300,
+)
+class UsuariosCacheadosTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user('bodeguero', password='x', is_staff=True)
+        self.client.force_login(self.usuario)
+        self.client.get(reverse('menu_reportes'))  # Llena sesión y usuario en caché
+
+    def test_peticion_repetida_sin_consultas(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('menu_reportes'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_usuario_desactivado_se_recarga(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usuario.is_active = False
+            self.usuario.save()
+        response = self.client.get(reverse('menu_reportes'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_cambio_de_bodegas_se_recarga(self):
+        central = Ubicacion.objects.create(nombre='Central')
+        Herramienta.objects.bulk_create([
+            Herramienta(codigo_qr='HER-1', nombre='Taladro Externo', marca='Bosch',
+                        categoria=Categoria.objects.create(nombre='General'),
+                        ubicacion=Ubicacion.objects.create(nombre='Otra'))
+        ])
+        self.assertContains(self.client.get(reverse('consultar_stock')), 'Taladro Externo')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            central.bodegueros.add(self.usuario)
+        self.assertNotContains(self.client.get(reverse('consultar_stock')), 'Taladro Externo')
+
+
+# ==============================================================================
+# BITÁCORA DE MOVIMIENTOS Y STOCK HISTÓRICO
+# ==============================================================================
+# Cada servicio deja su movimiento; el estado en un momento pasado debe ser el
+# mismo partiendo de cero o desde un corte.
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class BitacoraMovimientosTests(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('bodeguero', password='x', is_staff=True)
+        self.central = Ubicacion.objects.create(nombre='Central')
+        self.trabajador = Trabajador.objects.create(rut='1-9', nombre='Ana', apellido='Rojas', cargo='Maestro')
+        self.herramienta = Herramienta.objects.create(
+            nombre='Taladro', marca='Bosch', categoria=Categoria.objects.create(nombre='General'), ubicacion=self.central
+        )
+
+    def _ciclo(self):
+        """Alta, préstamo, devolución con falla, liberación y baja; momento tras cada paso."""
+        codigo = self.herramienta.codigo_qr
+        momentos = [timezone.now()]
+        prestar_herramientas(self.trabajador, self.usuario, [codigo])
+        momentos.append(timezone.now())
+        devolver_herramientas([{'codigo': codigo, 'estado': 'EN_MANTENCION'}], usuario=self.usuario)
+        momentos.append(timezone.now())
+        liberar_herramientas([codigo], self.usuario)
+        momentos.append(timezone.now())
+        dar_de_baja(Herramienta.objects.filter(id=self.herramienta.id), self.usuario)
+        momentos.append(timezone.now())
+        return momentos
+
+    def test_servicios_registran_cada_transicion(self):
+        momentos = self._ciclo()
+        self.assertEqual(
+            list(MovimientoHerramienta.objects.order_by('id').values_list('origen', 'estado')),
+            [('ALTA', 'DISPONIBLE'), ('PRESTAMO', 'EN_USO'), ('DEVOLUCION', 'EN_MANTENCION'),
+             ('LIBERACION', 'DISPONIBLE'), ('BAJA', 'DE_BAJA')]
+        )
+        esperados = ['DISPONIBLE', 'EN_USO', 'EN_MANTENCION', 'DISPONIBLE', 'DE_BAJA']
+        for momento, estado in zip(momentos, esperados):
+            self.assertEqual(estado_en(momento)[self.herramienta.id][0], estado)
+        self.assertEqual(stock_en(momentos[1], [self.central.id]), {(self.central.id, 'EN_USO'): 1})
+        self.assertEqual(estado_en(momentos[1], [self.central.id + 1]), {})
+
+    def test_corte_da_el_mismo_estado(self):
+        momentos = self._ciclo()
+        sin_corte = [estado_en(m) for m in momentos]
+        tomar_corte(momentos[2])
+        self.assertEqual([estado_en(m) for m in momentos], sin_corte)
+
+    def test_edicion_manual_y_solo_insercion(self):
+        self.herramienta._usuario_movimiento = self.usuario
+        self.herramienta.estado = 'EN_MANTENCION'
+        self.herramienta.save()
+        movimiento = MovimientoHerramienta.objects.latest('id')
+        self.assertEqual((movimiento.origen, movimiento.estado_anterior, movimiento.usuario),
+                         ('EDICION', 'DISPONIBLE', self.usuario))
+
+        with self.assertRaises(TypeError):
+            MovimientoHerramienta.objects.update(estado='DISPONIBLE')
+        with self.assertRaises(TypeError):
+            movimiento.save()
+
+
+# ==============================================================================
+# PERFILADOR DE PETICIONES
+# ==============================================================================
+
+@override_settings(PERFILADOR_ACTIVO=True, PERFILADOR_MUESTREO=0, PERFILADOR_MAXIMO=2)
+class PerfiladorTests(TestCase):
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        ajuste = self.settings(PERFILADOR_DIR=self.directorio)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+        self.staff = User.objects.create_user('jefe', password='x', is_staff=True)
+        self.client.force_login(self.staff)
+
+    def test_staff_perfila_con_parametro(self):
+        self.assertNotIn('X-Perfil', self.client.get(reverse('menu_reportes')))
+
+        for modo, extension in (('1', 'folded'), ('cprofile', 'prof')):
+            response = self.client.get(reverse('menu_reportes'), {'_perfilar': modo})
+            perfil_id = response['X-Perfil']
+            self.assertTrue(os.path.exists(os.path.join(self.directorio, f'{perfil_id}.{extension}')))
+
+        descarga = self.client.get(reverse('descargar_perfil', args=[f'{perfil_id}.json']))
+        self.assertEqual(b''.join(descarga.streaming_content)[:1], b'{')
+        self.assertContains(self.client.get(reverse('perfiles')), perfil_id)
+
+    def test_buffer_circular(self):
+        ids = [self.client.get(reverse('menu_reportes'), HTTP_X_PERFILAR='1')['X-Perfil'] for _ in range(3)]
+        self.assertEqual(sorted(os.listdir(self.directorio)), sorted(f'{i}.{e}' for i in ids[1:] for e in ('json', 'folded')))
+
+    def test_no_staff_no_perfila(self):
+        self.client.force_login(User.objects.create_user('maestro', password='x'))
+        self.assertNotIn('X-Perfil', self.client.get(reverse('inicio'), {'_perfilar': '1'}))
+        self.assertEqual(os.listdir(self.directorio), [])
+
+    async def test_atiende_asincrono(self):
+        async def vista(request):
+            return HttpResponse()
+        self.assertTrue(iscoroutinefunction(PerfiladorMiddleware(vista)))
+
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse('api_verificar'), {'codigo': 'X', '_perfilar': '1'})
+        self.assertTrue(os.path.exists(os.path.join(self.directorio, f"{response['X-Perfil']}.folded")))
+
+# ==============================================================================
+# SUBIDA DE FOTOS POR PARTES
+# ==============================================================================
+
+def _jpeg(lado=64):
+    from PIL import Image
+    salida = io.BytesIO()
+    Image.new('RGB', (lado, lado), 'orange').save(salida, 'JPEG')
+    return salida.getvalue()
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), SUBIDAS_DIR=tempfile.mkdtemp(), SUBIDA_PARTE_BYTES=300)
+class SubidaFotosTests(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('bodeguero', password='x', is_staff=True)
+        self.client.force_login(self.usuario)
+        self.foto = _jpeg()
+
+    def _crear(self):
+        response = self.client.post(reverse('api_crear_subida'), {'nombre': 'falla.jpg', 'tamano': len(self.foto)},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return reverse('api_subida', args=[response.json()['id']])
+
+    def _parte(self, url, offset, tamano=300):
+        return self.client.put(url, self.foto[offset:offset + tamano], content_type='application/octet-stream',
+                               HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_subida_reanudable(self):
+        url = self._crear()
+        self.assertEqual(self._parte(url, 0).json()['recibido'], 300)
+        # Reintento de una parte ya recibida (se perdió la respuesta)
+        self.assertEqual(self._parte(url, 0).json()['recibido'], 300)
+        # Un salto se rechaza y el cliente pregunta desde dónde seguir
+        self.assertEqual(self._parte(url, 600).status_code, 409)
+        recibido = self.client.get(url).json()['recibido']
+
+        while recibido < len(self.foto):
+            estado = self._parte(url, recibido).json()
+            recibido = estado['recibido']
+        self.assertTrue(estado['completa'])
+
+        subida = SubidaFoto.objects.get()
+        self.assertTrue(subida.archivo.name.endswith('.jpg'))
+        with subida.archivo.open('rb') as archivo:
+            self.assertEqual(archivo.read(), self.foto)
+
+    def test_no_imagen_se_descarta(self):
+        self.foto = b'x' * 200
+        response = self._parte(self._crear(), 0)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(SubidaFoto.objects.exists())
+
+    def test_subida_de_otro_usuario(self):
+        url = self._crear()
+        self.client.force_login(User.objects.create_user('otro', password='x'))
+        self.assertEqual(self._parte(url, 0).status_code, 404)
+
+    def test_devolucion_usa_la_foto_subida(self):
+        url = self._crear()
+        for offset in range(0, len(self.foto), 300):
+            self._parte(url, offset)
+        subida = SubidaFoto.objects.get()
+
+        herramienta = Herramienta.objects.create(
+            nombre='Taladro', marca='Bosch', categoria=Categoria.objects.create(nombre='General'),
+            ubicacion=Ubicacion.objects.create(nombre='Central')
+        )
+        trabajador = Trabajador.objects.create(rut='1-9', nombre='Ana', apellido='Rojas', cargo='Maestro')
+        prestar_herramientas(trabajador, self.usuario, [herramienta.codigo_qr])
+
+        self.client.post(reverse('devolucion'), {
+            'qrs[]': [herramienta.codigo_qr], 'estados[]': ['EN_MANTENCION'],
+            'observaciones[]': ['Cable pelado'], 'fotos[]': [str(subida.id)],
+        })
+        detalle = DetallePrestamo.objects.get(herramienta=herramienta)
+        self.assertEqual(detalle.foto_evidencia.name, subida.archivo.name)
+        self.assertFalse(SubidaFoto.objects.exists())
+
+    def test_item_rechazado_conserva_la_subida(self):
+        url = self._crear()
+        for offset in range(0, len(self.foto), 300):
+            self._parte(url, offset)
+        subida = SubidaFoto.objects.get()
+
+        response = self.client.post(reverse('api_devolucion'), {'items': [
+            {'codigo': 'NO-EXISTE', 'estado': 'EN_MANTENCION', 'foto': str(subida.id)},
+        ]}, content_type='application/json')
+        self.assertEqual(response.json()['guardados'], 0)
+        # Sigue a mano para reintentar, y limpiar() la encuentra si nadie la usa
+        self.assertTrue(SubidaFoto.objects.filter(id=subida.id).exists())
+        self.assertEqual(ContenidoArchivo.objects.get().referencias, 1)
+
+# ==============================================================================
+# STORAGE POR CONTENIDO
+# ==============================================================================
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class AlmacenContenidoTests(TestCase):
+
+    def test_deduplica_en_subcarpetas(self):
+        # InMemoryStorage hace de bucket remoto (sin rutas locales, como S3/MinIO)
+        almacen = AlmacenContenido(interno='django.core.files.storage.InMemoryStorage')
+        nombre = almacen.save('evidencias/falla.JPG', ContentFile(b'foto'))
+        self.assertRegex(nombre, r'^contenido/([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}\.jpg$')
+        self.assertEqual(almacen.save('evidencias/otra.jpg', ContentFile(b'foto')), nombre)
+        self.assertEqual(ContenidoArchivo.objects.get().referencias, 2)
+        with almacen.open(nombre) as archivo:
+            self.assertEqual(archivo.read(), b'foto')
+
+        almacen.delete(nombre)
+        self.assertEqual(ContenidoArchivo.objects.get().referencias, 1)
+        self.assertTrue(almacen.exists(nombre))
+
+    def test_limpieza_respeta_campos_en_uso(self):
+        almacen = storages['default']
+        herramienta = Herramienta.objects.create(
+            nombre='Taladro', marca='Bosch', categoria=Categoria.objects.create(nombre='General'),
+            ubicacion=Ubicacion.objects.create(nombre='Central')
+        )
+        suelto = almacen.save('evidencias/suelta.jpg', ContentFile(b'sin uso'))
+        almacen.delete(suelto)
+        # Contador perdido: el QR sigue en uso aunque diga cero
+        ContenidoArchivo.objects.update(referencias=0)
+
+        self.assertEqual(limpiar_almacen(almacen, horas=0)[0], 1)
+        self.assertFalse(almacen.exists(suelto))
+        self.assertTrue(almacen.exists(herramienta.imagen_qr.name))
+        self.assertEqual(ContenidoArchivo.objects.get().referencias, 1)
+
+    def test_migrar_archivos_existentes(self):
+        herramienta = Herramienta.objects.create(
+            nombre='Taladro', marca='Bosch', categoria=Categoria.objects.create(nombre='General'),
+            ubicacion=Ubicacion.objects.create(nombre='Central')
+        )
+        antiguo = FileSystemStorage().save('codigos_qr/qr_antiguo.png', ContentFile(b'png antiguo'))
+        Herramienta.objects.filter(pk=herramienta.pk).update(imagen_qr=antiguo)
+
+        call_command('migrar_almacen', stdout=io.StringIO())
+        herramienta.refresh_from_db()
+        self.assertTrue(herramienta.imagen_qr.name.startswith('contenido/'))
+        self.assertEqual(herramienta.imagen_qr.read(), b'png antiguo')
+        self.assertFalse(FileSystemStorage().exists(antiguo))
+        self.assertEqual(ContenidoArchivo.objects.get(nombre=herramienta.imagen_qr.name).referencias, 1)
+
+# ==============================================================================
+# FILTROS DE FECHA DE LOS REPORTES
+# ==============================================================================
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class FiltrosFechaTests(TestCase):
+
+    def test_rango_semiabierto_en_hora_local(self):
+        herramienta = Herramienta.objects.create(
+            nombre='Taladro', marca='Bosch', categoria=Categoria.objects.create(nombre='General'),
+            ubicacion=Ubicacion.objects.create(nombre='Central')
+        )
+        # Último instante del día y medianoche siguiente, en hora de Santiago
+        dentro = timezone.make_aware(datetime(2026, 3, 10, 23, 59, 59))
+        fuera = timezone.make_aware(datetime(2026, 3, 11))
+        for fecha in (dentro, fuera):
+            evento = HistorialBaja.objects.create(herramienta=herramienta, accion='BAJA', motivo='x')
+            HistorialBaja.objects.filter(pk=evento.pk).update(fecha_evento=fecha)
+
+        rango = leer_rango({'fecha_inicio': '2026-03-10', 'fecha_fin': '2026-03-10'})
+        self.assertEqual(
+            list(rango.filtrar(HistorialBaja.objects.all(), 'fecha_evento').values_list('fecha_evento', flat=True)),
+            [dentro]
+        )
+
+    def test_cambio_de_horario_y_errores(self):
+        # Inicio del horario de verano en Chile: ese día dura 23 horas
+        rango = leer_rango({'fecha_inicio': '2026-09-06', 'fecha_fin': '2026-09-06'})
+        self.assertEqual(rango.fin.timestamp() - rango.inicio.timestamp(), 23 * 3600)
+
+        rango = leer_rango({'fecha_inicio': '10/03/2026', 'fecha_fin': '9999-12-31'}, dias_defecto=30)
+        self.assertEqual(len(rango.errores), 2)
+        self.assertEqual(rango.hasta, timezone.localdate())
+        self.assertEqual((rango.hasta - rango.desde).days, 30)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), TRABAJOS_EN_REPLICA=False)
+class TrabajosReporteTests(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('jefe', password='x', is_staff=True)
+        self.client.force_login(self.usuario)
+        herramienta = Herramienta.objects.create(
+            nombre='Taladro', marca='Bosch', categoria=Categoria.objects.create(nombre='General'),
+            ubicacion=Ubicacion.objects.create(nombre='Central')
+        )
+        HistorialBaja.objects.create(herramienta=herramienta, accion='BAJA', motivo='Motor quemado', usuario=self.usuario)
+
+    def test_encola_genera_y_descarga(self):
+        respuesta = self.client.post(reverse('generar_reporte', args=['BAJAS']), {'q': 'motor', 'fecha_inicio': ''})
+        self.assertRedirects(respuesta, reverse('trabajos'))
+        trabajo = TrabajoReporte.objects.get()
+        self.assertEqual(trabajo.parametros['q'], 'motor')
+
+        self.assertEqual(trabajos.tomar(), trabajo.id)
+        self.assertIsNone(trabajos.tomar())
+        self.assertEqual(trabajos.ejecutar(trabajo.id), ('LISTO', '1 filas'))
+
+        estado = self.client.get(reverse('api_trabajo', args=[trabajo.id])).json()
+        self.assertEqual((estado['estado'], estado['progreso'], estado['filas']), ('LISTO', 100, 1))
+        descarga = self.client.get(estado['descarga'])
+        contenido = b''.join(descarga.streaming_content).decode('utf-8-sig')
+        self.assertIn('Motor quemado', contenido)
+        self.assertEqual(contenido.splitlines()[0].split(';')[0], 'Fecha')
+
+    def test_reencola_colgados_hasta_agotar_intentos(self):
+        trabajo = trabajos.encolar('TRANSACCIONES', {}, self.usuario)
+        trabajos.tomar()
+        hace_rato = timezone.now() - timedelta(hours=1)
+        TrabajoReporte.objects.filter(id=trabajo.id).update(latido=hace_rato)
+        self.assertEqual(trabajos.reencolar_colgados(), (1, 0))
+
+        TrabajoReporte.objects.filter(id=trabajo.id).update(estado='EN_CURSO', latido=hace_rato, intentos=99)
+        self.assertEqual(trabajos.reencolar_colgados(), (0, 1))
+        self.assertEqual(TrabajoReporte.objects.get().estado, 'ERROR')
+
+    def test_intento_reemplazado_no_pisa_el_resultado(self):
+        trabajo = trabajos.encolar('LENTO', {}, self.usuario)
+
+        def lento(trabajo, escritor, avance):
+            # Mientras tanto se dio por colgado y otro proceso lo retomó
+            TrabajoReporte.objects.filter(id=trabajo.id).update(estado='PENDIENTE')
+            trabajos.tomar()
+            escritor.writerow(['viejo'])
+            return 1
+
+        with mock.patch.dict(trabajos.GENERADORES, {'LENTO': lento}):
+            trabajos.tomar()
+            estado, _ = trabajos.ejecutar(trabajo.id)
+        self.assertEqual(estado, 'DESCARTADO')
+        trabajo.refresh_from_db()
+        self.assertEqual((trabajo.estado, trabajo.intentos), ('EN_CURSO', 2))
+        self.assertFalse(trabajo.archivo)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), TRABAJOS_LATIDO_MAXIMO=0.2, TRABAJOS_EN_REPLICA=False)
+class LatidoTrabajosTests(TransactionTestCase):
+    """Sin transacción envolvente: el hilo del latido escribe con su propia conexión."""
+
+    def test_late_aunque_el_generador_no_avance(self):
+        usuario = User.objects.create_user('jefe', password='x')
+        trabajo = trabajos.encolar('LENTO', {}, usuario)
+        trabajos.tomar()
+        tomado = TrabajoReporte.objects.get().latido
+
+        def lento(trabajo, escritor, avance):
+            time.sleep(0.3)  # Una consulta larga: no llama a avance()
+            return TrabajoReporte.objects.get().latido > tomado
+
+        with mock.patch.dict(trabajos.GENERADORES, {'LENTO': lento}):
+            self.assertEqual(trabajos.ejecutar(trabajo.id), ('LISTO', 'True filas'))
+
+
+class NominaTests(TestCase):
+
+    def _nomina(self, texto, **opciones):
+        return nomina.sincronizar(io.BytesIO(texto.encode(opciones.pop('codificacion', 'utf-8'))), **opciones)
+
+    def test_normaliza_rut(self):
+        self.assertEqual(nomina.normalizar_rut(' 12.345.678-5 '), '12345678-5')
+        self.assertEqual(nomina.normalizar_rut('09.876.545k'), '9876545-K')
+        self.assertIsNone(nomina.normalizar_rut('12.345.678-9'))  # Dígito verificador malo
+        self.assertIsNone(nomina.normalizar_rut(''))
+
+    def test_rut_normalizado_en_api_y_formulario(self):
+        form = TrabajadorForm({'rut': '9.876.545-k', 'nombre': 'Pedro', 'apellido': 'Muñoz', 'cargo': 'Jornal',
+                               'activo': True})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.save().rut, '9876545-K')
+        self.assertFalse(TrabajadorForm({'rut': '12.345.678-9', 'nombre': 'Mal', 'apellido': 'Digito',
+                                         'cargo': 'Jornal'}).is_valid())
+
+        self.client.force_login(User.objects.create_user('porteria', password='x', is_staff=True))
+        respuesta = self.client.get(reverse('api_trabajador', args=['9.876.545-k']))
+        self.assertEqual(respuesta.json()['trabajador']['rut'], '9876545-K')
+        self.assertEqual(self.client.get(reverse('api_trabajador', args=['12345678-9'])).status_code, 400)
+
+    def test_sincroniza_y_es_idempotente(self):
+        Trabajador.objects.create(rut='12.345.678-5', nombre='Juan', apellido='Pérez', cargo='Ayudante')
+        Trabajador.objects.create(rut='1-9', nombre='Ana', apellido='Soto', cargo='Maestro', activo=False)
+        Trabajador.objects.create(rut='11111111-1', nombre='Luis', apellido='Rojas', cargo='Maestro')
+        Trabajador.objects.create(rut='22222222-2', nombre='Rosa', apellido='Díaz', cargo='Maestro')
+        texto = (
+            "RUT;Nombre;Apellido;Cargo\n"
+            "12345678-5;Juan;Pérez;Maestro\n"
+            "1-9;Ana;Soto;Maestro\n"
+            "11.111.111-1;Luis;Rojas;Maestro\n"
+            "9.876.545-k;Pedro;Muñoz;Jornal\n"
+            "12345678-9;Mal;Digito;Jornal\n"
+        )
+        plan = self._nomina(texto, codificacion='cp1252')
+        self.assertEqual(
+            (len(plan.crear), len(plan.actualizar), plan.reactivados, len(plan.desactivar), len(plan.errores)),
+            (1, 2, 1, 1, 1)
+        )
+        juan = Trabajador.objects.get(nombre='Juan')
+        self.assertEqual((juan.rut, juan.cargo), ('12345678-5', 'Maestro'))
+        self.assertFalse(Trabajador.objects.get(rut='22222222-2').activo)
+        self.assertEqual(Trabajador.objects.get(rut='9876545-K').apellido, 'Muñoz')
+
+        plan = self._nomina(texto)
+        self.assertEqual((len(plan.crear), len(plan.actualizar), len(plan.desactivar), plan.sin_cambios), (0, 0, 0, 4))
+
+    def test_no_desactiva_a_la_mayoria_sin_forzar(self):
+        for rut in ('11111111-1', '22222222-2', '33333333-3'):
+            Trabajador.objects.create(rut=rut, nombre='X', apellido='Y', cargo='Z')
+        texto = "rut,nombre,apellido,cargo\n11111111-1,X,Y,Z\n"
+        with self.assertRaises(nomina.NominaInvalida):
+            self._nomina(texto)
+        self.assertEqual(Trabajador.objects.filter(activo=True).count(), 3)
+        self._nomina(texto, forzar=True)
+        self.assertEqual(Trabajador.objects.filter(activo=True).count(), 1)
+
+
+class ConteoInventarioTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('jefe', password='x', is_staff=True))
+        categoria = Categoria.objects.create(nombre='General')
+        self.central, otra = Ubicacion.objects.create(nombre='Central'), Ubicacion.objects.create(nombre='Faena')
+        Herramienta.objects.bulk_create([
+            Herramienta(codigo_qr=codigo, nombre=codigo, marca='X', categoria=categoria,
+                        ubicacion=ubicacion, estado=estado, activo=activo)
+            for codigo, ubicacion, estado, activo in (
+                ('DISP-1', self.central, 'DISPONIBLE', True),
+                ('DISP-2', self.central, 'DISPONIBLE', True),
+                ('USO-1', self.central, 'EN_USO', True),
+                ('MANT-1', self.central, 'EN_MANTENCION', True),
+                ('BAJA-1', self.central, 'BAJA_POR_PERDIDA', False),
+                ('OTRA-1', otra, 'DISPONIBLE', True),
+            )
+        ])
+
+    def test_concilia_lecturas_por_lotes(self):
+        respuesta = self.client.post(reverse('conteos'), {'ubicacion': self.central.id})
+        conteo = ConteoInventario.objects.get()
+        self.assertRedirects(respuesta, reverse('ver_conteo', args=[conteo.id]))
+        # Volver a abrir la misma bodega continúa el conteo abierto
+        self.client.post(reverse('conteos'), {'ubicacion': self.central.id})
+        self.assertEqual(ConteoInventario.objects.count(), 1)
+
+        url = reverse('api_lecturas_conteo', args=[conteo.id])
+        lote = {'codigos': ['DISP-1', 'USO-1', 'MANT-1', 'OTRA-1', 'XYZ', 'DISP-1']}
+        datos = self.client.post(url, lote, content_type='application/json').json()
+        self.assertEqual(
+            {codigo: r['clave'] for codigo, r in datos['resultados'].items()},
+            {'DISP-1': 'OK', 'USO-1': 'ESTADO', 'MANT-1': 'OK', 'OTRA-1': 'OTRA_UBICACION', 'XYZ': 'DESCONOCIDO'}
+        )
+        # Reenviar un lote (reintento del escáner) no duplica lecturas
+        self.assertEqual(self.client.post(url, lote, content_type='application/json').json()['lecturas'], 5)
+
+        self.client.post(reverse('cerrar_conteo', args=[conteo.id]))
+        resultado = ConteoInventario.objects.get().resultado
+        self.assertEqual((resultado['encontradas'], resultado['esperadas']), (1, 2))
+        self.assertEqual([h['codigo'] for h in resultado['faltantes']], ['DISP-2'])
+        self.assertEqual([h['codigo'] for h in resultado['estado_incorrecto']], ['USO-1'])
+        self.assertEqual([(h['codigo'], h['ubicacion']) for h in resultado['inesperadas']], [('OTRA-1', 'Faena')])
+        self.assertEqual(resultado['desconocidos'], ['XYZ'])
+
+        self.assertEqual(self.client.post(url, lote, content_type='application/json').status_code, 409)
+
+    def test_aperturas_simultaneas_comparten_el_conteo(self):
+        usuario = User.objects.get()
+        abierto = conteos.abrir(self.central, usuario)
+        # El otro bodeguero consultó antes de que existiera: su INSERT choca con el índice
+        with mock.patch('django.db.models.query.QuerySet.first', return_value=None):
+            self.assertEqual(conteos.abrir(self.central, usuario), abierto)
+        self.assertEqual(ConteoInventario.objects.count(), 1)
+
+        conteos.cerrar(abierto)
+        self.assertNotEqual(conteos.abrir(self.central, usuario), abierto)
+
+    def test_lecturas_invalidas(self):
+        url = reverse('api_lecturas_conteo', args=[conteos.abrir(self.central, None).id])
+        for codigos in (['DISP-1', 7], 'DISP-1', ['X' * 101]):
+            respuesta = self.client.post(url, {'codigos': codigos}, content_type='application/json')
+            self.assertEqual(respuesta.status_code, 400, codigos)
+        self.assertFalse(LecturaConteo.objects.exists())
+
+
+# ==============================================================================
+# ACTUALIZACIONES EN VIVO
+# ==============================================================================
+# Cada BusEventos hace de un worker de Gunicorn distinto: comparten sólo la
+# caché, como en producción con Redis.
+
+class BusEventosTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_secuencia_compartida_entre_workers(self):
+        worker_a, worker_b = BusEventos(), BusEventos()
+        inicio = worker_b.ultimo_id
+        eventos = worker_a.publicar_lote([('trabajadores', {'kpis': {'trabajadores': 1}})] * 2)
+        self.assertEqual([e['id'] for e in eventos], [inicio + 1, inicio + 2])
+        self.assertEqual(worker_b.desde(inicio), (eventos, False))
+        self.assertEqual(worker_b.desde(inicio + 2), ([], False))
+
+    def test_cliente_desfasado_recarga(self):
+        bus = BusEventos(capacidad=3)
+        inicio = bus.ultimo_id
+        for _ in range(4):
+            bus.publicar('trabajadores', {'kpis': {'trabajadores': 1}})
+        self.assertEqual(bus.desde(inicio), ([], True))  # Fuera de la capacidad
+        self.assertEqual(bus.desde(inicio + 10), ([], True))  # Id de otra secuencia
+        cache.delete(f'eventos:{inicio + 3}')  # Evento vencido
+        self.assertEqual(bus.desde(inicio + 2), ([], True))
+
+    def test_id_reservado_sin_escribir_no_recarga(self):
+        bus = BusEventos()
+        inicio = bus.ultimo_id
+        publicado = bus.publicar('trabajadores', {'kpis': {'trabajadores': 1}})
+        bus._reservar(1)  # Otro worker ya tomó el id siguiente y todavía no guarda su evento
+        self.assertEqual(bus.desde(inicio), ([publicado], False))
+        self.assertEqual(bus.desde(publicado['id']), ([], False))
+
+        # Un evento que sí se escribió y ya no está venció: eso sí recarga
+        siguiente = bus.publicar('trabajadores', {'kpis': {'trabajadores': 1}})
+        cache.delete(f"eventos:{siguiente['id']}")
+        self.assertEqual(bus.desde(siguiente['id'] - 1), ([], True))
+
+    def test_polling_responde_sin_esperar(self):
+        self.client.force_login(User.objects.create_user('jefe', password='x', is_staff=True))
+        ultimo = BusEventos().ultimo_id
+        with self.captureOnCommitCallbacks(execute=True):
+            Trabajador.objects.create(rut='11111111-1', nombre='Luis', apellido='Rojas', cargo='Maestro')
+            nomina.publicar_trabajadores(1)
+        datos = self.client.get(reverse('api_eventos'), {'desde': ultimo}).json()
+        self.assertEqual((datos['ultimo'], len(datos['eventos']), datos['recargar']), (ultimo + 1, 1, False))
+        datos = self.client.get(reverse('api_eventos'), {'desde': datos['ultimo']}).json()
+        self.assertEqual(datos['eventos'], [])
+
+
+# ==============================================================================
+# API DEL ESCÁNER
+# ==============================================================================
+
+def _herramientas(*filas, ubicacion=None, categoria=None):
+    """Crea herramientas (codigo, estado[, activo]) con bulk_create (sin generar QR)."""
+    categoria = categoria or Categoria.objects.create(nombre='General')
+    ubicacion = ubicacion or Ubicacion.objects.create(nombre='Central')
+    Herramienta.objects.bulk_create([
+        Herramienta(codigo_qr=fila[0], nombre=fila[0], marca='Bosch', categoria=categoria,
+                    ubicacion=ubicacion, estado=fila[1], activo=fila[2] if len(fila) > 2 else True)
+        for fila in filas
+    ])
+    return {h.codigo_qr: h for h in Herramienta.objects.filter(codigo_qr__in=[f[0] for f in filas])}
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ApiEscanerTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('bodeguero', password='x', is_staff=True))
+        _herramientas(('HER-1', 'DISPONIBLE'), ('HER-2', 'DISPONIBLE'), ('HER-3', 'EN_USO'))
+        self.trabajador = Trabajador.objects.create(rut='11111111-1', nombre='Luis', apellido='Rojas', cargo='Maestro')
+
+    def _post(self, nombre, datos):
+        return self.client.post(reverse(nombre), datos, content_type='application/json')
+
+    def _estados(self):
+        return dict(Herramienta.objects.values_list('codigo_qr', 'estado'))
+
+    def test_prestamo_y_devolucion_con_errores_parciales(self):
+        respuesta = self._post('api_prestamo', {
+            'trabajador': self.trabajador.id, 'codigos': ['HER-1', 'HER-2', 'HER-1', 'HER-3', 'NO-EXISTE']
+        })
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual((respuesta.json()['guardados'], len(respuesta.json()['errores'])), (2, 2))
+        self.assertEqual(self._estados(), {'HER-1': 'EN_USO', 'HER-2': 'EN_USO', 'HER-3': 'EN_USO'})
+
+        respuesta = self._post('api_devolucion', {'items': [
+            {'codigo': 'HER-1', 'estado': 'DISPONIBLE'},
+            {'codigo': 'HER-2', 'estado': 'EN_MANTENCION', 'observacion': 'Sin carbones'},
+            {'codigo': 'NO-EXISTE', 'estado': 'DISPONIBLE'},
+        ]})
+        self.assertEqual(respuesta.json()['devueltos'], ['HER-1', 'HER-2'])
+        self.assertEqual(respuesta.json()['errores'], ['NO-EXISTE: No existe.'])
+        self.assertEqual(self._estados(), {'HER-1': 'DISPONIBLE', 'HER-2': 'EN_MANTENCION', 'HER-3': 'EN_USO'})
+        self.assertIsNotNone(DetallePrestamo.objects.get(herramienta__codigo_qr='HER-1').prestamo.fecha_devolucion)
+
+        # Nada prestable: 409 y no se crea el préstamo
+        respuesta = self._post('api_prestamo', {'trabajador': self.trabajador.id, 'codigos': ['HER-3']})
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertIsNone(respuesta.json()['prestamo'])
+
+    def test_validaciones(self):
+        casos = (
+            ('api_prestamo', {'trabajador': self.trabajador.id, 'codigos': []}),
+            ('api_prestamo', {'trabajador': self.trabajador.id, 'codigos': ['HER-1'] * 501}),
+            ('api_prestamo', {'trabajador': self.trabajador.id, 'codigos': ['HER-1'], 'plazo_horas': 0}),
+            ('api_prestamo', {'trabajador': 999, 'codigos': ['HER-1']}),
+            ('api_prestamo', ['HER-1']),
+            ('api_devolucion', {'items': [{'codigo': 'HER-3', 'estado': 'PERDIDA'}]}),
+            ('api_devolucion', {'items': [{'estado': 'DISPONIBLE'}]}),
+            ('api_devolucion', {'items': 'HER-3'}),
+        )
+        for nombre, datos in casos:
+            with self.subTest(nombre=nombre, datos=str(datos)[:60]):
+                self.assertEqual(self._post(nombre, datos).status_code, 400)
+        self.assertEqual(self._estados(), {'HER-1': 'DISPONIBLE', 'HER-2': 'DISPONIBLE', 'HER-3': 'EN_USO'})
+
+    def test_codigos_que_no_son_texto(self):
+        _herramientas(('MANT-1', 'EN_MANTENCION'))
+        for codigos in ([{'x': 1}], [1], [['HER-1']], ['MANT-1', None]):
+            with self.subTest(codigos=codigos):
+                self.assertEqual(self._post('api_liberar_mantencion', {'codigos': codigos}).status_code, 400)
+                self.assertEqual(self._post('api_verificar_lote', {'codigos': codigos}).status_code, 400)
+                self.assertEqual(
+                    self._post('api_prestamo', {'trabajador': self.trabajador.id, 'codigos': codigos}).status_code, 400
+                )
+        self.assertEqual(self._post('api_devolucion', {'items': [{'codigo': 1, 'estado': 'DISPONIBLE'}]}).status_code, 400)
+
+        respuesta = self._post('api_liberar_mantencion', {'codigos': ['MANT-1', 'HER-1']})
+        self.assertEqual(respuesta.json()['liberadas'], ['MANT-1'])
+        self.assertEqual(len(respuesta.json()['errores']), 1)
+
+
+# ==============================================================================
+# ALCANCE POR BODEGA
+# ==============================================================================
+# Dos bodegueros, cada uno asignado a su bodega: ninguno ve ni opera las
+# herramientas del otro, por HTML ni por la API.
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class AlcancePorBodegaTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        categoria = Categoria.objects.create(nombre='General')
+        self.bodega_a = Ubicacion.objects.create(nombre='Bodega A')
+        self.bodega_b = Ubicacion.objects.create(nombre='Bodega B')
+        _herramientas(('A-DISP', 'DISPONIBLE'), ('A-MANT', 'EN_MANTENCION'), ubicacion=self.bodega_a, categoria=categoria)
+        _herramientas(('B-DISP', 'DISPONIBLE'), ('B-MANT', 'EN_MANTENCION'), ubicacion=self.bodega_b, categoria=categoria)
+        self.usuario_a = User.objects.create_user('bodeguero_a', password='x', is_staff=True)
+        self.usuario_b = User.objects.create_user('bodeguero_b', password='x', is_staff=True)
+        self.bodega_a.bodegueros.add(self.usuario_a)
+        self.bodega_b.bodegueros.add(self.usuario_b)
+        self.trabajador = Trabajador.objects.create(rut='11111111-1', nombre='Luis', apellido='Rojas', cargo='Maestro')
+
+    def _como(self, usuario):
+        self.client.force_login(usuario)
+
+    def _post(self, nombre, datos):
+        return self.client.post(reverse(nombre), datos, content_type='application/json')
+
+    def _estados(self):
+        return dict(Herramienta.objects.values_list('codigo_qr', 'estado'))
+
+    def test_listas_y_kpis_solo_de_su_bodega(self):
+        for usuario, propia, ajena in ((self.usuario_a, 'A', 'B'), (self.usuario_b, 'B', 'A')):
+            with self.subTest(usuario=usuario.username):
+                self._como(usuario)
+                respuesta = self.client.get(reverse('herramientas_disponibles'))
+                self.assertContains(respuesta, f'{propia}-DISP')
+                self.assertNotContains(respuesta, f'{ajena}-DISP')
+                respuesta = self.client.get(reverse('en_mantencion'))
+                self.assertContains(respuesta, f'{propia}-MANT')
+                self.assertNotContains(respuesta, f'{ajena}-MANT')
+
+                contexto = self.client.get(reverse('inicio')).context
+                self.assertEqual((contexto['kpi_total'], contexto['kpi_prestamos'], contexto['kpi_mantencion']), (1, 0, 1))
+
+    def test_prestamo_y_devolucion_html_rechazan_la_otra_bodega(self):
+        self._como(self.usuario_a)
+        respuesta = self.client.post(reverse('prestamo'), {
+            'trabajador': self.trabajador.id, 'lista_qrs': json.dumps(['B-DISP'])
+        })
+        self.assertEqual(respuesta.status_code, 200)  # Vuelve al formulario: no se prestó nada
+        self.assertIn('QR B-DISP no existe o fue dado de baja', ' '.join(str(m) for m in respuesta.context['messages']))
+        self.assertFalse(DetallePrestamo.objects.exists())
+
+        self._como(self.usuario_b)
+        respuesta = self.client.post(reverse('prestamo'), {
+            'trabajador': self.trabajador.id, 'lista_qrs': json.dumps(['B-DISP'])
+        })
+        self.assertRedirects(respuesta, reverse('prestamo'))
+        self.assertEqual(self._estados()['B-DISP'], 'EN_USO')
+
+        self._como(self.usuario_a)
+        respuesta = self.client.post(reverse('devolucion'), {
+            'qrs[]': ['B-DISP'], 'estados[]': ['DISPONIBLE'], 'observaciones[]': ['']
+        })
+        self.assertEqual(respuesta.context['error'], 'Alertas: B-DISP: No existe.')
+        self.assertEqual(self._estados()['B-DISP'], 'EN_USO')
+
+        self._como(self.usuario_b)
+        respuesta = self.client.post(reverse('devolucion'), {
+            'qrs[]': ['B-DISP'], 'estados[]': ['DISPONIBLE'], 'observaciones[]': ['']
+        })
+        self.assertIsNone(respuesta.context['error'])
+        self.assertEqual(self._estados()['B-DISP'], 'DISPONIBLE')
+
+    def test_api_rechaza_la_otra_bodega(self):
+        self._como(self.usuario_a)
+        respuesta = self._post('api_prestamo', {'trabajador': self.trabajador.id, 'codigos': ['A-DISP', 'B-DISP']})
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(respuesta.json()['guardados'], 1)
+        self.assertEqual(respuesta.json()['errores'], ['QR B-DISP no existe o fue dado de baja'])
+
+        self._como(self.usuario_b)
+        self._post('api_prestamo', {'trabajador': self.trabajador.id, 'codigos': ['B-DISP']})
+        respuesta = self._post('api_devolucion', {'items': [
+            {'codigo': 'A-DISP', 'estado': 'DISPONIBLE'}, {'codigo': 'B-DISP', 'estado': 'DISPONIBLE'},
+        ]})
+        self.assertEqual(respuesta.json()['devueltos'], ['B-DISP'])
+        self.assertEqual(respuesta.json()['errores'], ['A-DISP: No existe.'])
+
+        respuesta = self._post('api_liberar_mantencion', {'codigos': ['A-MANT', 'B-MANT']})
+        self.assertEqual(respuesta.json()['liberadas'], ['B-MANT'])
+        self.assertEqual(respuesta.json()['errores'], ['A-MANT: No existe o fue dado de baja.'])
+
+        self.assertEqual(self._estados(), {
+            'A-DISP': 'EN_USO', 'A-MANT': 'EN_MANTENCION', 'B-DISP': 'DISPONIBLE', 'B-MANT': 'DISPONIBLE',
+        })
+
+    def test_liberar_lote_html_ignora_la_otra_bodega(self):
+        self._como(self.usuario_a)
+        self.client.post(reverse('liberar_lote'), {'codigos': ['A-MANT', 'B-MANT']})
+        self.assertEqual((self._estados()['A-MANT'], self._estados()['B-MANT']), ('DISPONIBLE', 'EN_MANTENCION'))
+
+    def test_eventos_solo_de_su_bodega(self):
+        ultimo = BusEventos().ultimo_id
+        with self.captureOnCommitCallbacks(execute=True):
+            prestar_herramientas(self.trabajador, self.usuario_a, ['A-DISP'], ubicaciones=[self.bodega_a.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            prestar_herramientas(self.trabajador, self.usuario_b, ['B-DISP'], ubicaciones=[self.bodega_b.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            nomina.publicar_trabajadores(1)  # Sin ubicación: llega a todos
+
+        for usuario, bodega in ((self.usuario_a, self.bodega_a), (self.usuario_b, self.bodega_b)):
+            with self.subTest(usuario=usuario.username):
+                self._como(usuario)
+                datos = self.client.get(reverse('api_eventos'), {'desde': ultimo}).json()
+                self.assertEqual(datos['ultimo'], ultimo + 3)  # Avanza aunque filtre
+                self.assertEqual(
+                    [e.get('ubicacion_id') for e in datos['eventos']], [bodega.id, None]
+                )
+
+
+# ==============================================================================
+# CACHÉ DE FRAGMENTOS DE LAS LISTAS
+# ==============================================================================
+# Un .update() directo no invalida nada: sirve para comprobar que la lista
+# realmente sale del caché y que sólo los servicios y save() la renuevan.
+
+class FragmentosInventarioTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.trabajador = Trabajador.objects.create(rut='11111111-1', nombre='Luis', apellido='Rojas', cargo='Maestro')
+
+    def _codigos(self, nombre, usuario):
+        self.client.force_login(usuario)
+        contenido = self.client.get(reverse(nombre)).content.decode()
+        return {c for c in Herramienta.objects.values_list('codigo_qr', flat=True) if c in contenido}
+
+    def test_servicios_y_save_renuevan_las_listas(self):
+        jefe = User.objects.create_user('jefe', password='x', is_staff=True)
+        _herramientas(('DISP-1', 'DISPONIBLE'), ('DISP-2', 'DISPONIBLE'), ('MANT-1', 'EN_MANTENCION'))
+        self.assertEqual(self._codigos('herramientas_disponibles', jefe), {'DISP-1', 'DISP-2'})
+        self.assertEqual(self._codigos('en_mantencion', jefe), {'MANT-1'})
+
+        Herramienta.objects.filter(codigo_qr='DISP-2').update(nombre='Sin invalidar')
+        self.assertNotContains(self.client.get(reverse('herramientas_disponibles')), 'Sin invalidar')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            prestar_herramientas(self.trabajador, jefe, ['DISP-1'])
+            liberar_herramientas(['MANT-1'], jefe)
+        self.assertEqual(self._codigos('herramientas_disponibles', jefe), {'DISP-2', 'MANT-1'})
+        self.assertEqual(self._codigos('en_mantencion', jefe), set())
+
+        herramienta = Herramienta.objects.get(codigo_qr='DISP-2')
+        herramienta.estado = 'EN_MANTENCION'
+        with self.captureOnCommitCallbacks(execute=True):
+            herramienta.save()
+        self.assertEqual(self._codigos('herramientas_disponibles', jefe), {'MANT-1'})
+        self.assertEqual(self._codigos('en_mantencion', jefe), {'DISP-2'})
+
+    def test_cambio_en_una_bodega_no_renueva_la_otra(self):
+        categoria = Categoria.objects.create(nombre='General')
+        bodega_a = Ubicacion.objects.create(nombre='Bodega A')
+        bodega_b = Ubicacion.objects.create(nombre='Bodega B')
+        _herramientas(('A-1', 'DISPONIBLE'), ('A-2', 'DISPONIBLE'), ubicacion=bodega_a, categoria=categoria)
+        _herramientas(('B-1', 'DISPONIBLE'), ('B-2', 'EN_MANTENCION'), ubicacion=bodega_b, categoria=categoria)
+        usuario_a = User.objects.create_user('bodeguero_a', password='x', is_staff=True)
+        usuario_b = User.objects.create_user('bodeguero_b', password='x', is_staff=True)
+        bodega_a.bodegueros.add(usuario_a)
+        bodega_b.bodegueros.add(usuario_b)
+        self.assertEqual(self._codigos('herramientas_disponibles', usuario_a), {'A-1', 'A-2'})
+        self.assertEqual(self._codigos('herramientas_disponibles', usuario_b), {'B-1'})
+        self.assertEqual(self._codigos('en_mantencion', usuario_b), {'B-2'})
+
+        # B cambia sin invalidar; A cambia por el servicio y por save()
+        Herramienta.objects.filter(codigo_qr__in=['B-1', 'B-2']).update(estado='EN_USO')
+        herramienta = Herramienta.objects.get(codigo_qr='A-2')
+        herramienta.estado = 'EN_MANTENCION'
+        with self.captureOnCommitCallbacks(execute=True):
+            prestar_herramientas(self.trabajador, usuario_a, ['A-1'], ubicaciones=[bodega_a.id])
+            herramienta.save()
+
+        self.assertEqual(self._codigos('herramientas_disponibles', usuario_a), set())
+        self.assertEqual(self._codigos('en_mantencion', usuario_a), {'A-2'})
+        # Los fragmentos de B siguen siendo los del primer render
+        self.assertEqual(self._codigos('herramientas_disponibles', usuario_b), {'B-1'})
+        self.assertEqual(self._codigos('en_mantencion', usuario_b), {'B-2'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Herramienta.objects.get(codigo_qr='B-1').save()
+        self.assertEqual(self._codigos('herramientas_disponibles', usuario_b), set())
+        self.assertEqual(self._codigos('en_mantencion', usuario_b), set())
+
+
+# ==============================================================================
+# BAJAS Y REACTIVACIONES MASIVAS
+# ==============================================================================
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class BajasReactivacionesTests(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('jefe', password='x', is_staff=True)
+        self.trabajador = Trabajador.objects.create(rut='11111111-1', nombre='Luis', apellido='Rojas', cargo='Maestro')
+        _herramientas(('DISP-1', 'DISPONIBLE'), ('USO-1', 'DISPONIBLE'), ('USO-2', 'DISPONIBLE'), ('MANT-1', 'DISPONIBLE'))
+        self.prestamo, _, _ = prestar_herramientas(self.trabajador, self.usuario, ['USO-1', 'USO-2', 'MANT-1'])
+        devolver_herramientas([{'codigo': 'MANT-1', 'estado': 'EN_MANTENCION'}], usuario=self.usuario)
+
+    def _saldo(self):
+        return SaldoTrabajador.objects.values_list('herramientas_en_poder', 'devoluciones').get()
+
+    def test_baja_elige_motivo_por_estado(self):
+        bajas, motivos = dar_de_baja(Herramienta.objects.all(), self.usuario)
+        self.assertEqual(len(bajas), 4)
+        self.assertEqual(
+            dict(Herramienta.objects.values_list('codigo_qr', 'estado')),
+            {'DISP-1': 'DE_BAJA', 'USO-1': 'BAJA_POR_PERDIDA', 'USO-2': 'BAJA_POR_PERDIDA', 'MANT-1': 'BAJA_POR_DANO'}
+        )
+        self.assertFalse(Herramienta.objects.filter(activo=True).exists())
+        self.assertEqual(motivos, {'Pérdida en Obra': 2, 'Daño Irreparable': 1, 'Baja Administrativa': 1})
+        self.assertEqual(
+            sorted(HistorialBaja.objects.filter(accion='BAJA').values_list('herramienta__codigo_qr', 'motivo')),
+            [('DISP-1', 'Baja Administrativa'), ('MANT-1', 'Daño Irreparable'),
+             ('USO-1', 'Pérdida en Obra'), ('USO-2', 'Pérdida en Obra')]
+        )
+        self.assertFalse(Mantencion.objects.filter(fecha_fin__isnull=True).exists())
+        self.assertEqual(MovimientoHerramienta.objects.filter(origen='BAJA').count(), 4)
+        # Las ya inactivas no se vuelven a dar de baja ni se auditan dos veces
+        self.assertEqual(dar_de_baja(Herramienta.objects.all(), self.usuario), ([], {}))
+        self.assertEqual(HistorialBaja.objects.count(), 4)
+
+    def test_reactivar_cierra_prestamos_zombies(self):
+        dar_de_baja(Herramienta.objects.all(), self.usuario)
+        self.assertEqual(self._saldo(), (2, 1))
+
+        reactivadas, cerrados = reactivar(Herramienta.objects.filter(codigo_qr__in=['USO-1', 'DISP-1']), self.usuario)
+        self.assertEqual((len(reactivadas), cerrados), (2, 1))
+        zombie = DetallePrestamo.objects.get(herramienta__codigo_qr='USO-1')
+        self.assertEqual((zombie.devuelto, zombie.estado_devolucion), (True, 'DISPONIBLE'))
+        self.assertEqual(zombie.observacion_falla, 'Cierre automático por Reactivación de Inventario')
+        self.prestamo.refresh_from_db()
+        self.assertIsNone(self.prestamo.fecha_devolucion)  # USO-2 sigue pendiente
+        self.assertEqual(self._saldo(), (1, 2))
+
+        reactivar(Herramienta.objects.all(), self.usuario)
+        self.prestamo.refresh_from_db()
+        self.assertIsNotNone(self.prestamo.fecha_devolucion)
+        self.assertEqual(self._saldo(), (0, 3))
+        self.assertEqual(Herramienta.objects.filter(activo=True, estado='DISPONIBLE').count(), 4)
+        self.assertEqual(HistorialBaja.objects.filter(accion='REACTIVACION').count(), 4)
+        self.assertEqual(MovimientoHerramienta.objects.filter(origen='REACTIVACION').count(), 4)
+        # Reactivar activas no hace nada
+        self.assertEqual(reactivar(Herramienta.objects.all(), self.usuario), ([], 0))
+
+
+# ==============================================================================
+# CATÁLOGO /api/herramientas/
+# ==============================================================================
+
+def _contenido(respuesta):
+    """JSON de una respuesta streaming, descomprimido según Content-Encoding."""
+    crudo = b''.join(respuesta.streaming_content)
+    codificacion = respuesta.headers.get('Content-Encoding')
+    if codificacion == 'gzip':
+        crudo = gzip.decompress(crudo)
+    elif codificacion == 'br':
+        crudo = compresion.brotli.decompress(crudo)
+    return json.loads(crudo)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class CatalogoApiTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('jefe', password='x', is_staff=True))
+        _herramientas(*[(f'HER-{i}', 'DISPONIBLE') for i in range(7)], ('BAJA-1', 'DE_BAJA', False))
+
+    def _get(self, codificacion='', **parametros):
+        return self.client.get(reverse('api_herramientas'), parametros, HTTP_ACCEPT_ENCODING=codificacion)
+
+    def test_proyeccion_de_campos(self):
+        datos = _contenido(self._get(fields='codigo_qr,estado'))
+        self.assertEqual(datos['total'], 7)
+        self.assertEqual(datos['herramientas'][0].keys(), {'id', 'codigo_qr', 'estado'})
+
+        datos = _contenido(self._get(fields='codigo_qr,ubicacion_nombre', formato='filas', activo='0'))
+        self.assertEqual(datos['campos'], ['id', 'codigo_qr', 'ubicacion_nombre'])
+        self.assertEqual([fila[1:] for fila in datos['herramientas']], [['BAJA-1', 'Central']])
+
+        self.assertEqual(self._get(fields='codigo_qr,precio').status_code, 400)
+
+    def test_paginacion_keyset_sin_duplicados_ni_saltos(self):
+        esperados = list(Herramienta.objects.filter(activo=True).order_by('id').values_list('codigo_qr', flat=True))
+        vistos, desde, paginas = [], 0, 0
+        while desde is not None:
+            datos = _contenido(self._get(fields='codigo_qr', limite=3, desde=desde))
+            vistos += [h['codigo_qr'] for h in datos['herramientas']]
+            desde, paginas = datos['siguiente'], paginas + 1
+            if paginas == 1:
+                # Borrar lo ya leído no corre las páginas siguientes (a diferencia de OFFSET)
+                Herramienta.objects.filter(codigo_qr=vistos[0]).delete()
+        self.assertEqual(vistos, esperados)
+        self.assertEqual(paginas, 3)
+
+    def test_negociacion_de_compresion(self):
+        respuesta = self._get()
+        self.assertNotIn('Content-Encoding', respuesta.headers)
+        self.assertIn('Accept-Encoding', respuesta.headers['Vary'])
+        # Un Vary previo (la sesión agrega Cookie) se conserva
+        previa = StreamingHttpResponse([b'{}'], headers={'Vary': 'Cookie'})
+        self.assertEqual(compresion.respuesta_comprimida(RequestFactory().get('/'), previa).headers['Vary'],
+                         'Cookie, Accept-Encoding')
+
+        respuesta = self._get('gzip, deflate')
+        self.assertEqual(respuesta.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(_contenido(respuesta)['total'], 7)
+
+        if compresion.brotli is not None:
+            respuesta = self._get('gzip;q=0.8, br')
+            self.assertEqual(respuesta.headers['Content-Encoding'], 'br')
+            self.assertEqual(_contenido(respuesta)['total'], 7)
+        # Sin Brotli instalado cae a gzip aunque el cliente lo prefiera
+        with mock.patch.object(compresion, 'brotli', None):
+            self.assertEqual(self._get('br, gzip').headers['Content-Encoding'], 'gzip')
+
+
+# ==============================================================================
+# PLAZOS Y ATRASOS
+# ==============================================================================
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), PRESTAMO_HORAS_DEFECTO=24, ADMINS=[('Jefe', 'jefe@example.com')])
+class AtrasosTests(TestCase):
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('bodeguero', password='x', is_staff=True)
+        self.trabajador = Trabajador.objects.create(rut='11111111-1', nombre='Luis', apellido='Rojas', cargo='Maestro')
+        ubicacion = Ubicacion.objects.create(nombre='Central')
+        _herramientas(('HER-1', 'DISPONIBLE'), ('HER-2', 'DISPONIBLE'), ('HER-3', 'DISPONIBLE'), ubicacion=ubicacion)
+        _herramientas(('ESM-1', 'DISPONIBLE'), ubicacion=ubicacion,
+                      categoria=Categoria.objects.create(nombre='Esmeriles', horas_prestamo=4))
+
+    def _detectar(self, *opciones):
+        call_command('detectar_atrasos', *opciones, stdout=io.StringIO())
+        return dict(AlertaAtraso.objects.values_list('detalle__herramienta__codigo_qr', 'resuelta'))
+
+    def _vencer(self, *codigos):
+        DetallePrestamo.objects.filter(herramienta__codigo_qr__in=codigos).update(
+            fecha_limite=timezone.now() - timedelta(hours=1)
+        )
+
+    def test_fecha_limite_por_prestamo_categoria_o_defecto(self):
+        prestamo, _, _ = prestar_herramientas(self.trabajador, self.usuario, ['HER-1', 'ESM-1'])
+        limites = {d.herramienta.codigo_qr: d.fecha_limite - prestamo.fecha_solicitud
+                   for d in DetallePrestamo.objects.select_related('herramienta')}
+        self.assertEqual(limites, {'HER-1': timedelta(hours=24), 'ESM-1': timedelta(hours=4)})
+
+        prestamo, _, _ = prestar_herramientas(self.trabajador, self.usuario, ['HER-2', 'HER-3'], plazo_horas=8)
+        self.assertEqual(
+            {d.fecha_limite - prestamo.fecha_solicitud for d in prestamo.detalleprestamo_set.all()},
+            {timedelta(hours=8)}
+        )
+
+    def test_crea_y_resuelve_alertas(self):
+        prestar_herramientas(self.trabajador, self.usuario, ['HER-1', 'HER-2', 'HER-3', 'ESM-1'])
+        self._vencer('HER-1', 'HER-2', 'HER-3')
+        # Dada de baja en préstamo antes de detectarse: nunca genera alerta
+        dar_de_baja(Herramienta.objects.filter(codigo_qr='HER-3'), self.usuario)
+
+        self.assertEqual(self._detectar('--correo'), {'HER-1': False, 'HER-2': False})
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(self._detectar('--correo'), {'HER-1': False, 'HER-2': False})
+        self.assertEqual(len(mail.outbox), 1)  # Sin atrasos nuevos no se vuelve a enviar
+
+        devolver_herramientas([{'codigo': 'HER-1', 'estado': 'DISPONIBLE'}], usuario=self.usuario)
+        self.assertEqual(self._detectar(), {'HER-1': True, 'HER-2': False})
+
+        dar_de_baja(Herramienta.objects.filter(codigo_qr='HER-2'), self.usuario)
+        self.assertTrue(AlertaAtraso.objects.get(detalle__herramienta__codigo_qr='HER-2').resuelta)
+        self.assertEqual(self._detectar(), {'HER-1': True, 'HER-2': True})
+
+
+# ==============================================================================
+# ANALÍTICA DE USO
+# ==============================================================================
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class AnaliticaTests(TestCase):
+
+    def test_fechas_llegan_como_segundos_epoch(self):
+        usuario = User.objects.create_user('jefe', password='x', is_staff=True)
+        trabajador = Trabajador.objects.create(rut='11111111-1', nombre='Luis', apellido='Rojas', cargo='Maestro')
+        _herramientas(('HER-1', 'DISPONIBLE'), ('HER-2', 'DISPONIBLE'))
+        prestamo, _, _ = prestar_herramientas(trabajador, usuario, ['HER-1', 'HER-2'])
+        devueltos, _ = devolver_herramientas([{'codigo': 'HER-1', 'estado': 'EN_MANTENCION'}], usuario=usuario)
+
+        hasta = timezone.now() + timedelta(minutes=1)
+        ids, inicios, fines, fallas = analitica.cargar_prestamos(hasta - timedelta(days=1), hasta)
+        orden = np.argsort(ids)
+        self.assertAlmostEqual(inicios[orden[0]], prestamo.fecha_solicitud.timestamp(), delta=0.01)
+        self.assertAlmostEqual(fines[orden[0]], devueltos[0].fecha_devolucion.timestamp(), delta=0.01)
+        self.assertTrue(np.isnan(fines[orden[1]]))  # Sigue prestada
+        self.assertEqual(fallas[orden].tolist(), [True, False])
+
+        ids, inicios, fines = analitica.cargar_mantenciones(hasta - timedelta(days=1), hasta)
+        self.assertAlmostEqual(inicios[0], devueltos[0].fecha_devolucion.timestamp(), delta=0.01)
+        self.assertTrue(np.isnan(fines[0]))
+
+
+# ==============================================================================
+# PAQUETES DE ASSETS
+# ==============================================================================
+
+class PaquetesAssetsTests(TestCase):
+
+    def test_paquetes_con_fuentes_en_el_repositorio_estan_construidos(self):
+        # Los de vendor sólo se pueden armar con --descargar; los demás no tienen excusa
+        faltantes, desactualizados = assets.revisar(assets.leer_static)
+        construibles = [
+            paquete for paquete, rutas in assets.PAQUETES.items()
+            if all(assets.leer_static(ruta) is not None for ruta in rutas)
+        ]
+        self.assertEqual([p for p in faltantes if p in construibles], [])
+        self.assertEqual(desactualizados, [])
+
+    def test_check_de_deploy_detecta_faltantes_y_desactualizados(self):
+        archivos = {ruta: f'/* {ruta} */' for rutas in assets.PAQUETES.values() for ruta in rutas}
+        for paquete in assets.PAQUETES:
+            archivos[f'{assets.DIST_DIR}/{paquete}'] = assets.construir(paquete, archivos.get)
+        with mock.patch.object(assets, 'leer_static', archivos.get):
+            self.assertEqual(assets.revisar_paquetes(), [])
+
+            del archivos[f'{assets.DIST_DIR}/base.css']
+            archivos['bodega/js/conteo.js'] += '\nconsole.log(1);'
+            self.assertEqual(
+                [(error.id, error.msg) for error in assets.revisar_paquetes()],
+                [('bodega.E001', 'Falta el paquete bodega/dist/base.css.'),
+                 ('bodega.E002', 'El paquete bodega/dist/conteo.js no coincide con sus fuentes.')]
+            )
+
+            # Sin los archivos de vendor no hay cómo construirlo: sólo se avisa
+            del archivos['bodega/vendor/bootstrap-icons.css']
+            self.assertEqual(
+                [(error.id, error.level) for error in assets.revisar_paquetes()],
+                [('bodega.W001', checks.WARNING), ('bodega.E002', checks.ERROR)]
+            )
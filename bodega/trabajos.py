@@ -0,0 +1,251 @@
+"""
+Reportes pesados en segundo plano.
+
+Un año de transacciones o toda la historia de bajas no alcanza a generarse
+dentro del timeout de un worker síncrono de Gunicorn, y mientras tanto ese
+worker no atiende el mesón. La vista encola un TrabajoReporte (una fila: la
+cola es la propia base, sin broker) y el comando procesar_trabajos los toma y
+los ejecuta en un pool de procesos. Cada generador escribe un CSV e informa
+su avance; la página "Mis reportes" muestra el progreso y ofrece la descarga.
+
+Tomar un trabajo es un UPDATE condicional (PENDIENTE -> EN_CURSO), así que
+varios procesar_trabajos, incluso en otras máquinas, comparten la cola. Un
+trabajo EN_CURSO que deja de latir (su proceso murió) vuelve a la cola hasta
+TRABAJOS_INTENTOS veces. El latido lo manda un hilo aparte mientras corre el
+generador, no el generador mismo: una consulta larga no debe parecer un
+proceso muerto. Cada toma suma un intento y el resultado sólo se guarda si
+el trabajo sigue EN_CURSO con el intento que se tomó; si otro proceso lo
+retomó, gana el más reciente.
+"""
+import csv
+import io
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections, connection
+from django.db.models import F
+from django.utils import timezone
+
+from . import reportes
+from .alcance import ubicaciones_usuario
+from .filtros import leer_rango
+from .models import TrabajoReporte
+from .routers import leyendo_en_replica
+
+# Cada cuántos segundos se escribe el avance en la base
+INTERVALO_AVANCE = 2
+# Latidos por cada TRABAJOS_LATIDO_MAXIMO: alcanza con que llegue uno de ellos
+LATIDOS_POR_PLAZO = 4
+LOTE = 2000
+
+# tipo -> función(trabajo, escritor csv, avance) que escribe las filas y devuelve cuántas
+GENERADORES = {}
+
+
+def generador(tipo):
+    def registrar(funcion):
+        GENERADORES[tipo] = funcion
+        return funcion
+    return registrar
+
+
+def _fecha(valor):
+    return timezone.localtime(valor).strftime('%d/%m/%Y %H:%M') if valor else ''
+
+# ==============================================================================
+# 1. COLA
+# ==============================================================================
+
+def encolar(tipo, parametros, usuario):
+    return TrabajoReporte.objects.create(tipo=tipo, parametros=parametros, usuario=usuario)
+
+
+def tomar():
+    """Pasa a EN_CURSO el pendiente más antiguo y devuelve su id (None si no hay)."""
+    while True:
+        trabajo_id = TrabajoReporte.objects.filter(estado='PENDIENTE').order_by('creado').values_list(
+            'id', flat=True
+        ).first()
+        if trabajo_id is None:
+            return None
+        ahora = timezone.now()
+        if TrabajoReporte.objects.filter(id=trabajo_id, estado='PENDIENTE').update(
+            estado='EN_CURSO', iniciado=ahora, latido=ahora, intentos=F('intentos') + 1
+        ):
+            return trabajo_id
+        # Otro procesar_trabajos lo tomó primero: se intenta con el siguiente
+
+
+def reencolar_colgados():
+    """Devuelve a la cola los EN_CURSO sin latido reciente. Devuelve (reencolados, fallidos)."""
+    colgados = TrabajoReporte.objects.filter(
+        estado='EN_CURSO', latido__lt=timezone.now() - timedelta(seconds=settings.TRABAJOS_LATIDO_MAXIMO)
+    )
+    fallidos = colgados.filter(intentos__gte=settings.TRABAJOS_INTENTOS).update(
+        estado='ERROR', mensaje="El proceso que lo generaba se detuvo.", terminado=timezone.now()
+    )
+    reencolados = colgados.filter(intentos__lt=settings.TRABAJOS_INTENTOS).update(estado='PENDIENTE', progreso=0)
+    return reencolados, fallidos
+
+
+def limpiar(dias):
+    """Borra los trabajos terminados hace más de 'dias', con su archivo. Devuelve cuántos."""
+    viejos = list(TrabajoReporte.objects.filter(
+        estado__in=('LISTO', 'ERROR'), terminado__lt=timezone.now() - timedelta(days=dias)
+    ))
+    for trabajo in viejos:
+        if trabajo.archivo:
+            trabajo.archivo.delete(save=False)
+        trabajo.delete()
+    return len(viejos)
+
+# ==============================================================================
+# 2. EJECUCIÓN (EN LOS PROCESOS DEL POOL)
+# ==============================================================================
+
+def _propio(trabajo):
+    """El trabajo tal como se tomó: si otro proceso lo retomó, el filtro no encuentra nada."""
+    return TrabajoReporte.objects.filter(id=trabajo.id, estado='EN_CURSO', intentos=trabajo.intentos)
+
+
+class _Avance:
+    """Callback de progreso: escribe en la base a lo más cada INTERVALO_AVANCE segundos."""
+
+    def __init__(self, trabajo):
+        self.trabajo = trabajo
+        self._ultimo = time.monotonic()
+
+    def __call__(self, fraccion):
+        if time.monotonic() - self._ultimo < INTERVALO_AVANCE:
+            return
+        self._ultimo = time.monotonic()
+        _propio(self.trabajo).update(progreso=min(int(fraccion * 100), 99), latido=timezone.now())
+
+
+class _Latido(threading.Thread):
+    """Marca el latido cada cierto tiempo mientras el trabajo corre, avance o no el generador."""
+
+    def __init__(self, trabajo):
+        super().__init__(name=f'latido-{trabajo.id}', daemon=True)
+        self.trabajo = trabajo
+        self.detener = threading.Event()
+
+    def run(self):
+        intervalo = settings.TRABAJOS_LATIDO_MAXIMO / LATIDOS_POR_PLAZO
+        try:
+            while not self.detener.wait(intervalo):
+                _propio(self.trabajo).update(latido=timezone.now())
+        finally:
+            connection.close()  # La conexión es de este hilo
+
+
+def _retomado(trabajo):
+    return 'DESCARTADO', f"Intento {trabajo.intentos} reemplazado: otro proceso retomó el trabajo."
+
+
+def ejecutar(trabajo_id):
+    """Genera el archivo de un trabajo ya tomado. Devuelve (estado, mensaje)."""
+    close_old_connections()
+    trabajo = TrabajoReporte.objects.select_related('usuario').get(id=trabajo_id)
+    latido = _Latido(trabajo)
+    latido.start()
+    try:
+        with tempfile.TemporaryFile() as salida:
+            texto = io.TextIOWrapper(salida, encoding='utf-8-sig', newline='')
+            # Punto y coma: el Excel en español usa la coma como separador decimal
+            escritor = csv.writer(texto, delimiter=';')
+            # Sólo la lectura va a la réplica; el archivo y el estado se escriben en la principal
+            with leyendo_en_replica() if settings.TRABAJOS_EN_REPLICA else nullcontext():
+                filas = GENERADORES[trabajo.tipo](trabajo, escritor, _Avance(trabajo))
+            texto.flush()
+            texto.detach()
+            salida.seek(0)
+            trabajo.archivo.save(trabajo.nombre_descarga(), File(salida), save=False)
+    except Exception as error:
+        mensaje = f"{type(error).__name__}: {error}"[:255]
+        if not _propio(trabajo).update(estado='ERROR', mensaje=mensaje, terminado=timezone.now()):
+            return _retomado(trabajo)
+        return 'ERROR', mensaje
+    finally:
+        latido.detener.set()
+        latido.join()
+        close_old_connections()
+
+    if not _propio(trabajo).update(
+        estado='LISTO', progreso=100, filas=filas, archivo=trabajo.archivo.name, terminado=timezone.now()
+    ):
+        trabajo.archivo.delete(save=False)
+        return _retomado(trabajo)
+    return 'LISTO', f"{filas} filas"
+
+# ==============================================================================
+# 3. GENERADORES
+# ==============================================================================
+
+@generador('TRANSACCIONES')
+def _transacciones(trabajo, escritor, avance):
+    consulta, _ = reportes.transacciones(trabajo.parametros, ubicaciones_usuario(trabajo.usuario))
+    total = consulta.count() or 1
+    escritor.writerow([
+        'Fecha préstamo', 'QR', 'Herramienta', 'Trabajador', 'RUT', 'Bodeguero',
+        'Devuelto', 'Fecha devolución', 'Estado devolución', 'Observación',
+    ])
+    filas = 0
+    for detalle in consulta.iterator(chunk_size=LOTE):
+        prestamo = detalle.prestamo
+        escritor.writerow([
+            _fecha(prestamo.fecha_solicitud), detalle.herramienta.codigo_qr, detalle.herramienta.nombre,
+            f"{prestamo.trabajador.nombre} {prestamo.trabajador.apellido}", prestamo.trabajador.rut,
+            prestamo.bodeguero.username, 'Sí' if detalle.devuelto else 'No', _fecha(detalle.fecha_devolucion),
+            detalle.get_estado_devolucion_display() or '', detalle.observacion_falla or '',
+        ])
+        filas += 1
+        avance(filas / total)
+    return filas
+
+
+@generador('BAJAS')
+def _bajas(trabajo, escritor, avance):
+    consulta, _ = reportes.bajas(trabajo.parametros, ubicaciones_usuario(trabajo.usuario))
+    total = consulta.count() or 1
+    escritor.writerow(['Fecha', 'Acción', 'QR', 'Herramienta', 'Motivo', 'Usuario'])
+    filas = 0
+    for evento in consulta.iterator(chunk_size=LOTE):
+        escritor.writerow([
+            _fecha(evento.fecha_evento), evento.get_accion_display(), evento.herramienta.codigo_qr,
+            evento.herramienta.nombre, evento.motivo, evento.usuario.username if evento.usuario else '',
+        ])
+        filas += 1
+        avance(filas / total)
+    return filas
+
+
+@generador('ANALITICA')
+def _analitica(trabajo, escritor, avance):
+    # Import diferido: NumPy sólo se carga en los procesos que generan analítica
+    from .analitica import analizar
+    from .views import ANALITICA_DIAS_DEFECTO
+
+    rango = leer_rango(trabajo.parametros, ANALITICA_DIAS_DEFECTO)
+    # Sin límite: todas las herramientas, no sólo las 50 de la página
+    reporte = analizar(rango.inicio, rango.fin, ubicaciones_usuario(trabajo.usuario), limite_herramientas=None)
+    avance(0.9)
+    columnas = (
+        'prestamos', 'utilizacion', 'horas_promedio_fuera', 'horas_mantencion', 'reparaciones',
+        'horas_promedio_reparacion', 'devoluciones', 'fallas', 'tasa_falla',
+    )
+    escritor.writerow([
+        'Grupo', 'Nombre', 'Préstamos', 'Utilización %', 'Horas promedio fuera', 'Horas en mantención',
+        'Reparaciones', 'Horas promedio reparación', 'Devoluciones', 'Fallas', 'Tasa de falla %',
+    ])
+    filas = 0
+    for grupo, clave in (('Categoría', 'categorias'), ('Ubicación', 'ubicaciones'), ('Herramienta', 'herramientas')):
+        for fila in reporte[clave]:
+            escritor.writerow([grupo, fila['nombre'], *(fila[c] if fila[c] is not None else '' for c in columnas)])
+            filas += 1
+    return filas
@@ -4,6 +4,7 @@ from . import views
 urlpatterns = [
     # --- 1. PÁGINA PRINCIPAL ---
     path('', views.inicio, name='inicio'),
+    path('sw.js', views.service_worker, name='service_worker'), # Caché offline de assets
 
     # --- 2. OPERACIÓN BODEGUERO ---
     path('prestamo/', views.registrar_prestamo, name='prestamo'), 
@@ -13,6 +14,18 @@ urlpatterns = [
 
     # --- 3. CONEXIÓN API REST ---
     path('api/verificar/', views.api_verificar_qr, name='api_verificar'),
+    path('api/verificar/lote/', views.api_verificar_lote, name='api_verificar_lote'),
+    path('api/prestamo/', views.api_registrar_prestamo, name='api_prestamo'),
+    path('api/devolucion/', views.api_registrar_devolucion, name='api_devolucion'),
+    path('api/mantencion/liberar/', views.api_liberar_mantencion, name='api_liberar_mantencion'),
+    path('api/fotos/', views.api_crear_subida, name='api_crear_subida'), # Fotos de evidencia por partes
+    path('api/fotos/<uuid:subida_id>/', views.api_subida, name='api_subida'),
+    path('api/eventos/', views.api_eventos, name='api_eventos'), # Polling (WSGI)
+    path('api/eventos/stream/', views.stream_eventos, name='stream_eventos'), # SSE (ASGI)
+    path('api/herramientas/', views.api_herramientas, name='api_herramientas'), # Catálogo JSON
+    path('api/trabajadores/<str:rut>/', views.api_trabajador, name='api_trabajador'), # Saldo por RUT
+    path('api/trabajos/<uuid:trabajo_id>/', views.api_trabajo, name='api_trabajo'), # Avance de un reporte en segundo plano
+    path('api/conteos/<int:conteo_id>/lecturas/', views.api_lecturas_conteo, name='api_lecturas_conteo'), # Lote escaneado en un conteo
 
     # --- 4. GESTIÓN Y REPORTES ---
     path('reportes/menu/', views.menu_reportes, name='menu_reportes'),
@@ -21,15 +34,27 @@ urlpatterns = [
     path('herramientas-disponibles/', views.herramientas_disponibles, name='herramientas_disponibles'), # Herramientas activas para prestamo
     path('en-uso/', views.herramientas_en_uso, name='herramientas_en_uso'),
     path('trabajadores/', views.lista_trabajadores, name='lista_trabajadores'),
+    path('trabajadores/<int:id>/', views.perfil_trabajador, name='perfil_trabajador'),
     path('reportes/transacciones/', views.historial_transacciones, name='historial_transacciones'),
 
     # --- ¡ESTAS SON LAS QUE FALTABAN! (Reportes Nuevos) ---
     path('reportes/estadisticas/', views.estadisticas_uso, name='estadisticas'),
     path('reportes/bajas/', views.reporte_bajas, name='reporte_bajas'),
+    path('reportes/analitica/', views.analitica_uso, name='analitica_uso'),
+    path('reportes/stock-historico/', views.stock_historico, name='stock_historico'),
+    path('perfiles/', views.perfiles, name='perfiles'), # Perfilado de peticiones (staff)
+    path('perfiles/<str:nombre>', views.descargar_perfil, name='descargar_perfil'),
+    path('reportes/generar/<str:tipo>/', views.generar_reporte, name='generar_reporte'), # Encola (segundo plano)
+    path('reportes/trabajos/', views.lista_trabajos, name='trabajos'),
+    path('reportes/trabajos/<uuid:trabajo_id>/descargar/', views.descargar_trabajo, name='descargar_trabajo'),
+    path('conteos/', views.lista_conteos, name='conteos'), # Conteo físico de inventario
+    path('conteos/<int:conteo_id>/', views.ver_conteo, name='ver_conteo'),
+    path('conteos/<int:conteo_id>/cerrar/', views.cerrar_conteo, name='cerrar_conteo'),
 
     # --- 5. RUTAS DINÁMICAS (Acciones) ---
     path('imprimir/<int:herramienta_id>/', views.imprimir_qr, name='imprimir_qr'),
     path('liberar/<int:herramienta_id>/', views.liberar_herramienta, name='liberar_herramienta'),
+    path('liberar/lote/', views.liberar_lote, name='liberar_lote'),
 
     # --- 6. RUTAS DE ELIMINACIÓN (BORRADO LÓGICO) ---
     path('herramienta/eliminar/<int:id>/', views.eliminar_herramienta, name='eliminar_herramienta'),
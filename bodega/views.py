@@ -1,13 +1,33 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST, require_http_methods
+from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
-from django.http import JsonResponse
+from django.utils.timesince import timesince
+from django.http import JsonResponse, StreamingHttpResponse, FileResponse, Http404
+from django.templatetags.static import static
+from django.core.handlers.asgi import ASGIRequest
+from django.conf import settings
 from django.contrib import messages
-from datetime import datetime, time
-from django.db.models import Count, Q, Case, When, Value, IntegerField
+from datetime import timedelta
+from django.db.models import Count, Q, F, Case, When, Value, IntegerField, Avg, OuterRef, Subquery
+import hashlib
 import json
-
-from .models import Herramienta, Prestamo, DetallePrestamo, Trabajador, Categoria, Ubicacion, HistorialBaja
+from asgiref.sync import sync_to_async
+
+from .models import Herramienta, DetallePrestamo, Trabajador, SaldoTrabajador, Categoria, Ubicacion, Mantencion, SubidaFoto, TrabajoReporte, ConteoInventario, LecturaConteo
+from .eventos import bus, publicar_trabajadores
+from .servicios import prestar_herramientas, devolver_herramientas, dar_de_baja, reactivar, liberar_herramientas
+from .inventario import version_inventario
+from .routers import lectura_en_replica
+from .compresion import respuesta_comprimida
+from .assets import PAQUETES, VENDOR, VENDOR_DIR, archivos_de, existe
+from .movimientos import stock_en
+from .filtros import leer_rango, leer_momento
+from . import reportes, trabajos
+from . import conteos, nomina, perfilador, subidas
+from .alcance import ubicaciones_usuario, aubicaciones_usuario, filtrar_por_ubicacion, herramientas_de, evento_visible
 
 # ==============================================================================
 # 1. DASHBOARD PRINCIPAL
@@ -17,12 +37,17 @@ def inicio(request):
     es_admin = request.user.is_superuser or request.user.is_staff
 
     if es_admin:
+        # Tomamos el id del canal en vivo ANTES de contar, así ningún cambio queda fuera
+        ultimo_evento = bus.ultimo_id
+
         # contamos solo lo que está realmente en la bodega (estado='DISPONIBLE')
-        stock_disponible = Herramienta.objects.filter(activo=True, estado='DISPONIBLE').count()
+        # (sólo las bodegas asignadas al usuario, si tiene)
+        herramientas = herramientas_de(request.user)
+        stock_disponible = herramientas.filter(activo=True, estado='DISPONIBLE').count()
         
-        prestamos_activos = Herramienta.objects.filter(estado='EN_USO', activo=True).count()
+        prestamos_activos = herramientas.filter(estado='EN_USO', activo=True).count()
         total_trabajadores = Trabajador.objects.filter(activo=True).count()
-        en_mantencion = Herramienta.objects.filter(estado='EN_MANTENCION', activo=True).count()
+        en_mantencion = herramientas.filter(estado='EN_MANTENCION', activo=True).count()
         
         # Renderizamos con KPIs para ver estadisticas rapidas en el dashboard
         return render(request, 'bodega/inicio.html', {
@@ -30,7 +55,8 @@ def inicio(request):
             'kpi_total': stock_disponible, # Stock disponible para prestamos (estado DISPONIBLE)
             'kpi_prestamos': prestamos_activos, # Prestamos activos (estado EN_USO)
             'kpi_trabajadores': total_trabajadores, # Trabajadores activos
-            'kpi_mantencion': en_mantencion # Herramientas en mantención (estado EN_MANTENCION)
+            'kpi_mantencion': en_mantencion, # Herramientas en mantención (estado EN_MANTENCION)
+            'ultimo_evento': ultimo_evento # Punto de partida del canal en vivo
         })
     
     return render(request, 'bodega/inicio.html', {
@@ -41,6 +67,15 @@ def inicio(request):
 # 2. PRÉSTAMO MULTICARGA
 # ==============================================================================
 
+def _plazo_horas(valor):
+    """Plazo opcional del préstamo en horas: None si viene vacío, ValueError si no es válido."""
+    if valor in (None, ''):
+        return None
+    horas = int(valor)
+    if horas < 1:
+        raise ValueError(valor)
+    return horas
+
 @login_required
 def registrar_prestamo(request):
     trabajadores_activos = Trabajador.objects.filter(activo=True).order_by('nombre')
@@ -50,6 +85,12 @@ def registrar_prestamo(request):
         lista_qrs_json = request.POST.get('lista_qrs')
         observaciones = request.POST.get('observaciones', '')
 
+        try:
+            plazo_horas = _plazo_horas(request.POST.get('plazo_horas'))
+        except ValueError:
+            messages.error(request, "El plazo debe ser un número entero de horas mayor que cero.")
+            return render(request, 'bodega/prestamo.html', {'trabajadores': trabajadores_activos})
+
         if not lista_qrs_json:
             messages.warning(request, "⚠️ No se detectaron herramientas. Por favor escanee o ingrese un código.")
             return render(request, 'bodega/prestamo.html', {'trabajadores': trabajadores_activos})
@@ -70,36 +111,13 @@ def registrar_prestamo(request):
 
         trabajador = get_object_or_404(Trabajador, id=trabajador_id)
         
-        nuevo_prestamo = Prestamo.objects.create(
-            trabajador=trabajador,
-            bodeguero=request.user,
-            fecha_solicitud=timezone.now(),
-            observacion=observaciones
+        nuevo_prestamo, guardados, errores = prestar_herramientas(
+            trabajador, request.user, lista_qrs, observaciones,
+            ubicaciones=ubicaciones_usuario(request.user),
+            plazo_horas=plazo_horas
         )
-        
-        guardados = 0
-        errores = []
-        
-        for codigo in lista_qrs:
-            try:
-                herramienta = Herramienta.objects.get(codigo_qr=codigo, activo=True)
-                
-                if herramienta.estado == 'DISPONIBLE':
-                    DetallePrestamo.objects.create(
-                        prestamo=nuevo_prestamo,
-                        herramienta=herramienta
-                    )
-                    herramienta.estado = 'EN_USO'
-                    herramienta.save()
-                    guardados += 1
-                else:
-                    errores.append(f"{herramienta.nombre} no disponible ({herramienta.estado})")
-                    
-            except Herramienta.DoesNotExist:
-                errores.append(f"QR {codigo} no existe o fue dado de baja")
 
         if guardados == 0:
-            nuevo_prestamo.delete()
             if errores:
                 messages.error(request, f"No se pudo realizar el préstamo: {', '.join(errores)}")
             else:
@@ -121,6 +139,12 @@ def registrar_prestamo(request):
 # ==============================================================================
 # 3. DEVOLUCIÓN Y MERMAS
 # ==============================================================================
+
+def _config_fotos():
+    """Reducción que aplica el navegador antes de subir (data-* de la página)."""
+    # str(): con LANGUAGE_CODE es-cl la plantilla mostraría "0,8"
+    return {'foto_lado_maximo': settings.FOTO_LADO_MAXIMO, 'foto_calidad': str(settings.FOTO_CALIDAD)}
+
 @login_required
 def registrar_devolucion(request):
     ultimas_devoluciones = None 
@@ -131,56 +155,27 @@ def registrar_devolucion(request):
         qrs = request.POST.getlist('qrs[]')
         estados = request.POST.getlist('estados[]')
         observaciones = request.POST.getlist('observaciones[]')
-        
-        guardados = 0
-        errores = []
-
-        for i, codigo_qr in enumerate(qrs):
-            try:
-                foto = request.FILES.get(f'foto_{i}')
-                estado = estados[i]
-                obs = observaciones[i]
-
-                herramienta = Herramienta.objects.get(codigo_qr=codigo_qr)
-                
-                detalle = DetallePrestamo.objects.filter(herramienta=herramienta, devuelto=False).first()
-
-                if detalle:
-                    ahora = timezone.now()
-
-                    detalle.devuelto = True
-                    detalle.estado_devolucion = estado
-                    detalle.fecha_devolucion = ahora
-                    detalle.observacion_falla = obs
-                    if foto:
-                        detalle.foto_evidencia = foto
-                    detalle.save()
-
-                    prestamo_padre = detalle.prestamo
-                    pendientes = DetallePrestamo.objects.filter(prestamo=prestamo_padre, devuelto=False).count()
-                    
-                    if pendientes == 0:
-                        prestamo_padre.fecha_devolucion = ahora
-                        prestamo_padre.save()
-
-                    if estado == 'EN_MANTENCION':
-                        herramienta.estado = 'EN_MANTENCION'
-                    else:
-                        herramienta.estado = 'DISPONIBLE'
-                    herramienta.save()
-                    
-                    guardados += 1
-                else:
-                    errores.append(f"{codigo_qr}: No estaba prestado.")
-
-            except Herramienta.DoesNotExist:
-                errores.append(f"{codigo_qr}: No existe.")
+        # Ids de fotos ya subidas por partes ('' si el ítem no lleva foto)
+        fotos = request.POST.getlist('fotos[]')
+        subidas_listas = subidas.fotos_completas(request.user, fotos)
+
+        items = [{
+            'codigo': codigo_qr,
+            'estado': estados[i],
+            'observacion': observaciones[i],
+            # foto_{i}: formulario antiguo con el archivo adjunto
+            'foto': subidas_listas.get(fotos[i] if i < len(fotos) else '') or request.FILES.get(f'foto_{i}')
+        } for i, codigo_qr in enumerate(qrs)]
+
+        devueltos, errores = devolver_herramientas(
+            items, ubicaciones=ubicaciones_usuario(request.user), usuario=request.user
+        )
+        subidas.marcar_usadas(subidas_listas, devueltos)
+        guardados = len(devueltos)
 
         if guardados > 0:
             mensaje = f"✅ Éxito: Se procesaron {guardados} devoluciones correctamente."
-            ultimas_devoluciones = DetallePrestamo.objects.filter(
-                devuelto=True
-            ).order_by('-fecha_devolucion')[:guardados] 
+            ultimas_devoluciones = devueltos
         
         if errores:
             error_msg = "Alertas: " + ", ".join(errores)
@@ -188,70 +183,41 @@ def registrar_devolucion(request):
         return render(request, 'bodega/devolucion.html', {
             'mensaje': mensaje,
             'error': error_msg,
-            'ultimas_devoluciones': ultimas_devoluciones
+            'ultimas_devoluciones': ultimas_devoluciones,
+            **_config_fotos(),
         })
 
     return render(request, 'bodega/devolucion.html', {
-        'ultimas_devoluciones': None 
+        'ultimas_devoluciones': None,
+        **_config_fotos(),
     })
 
 # ==============================================================================
 # 4. REPORTES Y FILTROS (CON FECHAS ACTIVAS)
 # ==============================================================================
 
+def _rango_grande(rango):
+    """Sin límite o más largo que REPORTE_DIAS_SINCRONO: mejor generarlo en segundo plano."""
+    dias = rango.dias()
+    return dias is None or dias > settings.REPORTE_DIAS_SINCRONO
+
 @login_required
+@lectura_en_replica
 def ver_reportes(request):
     """
     Muestra la bitácora completa con ordenamiento dinámico.
     """
-    # 1. Captura de parámetros
-    fecha_inicio_str = request.GET.get('fecha_inicio', '')
-    fecha_fin_str = request.GET.get('fecha_fin', '')
-    busqueda = request.GET.get('q', '')
-    orden_param = request.GET.get('orden', '')
-
-    # 2. CONFIGURACIÓN DE ORDENAMIENTO (Diccionario de Mapeo)
-    # Traduce lo que llega de la URL a campos reales de la BD
-    opciones_orden = {
-        'fecha': 'fecha_evento',
-        '-fecha': '-fecha_evento',
-        'accion': 'accion',
-        '-accion': '-accion',
-        'herramienta': 'herramienta__nombre',
-        '-herramienta': '-herramienta__nombre',
-        'motivo': 'motivo',
-        '-motivo': '-motivo',
-        'usuario': 'usuario__username',
-        '-usuario': '-usuario__username',
-    }
-    
-    # Si el parámetro no está en el diccionario, usa '-fecha_evento' por defecto
-    criterio_final = opciones_orden.get(orden_param, '-fecha_evento')
-
-    # 3. Consulta Base
-    historial = HistorialBaja.objects.select_related('herramienta', 'usuario').all().order_by(criterio_final)
-
-    # 4. Filtros
-    if busqueda:
-        historial = historial.filter(
-            Q(herramienta__nombre__icontains=busqueda) |
-            Q(herramienta__codigo_qr__icontains=busqueda) |
-            Q(motivo__icontains=busqueda)
-        )
-
-    if fecha_inicio_str:
-        historial = historial.filter(fecha_evento__date__gte=fecha_inicio_str)
-    
-    if fecha_fin_str:
-        historial = historial.filter(fecha_evento__date__lte=fecha_fin_str)
+    historial, rango = reportes.bajas(request.GET, ubicaciones_usuario(request.user))
+    for error in rango.errores:
+        messages.warning(request, error)
 
     return render(request, 'bodega/reportes.html', {
         'reportes': historial,
         'total_mermas': historial.count(),
-        'busqueda': busqueda,
-        'filtro_inicio': fecha_inicio_str,
-        'filtro_fin': fecha_fin_str,
-        'orden_actual': orden_param # Enviamos esto para que el HTML sepa qué flecha pintar
+        'busqueda': request.GET.get('q', ''),
+        **rango.contexto(),
+        'sugerir_segundo_plano': _rango_grande(rango),
+        'orden_actual': request.GET.get('orden', '') # Enviamos esto para que el HTML sepa qué flecha pintar
     })
 
 @login_required
@@ -264,45 +230,430 @@ def menu_reportes(request):
     return render(request, 'bodega/menu_reportes.html')
 
 @login_required
+@lectura_en_replica
 def reporte_bajas(request):
     if not request.user.is_staff:
         messages.error(request, "Acceso denegado.")
         return redirect('inicio')
     
-    herramientas_baja = Herramienta.objects.filter(activo=False).order_by('-id')
+    herramientas_baja = herramientas_de(request.user).filter(activo=False).select_related('categoria').order_by('-id')
     return render(request, 'bodega/listas/reporte_bajas.html', {
         'herramientas': herramientas_baja
     })
 
 # ==============================================================================
-# 5. API REST
+# 5. API REST (ASYNC)
 # ==============================================================================
-def api_verificar_qr(request):
+# Endpoints del escáner. Son vistas async: bajo ASGI (uvicorn) la espera a MySQL
+# no bloquea un worker completo. Las escrituras van por servicios.py dentro de
+# sync_to_async porque el ORM async todavía no soporta transacciones.
+
+# Máximo de códigos aceptados por petición en los endpoints por lote
+API_LOTE_MAXIMO = 500
+
+def _datos_verificacion(herramienta):
+    esta_disponible = (herramienta.estado == 'DISPONIBLE')
+
+    if esta_disponible:
+        mensaje = "OK"
+    else:
+        mensaje = f"⚠️ ¡Cuidado! {herramienta.nombre} ya figura como PRESTADA (o en mantención)."
+
+    return {
+        'existe': True,
+        'estado': herramienta.estado,
+        'disponible': esta_disponible,
+        'nombre': herramienta.nombre,
+        'marca': herramienta.marca,
+        'mensaje': mensaje
+    }
+
+NO_EXISTE = {
+    'existe': False,
+    'mensaje': "❌ Error: El código escaneado NO existe en el sistema."
+}
+
+def _leer_json(request):
+    try:
+        datos = json.loads(request.body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    return datos if isinstance(datos, dict) else None
+
+def _lista_codigos(datos):
+    """
+    La lista "codigos" del body, o None si no es una lista de hasta
+    API_LOTE_MAXIMO strings (un objeto o número llegaría al IN y al
+    dict.fromkeys de los servicios).
+    """
+    codigos = datos.get('codigos') if datos else None
+    if not isinstance(codigos, list) or len(codigos) > API_LOTE_MAXIMO:
+        return None
+    if not all(isinstance(codigo, str) for codigo in codigos):
+        return None
+    return codigos
+
+async def api_verificar_qr(request):
     codigo = request.GET.get('codigo', '')
+    ubicaciones = await aubicaciones_usuario(await request.auser())
     
     try:
-        herramienta = Herramienta.objects.get(codigo_qr=codigo, activo=True)
-        esta_disponible = (herramienta.estado == 'DISPONIBLE')
-        
-        if esta_disponible:
-            mensaje = "OK"
-        else:
-            mensaje = f"⚠️ ¡Cuidado! {herramienta.nombre} ya figura como PRESTADA (o en mantención)."
-
-        return JsonResponse({
-            'existe': True,
-            'estado': herramienta.estado,
-            'disponible': esta_disponible,
-            'nombre': herramienta.nombre,
-            'marca': herramienta.marca,
-            'mensaje': mensaje
-        })
-            
+        herramienta = await filtrar_por_ubicacion(Herramienta.objects, ubicaciones).aget(codigo_qr=codigo, activo=True)
     except Herramienta.DoesNotExist:
-        return JsonResponse({
-            'existe': False,
-            'mensaje': "❌ Error: El código escaneado NO existe en el sistema."
-        })
+        return JsonResponse(NO_EXISTE)
+
+    return JsonResponse(_datos_verificacion(herramienta))
+
+@csrf_exempt # Sólo lectura, igual que api_verificar_qr
+@require_POST
+async def api_verificar_lote(request):
+    """
+    Verifica muchos códigos en una sola consulta.
+    Body: {"codigos": ["HER-1", "HER-2", ...]}
+    """
+    codigos = _lista_codigos(_leer_json(request))
+    if codigos is None:
+        return JsonResponse({'error': f'Envíe una lista "codigos" de hasta {API_LOTE_MAXIMO} textos.'}, status=400)
+
+    ubicaciones = await aubicaciones_usuario(await request.auser())
+    encontrados = {}
+    async for herramienta in filtrar_por_ubicacion(Herramienta.objects, ubicaciones).filter(codigo_qr__in=codigos, activo=True):
+        encontrados[herramienta.codigo_qr] = _datos_verificacion(herramienta)
+
+    return JsonResponse({
+        'resultados': {codigo: encontrados.get(codigo, NO_EXISTE) for codigo in codigos}
+    })
+
+@login_required
+@require_POST
+async def api_registrar_prestamo(request):
+    """
+    Body: {"trabajador": id, "codigos": [...], "observaciones": "...", "plazo_horas": 8}
+    ("plazo_horas" es opcional; sin él rige el plazo de cada categoría)
+    """
+    datos = _leer_json(request)
+    codigos = _lista_codigos(datos)
+    if not codigos:
+        return JsonResponse({'error': 'El carrito está vacío, excede el máximo permitido o trae códigos inválidos.'}, status=400)
+
+    try:
+        plazo_horas = _plazo_horas(datos.get('plazo_horas'))
+    except (ValueError, TypeError):
+        return JsonResponse({'error': '"plazo_horas" debe ser un entero mayor que cero.'}, status=400)
+
+    try:
+        trabajador = await Trabajador.objects.aget(id=datos.get('trabajador'))
+    except (Trabajador.DoesNotExist, ValueError, TypeError):
+        return JsonResponse({'error': 'Debe seleccionar un trabajador válido.'}, status=400)
+
+    bodeguero = await request.auser()
+    prestamo, guardados, errores = await sync_to_async(prestar_herramientas)(
+        trabajador, bodeguero, codigos, datos.get('observaciones', ''),
+        ubicaciones=await aubicaciones_usuario(bodeguero),
+        plazo_horas=plazo_horas
+    )
+
+    return JsonResponse({
+        'prestamo': prestamo.id if prestamo else None,
+        'guardados': guardados,
+        'errores': errores
+    }, status=201 if guardados else 409)
+
+@login_required
+@require_POST
+async def api_registrar_devolucion(request):
+    """
+    Body: {"items": [{"codigo": "HER-1", "estado": "DISPONIBLE", "observacion": "", "foto": "<id de subida>"}, ...]}
+    """
+    datos = _leer_json(request)
+    items = datos.get('items') if datos else None
+    if not isinstance(items, list) or not items or len(items) > API_LOTE_MAXIMO:
+        return JsonResponse({'error': 'No hay ítems para devolver o excede el máximo permitido.'}, status=400)
+
+    estados_validos = dict(DetallePrestamo.OPCIONES_ESTADO)
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get('codigo'), str) or item.get('estado') not in estados_validos:
+            return JsonResponse({'error': 'Cada ítem requiere "codigo" y un "estado" válido.'}, status=400)
+
+    usuario = await request.auser()
+    fotos = await sync_to_async(subidas.fotos_completas)(usuario, [str(item.get('foto', '')) for item in items])
+    limpios = [{
+        'codigo': item['codigo'],
+        'estado': item['estado'],
+        'observacion': item.get('observacion', ''),
+        'foto': fotos.get(str(item.get('foto', '')))
+    } for item in items]
+    devueltos, errores = await sync_to_async(devolver_herramientas)(
+        limpios, ubicaciones=await aubicaciones_usuario(usuario), usuario=usuario
+    )
+    await sync_to_async(subidas.marcar_usadas)(fotos, devueltos)
+
+    return JsonResponse({
+        'guardados': len(devueltos),
+        'devueltos': [d.herramienta.codigo_qr for d in devueltos],
+        'errores': errores
+    })
+
+@login_required
+@require_POST
+async def api_liberar_mantencion(request):
+    """
+    Liberación masiva del taller desde el escáner.
+    Body: {"codigos": ["HER-1", "HER-2", ...]}
+    """
+    codigos = _lista_codigos(_leer_json(request))
+    if not codigos:
+        return JsonResponse({'error': f'Envíe una lista "codigos" de hasta {API_LOTE_MAXIMO} textos.'}, status=400)
+
+    usuario = await request.auser()
+    if not usuario.is_staff:
+        return JsonResponse({'error': 'Acceso denegado.'}, status=403)
+
+    liberadas, errores = await sync_to_async(liberar_herramientas)(
+        codigos, usuario, ubicaciones=await aubicaciones_usuario(usuario)
+    )
+    return JsonResponse({
+        'liberadas': [h.codigo_qr for h in liberadas],
+        'errores': errores
+    })
+
+# ==============================================================================
+# 5.1 SUBIDA DE FOTOS POR PARTES
+# ==============================================================================
+# Vistas síncronas: escriben las partes en disco (ver bodega/subidas.py).
+
+def _estado_subida(subida):
+    return {
+        'id': subida.id,
+        'recibido': subida.recibido,
+        'tamano': subida.tamano,
+        'completa': bool(subida.archivo),
+        'parte': settings.SUBIDA_PARTE_BYTES,
+    }
+
+@login_required
+@require_POST
+def api_crear_subida(request):
+    """
+    Abre una subida por partes.
+    Body: {"nombre": "foto.jpg", "tamano": 182340}
+    """
+    datos = _leer_json(request) or {}
+    try:
+        subida = subidas.crear(request.user, datos.get('nombre') or 'foto.jpg', datos.get('tamano'))
+    except subidas.SubidaInvalida as error:
+        return JsonResponse({'error': str(error)}, status=error.status)
+    return JsonResponse(_estado_subida(subida), status=201)
+
+@login_required
+@require_http_methods(['GET', 'PUT'])
+def api_subida(request, subida_id):
+    """
+    GET: bytes recibidos, para reanudar. PUT: una parte (cuerpo binario) que
+    empieza en la posición indicada por la cabecera Upload-Offset.
+    """
+    try:
+        subida = SubidaFoto.objects.get(id=subida_id, usuario=request.user)
+    except SubidaFoto.DoesNotExist:
+        return JsonResponse({'error': 'La subida no existe o expiró.'}, status=404)
+
+    if request.method == 'PUT':
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            offset = -1
+        if offset < 0:
+            return JsonResponse({'error': 'Falta la cabecera Upload-Offset.'}, status=400)
+        try:
+            subida = subidas.recibir_parte(subida, offset, request.body)
+        except subidas.SubidaInvalida as error:
+            return JsonResponse({'error': str(error), 'recibido': subida.recibido}, status=error.status)
+
+    return JsonResponse(_estado_subida(subida))
+
+# ==============================================================================
+# 5.2 ACTUALIZACIONES EN VIVO (SSE + POLLING)
+# ==============================================================================
+
+def _ultimo_id(request):
+    valor = request.headers.get('Last-Event-ID') or request.GET.get('desde', '')
+    try:
+        return int(valor)
+    except ValueError:
+        return bus.ultimo_id
+
+@login_required
+def api_eventos(request):
+    """
+    Polling corto para despliegues WSGI: responde de inmediato con lo que haya
+    y el navegador vuelve a preguntar a los EVENTOS_POLL_SEGUNDOS. Esperar aquí
+    dejaría tomado un worker sync por cada pestaña abierta.
+    """
+    ultimo = _ultimo_id(request)
+    ubicaciones = ubicaciones_usuario(request.user)
+    eventos, recargar = bus.desde(ultimo)
+    return JsonResponse({
+        'ultimo': eventos[-1]['id'] if eventos else ultimo,
+        'eventos': [e for e in eventos if evento_visible(e, ubicaciones)],
+        'recargar': recargar,
+        'reintentar': settings.EVENTOS_POLL_SEGUNDOS * 1000,
+    })
+
+@login_required
+async def stream_eventos(request):
+    """
+    Server-Sent Events para despliegues ASGI (uvicorn). Bajo WSGI responde 501
+    y el navegador cae al polling de api_eventos.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'SSE requiere ASGI, use /api/eventos/'}, status=501)
+
+    ultimo = await sync_to_async(_ultimo_id)(request)
+    ubicaciones = await aubicaciones_usuario(await request.auser())
+
+    async def generar():
+        nonlocal ultimo
+        yield f"retry: 3000\nid: {ultimo}\n\n"
+        while True:
+            eventos, recargar = await bus.esperar_async(ultimo, settings.EVENTOS_POLL_SEGUNDOS)
+            if recargar:
+                ultimo = await sync_to_async(lambda: bus.ultimo_id)()
+                yield f"event: recargar\nid: {ultimo}\ndata: {{}}\n\n"
+                continue
+            if not eventos:
+                yield ": latido\n\n"  # Mantiene viva la conexión a través de proxies
+                continue
+            for evento in eventos:
+                ultimo = evento['id']
+                if evento_visible(evento, ubicaciones):
+                    yield f"id: {ultimo}\ndata: {json.dumps(evento)}\n\n"
+
+    response = StreamingHttpResponse(generar(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+# ==============================================================================
+# 5.3 CATÁLOGO DE HERRAMIENTAS (LECTURA PARA INTEGRACIONES)
+# ==============================================================================
+# GET /api/herramientas/?fields=codigo_qr,nombre&estado=DISPONIBLE&ubicacion=3
+#     &desde=<id>&limite=500&formato=filas
+# Sin 'limite' se envía todo el catálogo en una sola respuesta streaming, leído
+# por lotes con keyset (id > último id) para no cargarlo entero en memoria.
+
+# Campo público -> campo del ORM (se serializa con values(), sin instancias)
+CAMPOS_API = {
+    'id': 'id',
+    'codigo_qr': 'codigo_qr',
+    'nombre': 'nombre',
+    'marca': 'marca',
+    'modelo': 'modelo',
+    'estado': 'estado',
+    'activo': 'activo',
+    'categoria': 'categoria_id',
+    'categoria_nombre': 'categoria__nombre',
+    'ubicacion': 'ubicacion_id',
+    'ubicacion_nombre': 'ubicacion__nombre',
+}
+CAMPOS_API_DEFECTO = ('id', 'codigo_qr', 'nombre', 'marca', 'estado', 'ubicacion')
+API_CATALOGO_LOTE = 2000
+API_CATALOGO_LIMITE_MAXIMO = 5000
+
+def _error_api(mensaje):
+    return JsonResponse({'error': mensaje}, status=400)
+
+def _ids_parametro(request, nombre):
+    """'1,2,3' -> [1, 2, 3]; None si no viene; ValueError si no son enteros."""
+    valor = request.GET.get(nombre)
+    if not valor:
+        return None
+    return [int(parte) for parte in valor.split(',')]
+
+def _filas_catalogo(consulta, campos, orm, desde, limite, formato):
+    """
+    Genera el JSON del catálogo en trozos de bytes. El cursor 'siguiente' sólo
+    se conoce al final, por eso va como última clave del objeto.
+    """
+    codificar = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    if formato == 'filas':
+        yield f'{{"campos":{codificar(campos)},"herramientas":['.encode()
+    else:
+        yield b'{"herramientas":['
+
+    ultimo, enviados, hay_mas = desde, 0, False
+    while limite is None or enviados < limite:
+        tamano = API_CATALOGO_LOTE if limite is None else min(API_CATALOGO_LOTE, limite - enviados)
+        lote = list(consulta.filter(id__gt=ultimo).order_by('id').values(*orm)[:tamano + 1])
+        hay_mas = len(lote) > tamano
+        lote = lote[:tamano]
+        if not lote:
+            break
+        if formato == 'filas':
+            filas = [[fila[campo] for campo in orm] for fila in lote]
+        else:
+            filas = [{nombre: fila[campo] for nombre, campo in zip(campos, orm)} for fila in lote]
+        yield ((',' if enviados else '') + codificar(filas)[1:-1]).encode()
+        ultimo = lote[-1]['id']
+        enviados += len(lote)
+        if not hay_mas:
+            break
+
+    siguiente = ultimo if hay_mas else None
+    yield f'],"total":{enviados},"siguiente":{codificar(siguiente)}}}'.encode()
+
+@login_required
+def api_herramientas(request):
+    """
+    Catálogo de herramientas para integraciones y sincronización del escáner.
+    Respuesta comprimida (Brotli/gzip) y paginable con 'desde' + 'limite'.
+    """
+    campos = request.GET.get('fields')
+    campos = [c.strip() for c in campos.split(',') if c.strip()] if campos else list(CAMPOS_API_DEFECTO)
+    desconocidos = [c for c in campos if c not in CAMPOS_API]
+    if desconocidos:
+        return _error_api(f"Campos desconocidos: {', '.join(desconocidos)}. Válidos: {', '.join(CAMPOS_API)}")
+    if 'id' not in campos:
+        campos.insert(0, 'id')  # Lo necesita el cursor de paginación
+    orm = [CAMPOS_API[c] for c in campos]
+
+    formato = request.GET.get('formato', 'objetos')
+    if formato not in ('objetos', 'filas'):
+        return _error_api('formato debe ser "objetos" o "filas".')
+
+    consulta = herramientas_de(request.user)
+    estados = request.GET.get('estado')
+    if estados:
+        estados = estados.split(',')
+        if not set(estados) <= dict(Herramienta.ESTADOS).keys():
+            return _error_api(f"Estado inválido. Válidos: {', '.join(dict(Herramienta.ESTADOS))}")
+        consulta = consulta.filter(estado__in=estados)
+
+    activo = request.GET.get('activo', '1')
+    if activo in ('0', '1'):
+        consulta = consulta.filter(activo=(activo == '1'))
+    elif activo != 'todos':
+        return _error_api('activo debe ser 1, 0 o "todos".')
+
+    try:
+        ubicaciones = _ids_parametro(request, 'ubicacion')
+        categorias = _ids_parametro(request, 'categoria')
+        desde = int(request.GET.get('desde', 0))
+        limite = request.GET.get('limite')
+        limite = min(int(limite), API_CATALOGO_LIMITE_MAXIMO) if limite else None
+    except ValueError:
+        return _error_api('ubicacion, categoria, desde y limite deben ser números enteros.')
+    if limite is not None and limite < 1:
+        return _error_api('limite debe ser mayor que cero.')
+    if ubicaciones:
+        consulta = consulta.filter(ubicacion_id__in=ubicaciones)
+    if categorias:
+        consulta = consulta.filter(categoria_id__in=categorias)
+
+    response = StreamingHttpResponse(
+        _filas_catalogo(consulta, campos, orm, desde, limite, formato),
+        content_type='application/json'
+    )
+    return respuesta_comprimida(request, response)
 
 # ==============================================================================
 # 6. UTILIDADES Y GESTIÓN
@@ -311,11 +662,13 @@ def api_verificar_qr(request):
 @login_required
 def consultar_stock(request):
     query = request.GET.get('q')
+    ultimo_evento = bus.ultimo_id
 
-    total_sistema = Herramienta.objects.count()
-    total_activas = Herramienta.objects.filter(activo=True).count()
-    total_en_uso = Herramienta.objects.filter(estado='EN_USO', activo=True).count()
-    total_bajas = Herramienta.objects.filter(activo=False).count()
+    visibles = herramientas_de(request.user)
+    total_sistema = visibles.count()
+    total_activas = visibles.filter(activo=True).count()
+    total_en_uso = visibles.filter(estado='EN_USO', activo=True).count()
+    total_bajas = visibles.filter(activo=False).count()
 
     orden_prioridad = Case(
         When(estado='DISPONIBLE', then=Value(1)),
@@ -325,7 +678,7 @@ def consultar_stock(request):
         output_field=IntegerField(),
     )
 
-    herramientas = Herramienta.objects.annotate(
+    herramientas = visibles.select_related('ubicacion').annotate(
         prioridad=orden_prioridad
     ).order_by('prioridad', 'nombre')
     
@@ -343,44 +696,131 @@ def consultar_stock(request):
         'total_sistema': total_sistema,
         'total_activas': total_activas,
         'total_en_uso': total_en_uso,
-        'total_bajas': total_bajas
+        'total_bajas': total_bajas,
+        'ultimo_evento': ultimo_evento
     })
 
+# --- Listas cacheadas (Disponibles / Mantención) ---
+# Los querysets son perezosos: si el fragmento está en caché el template no
+# llega a evaluarlos y la lista no cuesta ninguna consulta.
+
+AGRUPACIONES = ('ubicacion', 'categoria')
+
+def _agrupacion(request):
+    agrupar = request.GET.get('agrupar', '')
+    return agrupar if agrupar in AGRUPACIONES else ''
+
+def _agrupar_herramientas(herramientas, agrupar):
+    herramientas = herramientas.select_related('ubicacion', 'categoria')
+    if agrupar:
+        return herramientas.order_by(f'{agrupar}__nombre', 'nombre')
+    return herramientas.order_by('nombre')
+
+def _totales_por_grupo(herramientas, agrupar):
+    """Resumen por Ubicación/Categoría calculado con GROUP BY en la BD."""
+    if not agrupar:
+        return []
+    return herramientas.order_by().values(grupo=F(f'{agrupar}__nombre')).annotate(
+        total=Count('id')
+    ).order_by('grupo')
+
+def _contexto_cache(request, agrupar):
+    # La versión depende del alcance: cada bodega tiene su propia partición
+    return {
+        'agrupar': agrupar,
+        'version_inventario': version_inventario(ubicaciones_usuario(request.user)),
+        'cache_segundos': settings.CACHE_FRAGMENTOS_SEGUNDOS
+    }
+
 @login_required
 def imprimir_qr(request, herramienta_id):
-    herramienta = get_object_or_404(Herramienta, id=herramienta_id)
+    herramienta = get_object_or_404(herramientas_de(request.user), id=herramienta_id)
     return render(request, 'bodega/imprimir_qr.html', {
         'h': herramienta
     })
 
+# Ventana del tiempo medio de reparación que se muestra en el taller
+MANTENCION_DIAS_PROMEDIO = 30
+
+def _tiempo_medio_reparacion(request):
+    """Duración promedio de las mantenciones cerradas en los últimos días (índice por fecha_fin)."""
+    desde = timezone.now() - timedelta(days=MANTENCION_DIAS_PROMEDIO)
+    promedio = filtrar_por_ubicacion(
+        Mantencion.objects.filter(fecha_fin__gte=desde), ubicaciones_usuario(request.user), 'herramienta__ubicacion'
+    ).aggregate(promedio=Avg(F('fecha_fin') - F('fecha_inicio')))['promedio']
+    return round(promedio.total_seconds() / 3600, 1) if promedio is not None else None
+
 @login_required
 def en_mantencion(request):
     if not request.user.is_staff:
         messages.error(request, "Acceso denegado.")
         return redirect('inicio')
 
-    herramientas = Herramienta.objects.filter(estado='EN_MANTENCION', activo=True)
+    agrupar = _agrupacion(request)
+    herramientas = _agrupar_herramientas(
+        herramientas_de(request.user).filter(estado='EN_MANTENCION', activo=True), agrupar
+    )
+    # Subconsulta (no JOIN) para no alterar los conteos de _totales_por_grupo
+    ingreso = Mantencion.objects.filter(herramienta=OuterRef('pk'), fecha_fin__isnull=True).values('fecha_inicio')[:1]
     return render(request, 'bodega/en_mantencion.html', {
-        'herramientas': herramientas
+        'herramientas': herramientas.annotate(en_taller_desde=Subquery(ingreso)),
+        'grupos': _totales_por_grupo(herramientas, agrupar),
+        # Perezoso: sólo se consulta si el fragmento no está en caché
+        'horas_reparacion': lambda: _tiempo_medio_reparacion(request),
+        'dias_promedio': MANTENCION_DIAS_PROMEDIO,
+        **_contexto_cache(request, agrupar)
     })
 
+def _mensajes_liberacion(request, liberadas, errores):
+    if liberadas:
+        messages.success(request, f"{len(liberadas)} herramientas liberadas a bodega.")
+    if errores:
+        messages.warning(request, "Alertas: " + ", ".join(errores))
+
 @login_required
+@require_POST
 def liberar_herramienta(request, herramienta_id):
-    herramienta = get_object_or_404(Herramienta, id=herramienta_id)
-    herramienta.estado = 'DISPONIBLE'
-    herramienta.save()
+    herramienta = get_object_or_404(herramientas_de(request.user), id=herramienta_id)
+    liberadas, errores = liberar_herramientas(
+        [herramienta.codigo_qr], request.user, ubicaciones=ubicaciones_usuario(request.user)
+    )
+    _mensajes_liberacion(request, liberadas, errores)
+    return redirect('en_mantencion')
+
+@login_required
+@require_POST
+def liberar_lote(request):
+    """
+    Liberación masiva desde el taller: las casillas marcadas ('codigos') más
+    los códigos escaneados en el cuadro de texto ('escaneados', uno por línea).
+    """
+    if not request.user.is_staff:
+        messages.error(request, "Acceso denegado.")
+        return redirect('inicio')
+
+    codigos = request.POST.getlist('codigos') + request.POST.get('escaneados', '').split()
+    if not codigos:
+        messages.warning(request, "No se seleccionó ninguna herramienta.")
+    elif len(codigos) > API_LOTE_MAXIMO:
+        messages.error(request, f"Máximo {API_LOTE_MAXIMO} herramientas por liberación.")
+    else:
+        liberadas, errores = liberar_herramientas(codigos, request.user, ubicaciones=ubicaciones_usuario(request.user))
+        _mensajes_liberacion(request, liberadas, errores)
     return redirect('en_mantencion')
 
 @login_required
 def herramientas_disponibles(request):
+    agrupar = _agrupacion(request)
+
     # FILTRO: Solo herramientas activas Y que estén DISPONIBLES
-    herramientas = Herramienta.objects.filter(
-        activo=True, 
-        estado='DISPONIBLE'
-    ).order_by('nombre')
+    herramientas = _agrupar_herramientas(
+        herramientas_de(request.user).filter(activo=True, estado='DISPONIBLE'), agrupar
+    )
     
     return render(request, 'bodega/listas/herramientas_disponibles.html', {
-        'herramientas': herramientas
+        'herramientas': herramientas,
+        'grupos': _totales_por_grupo(herramientas, agrupar),
+        **_contexto_cache(request, agrupar)
     })
 
 @login_required
@@ -389,9 +829,11 @@ def herramientas_en_uso(request):
         messages.error(request, "Acceso denegado.")
         return redirect('inicio')
     
-    prestamos_activos = DetallePrestamo.objects.filter(devuelto=False).select_related('herramienta', 'prestamo__trabajador')
+    prestamos_activos = DetallePrestamo.objects.filter(devuelto=False).select_related('herramienta__ubicacion', 'prestamo__trabajador')
+    prestamos_activos = filtrar_por_ubicacion(prestamos_activos, ubicaciones_usuario(request.user), 'herramienta__ubicacion')
     return render(request, 'bodega/listas/herramientas_en_uso.html', {
-        'prestamos': prestamos_activos
+        'prestamos': prestamos_activos,
+        'ahora': timezone.now() # Para marcar los ítems con el plazo vencido
     })
 
 @login_required
@@ -400,11 +842,86 @@ def lista_trabajadores(request):
         messages.error(request, "Acceso denegado.")
         return redirect('inicio')
     
-    trabajadores = Trabajador.objects.all().order_by('-activo', 'nombre')
+    trabajadores = Trabajador.objects.select_related('saldo').order_by('-activo', 'nombre')
     return render(request, 'bodega/listas/lista_trabajadores.html', {
         'trabajadores': trabajadores
     })
 
+# --- Perfil del trabajador (saldos precalculados, ver saldos.py) ---
+
+def _perfil_trabajador(trabajador):
+    try:
+        saldo = trabajador.saldo
+    except SaldoTrabajador.DoesNotExist:
+        saldo = SaldoTrabajador(trabajador=trabajador)  # Nunca ha pedido nada
+
+    en_poder = DetallePrestamo.objects.filter(
+        prestamo__trabajador=trabajador, devuelto=False
+    ).select_related('herramienta__ubicacion', 'prestamo').order_by('prestamo__fecha_solicitud')
+    return saldo, en_poder
+
+@login_required
+def perfil_trabajador(request, id):
+    if not request.user.is_staff:
+        messages.error(request, "Acceso denegado.")
+        return redirect('inicio')
+
+    trabajador = get_object_or_404(Trabajador.objects.select_related('saldo'), id=id)
+    saldo, en_poder = _perfil_trabajador(trabajador)
+    ahora = timezone.now()
+    promedio = saldo.duracion_promedio
+    return render(request, 'bodega/listas/perfil_trabajador.html', {
+        't': trabajador,
+        'saldo': saldo,
+        'en_poder': en_poder,
+        'duracion_promedio': timesince(ahora - promedio, ahora) if promedio else None,
+        'ahora': ahora
+    })
+
+@login_required
+def api_trabajador(request, rut):
+    """Lo que tiene un trabajador en su poder, para el control en portería."""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Acceso denegado.'}, status=403)
+
+    # Se guardan como '12345678-K': el lector puede mandar puntos o la k minúscula
+    normalizado = nomina.normalizar_rut(rut)
+    if normalizado is None:
+        return JsonResponse({'error': f'RUT inválido: {rut}.'}, status=400)
+    try:
+        trabajador = Trabajador.objects.select_related('saldo').get(rut=normalizado)
+    except Trabajador.DoesNotExist:
+        return JsonResponse({'error': f'No existe un trabajador con RUT {rut}.'}, status=404)
+
+    saldo, en_poder = _perfil_trabajador(trabajador)
+    ahora = timezone.now()
+    promedio = saldo.duracion_promedio
+    return JsonResponse({
+        'trabajador': {
+            'id': trabajador.id,
+            'rut': trabajador.rut,
+            'nombre': f"{trabajador.nombre} {trabajador.apellido}",
+            'cargo': trabajador.cargo,
+            'activo': trabajador.activo,
+        },
+        'saldo': {
+            'herramientas_en_poder': saldo.herramientas_en_poder,
+            'prestamos_totales': saldo.prestamos_totales,
+            'herramientas_prestadas': saldo.herramientas_prestadas,
+            'devoluciones': saldo.devoluciones,
+            'horas_promedio_prestamo': round(promedio.total_seconds() / 3600, 2) if promedio else None,
+            'ultimo_prestamo': saldo.ultimo_prestamo,
+        },
+        'en_poder': [{
+            'codigo_qr': d.herramienta.codigo_qr,
+            'nombre': d.herramienta.nombre,
+            'ubicacion': d.herramienta.ubicacion.nombre,
+            'prestamo': d.prestamo_id,
+            'desde': d.prestamo.fecha_solicitud,
+            'horas': round((ahora - d.prestamo.fecha_solicitud).total_seconds() / 3600, 1),
+        } for d in en_poder]
+    })
+
 # ==============================================================================
 # 7. GESTIÓN DE MAESTROS
 # ==============================================================================
@@ -416,6 +933,8 @@ def eliminar_trabajador(request, id):
         return redirect('lista_trabajadores')
 
     trabajador = get_object_or_404(Trabajador, id=id)
+    if trabajador.activo:
+        publicar_trabajadores(-1)
     trabajador.activo = False
     trabajador.save()
     
@@ -454,29 +973,13 @@ def eliminar_herramienta(request, id):
         messages.error(request, "No tienes permisos.")
         return redirect('consultar_stock')
 
-    herramienta = get_object_or_404(Herramienta, id=id)
-
-    motivo_texto = ""
-    if herramienta.estado == 'EN_MANTENCION':
-        herramienta.estado = 'BAJA_POR_DANO'
-        motivo_texto = "Daño Irreparable"
-    elif herramienta.estado == 'EN_USO':
-        herramienta.estado = 'BAJA_POR_PERDIDA'
-        motivo_texto = "Pérdida en Obra"
-    else:
-        herramienta.estado = 'DE_BAJA'
-        motivo_texto = "Baja Administrativa"
-
-    herramienta.activo = False
-    herramienta.save()
+    herramienta = get_object_or_404(herramientas_de(request.user), id=id)
+    bajas, motivos = dar_de_baja(Herramienta.objects.filter(id=herramienta.id), request.user)
+    if not bajas:
+        messages.warning(request, f"{herramienta.nombre} ya estaba dada de baja.")
+        return redirect('consultar_stock')
 
-    HistorialBaja.objects.create(
-        herramienta=herramienta,
-        accion='BAJA',
-        motivo=motivo_texto,
-        usuario=request.user
-    )
-    
+    motivo_texto = next(iter(motivos))
     messages.success(request, f"Baja procesada: {motivo_texto}. Registro guardado en Historial.")
     return redirect('consultar_stock')
 
@@ -486,55 +989,25 @@ def reactivar_herramienta(request, id):
         messages.error(request, "No tienes permiso para reactivar activos.")
         return redirect('consultar_stock')
 
-    herramienta = get_object_or_404(Herramienta, id=id)
-    
-    # 1. VERIFICACIÓN DE PRÉSTAMOS ZOMBIES
-    # Buscamos si hay algún préstamo abierto para esta herramienta
-    prestamos_pendientes = DetallePrestamo.objects.filter(herramienta=herramienta, devuelto=False)
-    
-    msg_extra = ""
-    if prestamos_pendientes.exists():
-        ahora = timezone.now()
-        for detalle in prestamos_pendientes:
-            # Cerramos el préstamo forzosamente
-            detalle.devuelto = True
-            detalle.fecha_devolucion = ahora
-            detalle.estado_devolucion = 'DISPONIBLE'
-            detalle.observacion_falla = "Cierre automático por Reactivación de Inventario"
-            detalle.save()
-            
-            # Verificamos si cerramos el préstamo padre
-            prestamo_padre = detalle.prestamo
-            hermanos_pendientes = DetallePrestamo.objects.filter(prestamo=prestamo_padre, devuelto=False).count()
-            if hermanos_pendientes == 0:
-                prestamo_padre.fecha_devolucion = ahora
-                prestamo_padre.save()
-        
-        msg_extra = " (Se cerraron préstamos pendientes asociados)."
+    herramienta = get_object_or_404(herramientas_de(request.user), id=id)
+    # Cierra también los préstamos zombies que hayan quedado abiertos
+    reactivadas, cerrados = reactivar(Herramienta.objects.filter(id=herramienta.id), request.user)
+    if not reactivadas:
+        messages.warning(request, f"{herramienta.nombre} ya estaba activa.")
+        return redirect('consultar_stock')
 
-    # 2. Reactivamos la herramienta
-    herramienta.activo = True
-    herramienta.estado = 'DISPONIBLE'
-    herramienta.save()
-    
-    # 3. CREAMOS EL REGISTRO DE AUDITORÍA
-    HistorialBaja.objects.create(
-        herramienta=herramienta,
-        accion='REACTIVACION',
-        motivo='Reincorporación al Inventario',
-        usuario=request.user
-    )
-    
+    msg_extra = " (Se cerraron préstamos pendientes asociados)." if cerrados else ""
     messages.success(request, f"¡Éxito! {herramienta.nombre} reactivada.{msg_extra}")
     return redirect('consultar_stock')
 
 @login_required
+@lectura_en_replica
 def estadisticas_uso(request):
     if not request.user.is_staff:
         messages.error(request, "Acceso denegado.")
         return redirect('inicio')
 
-    top_herramientas = Herramienta.objects.annotate(
+    top_herramientas = herramientas_de(request.user).annotate(
         num_prestamos=Count('detalleprestamo')
     ).order_by('-num_prestamos')[:5]
 
@@ -547,56 +1020,288 @@ def estadisticas_uso(request):
         'top_trabajadores': top_trabajadores
     })
 
+# --- Analítica de uso (utilización, mantención y fallas por período) ---
+
+ANALITICA_DIAS_DEFECTO = 30
+
+@login_required
+@lectura_en_replica
+def analitica_uso(request):
+    if not request.user.is_staff:
+        messages.error(request, "Acceso denegado.")
+        return redirect('inicio')
+
+    # Import diferido: NumPy sólo se carga cuando alguien abre la analítica
+    from .analitica import analizar
+
+    rango = leer_rango(request.GET, ANALITICA_DIAS_DEFECTO)
+    reporte = analizar(rango.inicio, rango.fin, ubicaciones_usuario(request.user))
+
+    if request.GET.get('formato') == 'json':
+        return JsonResponse({'desde': rango.desde, 'hasta': rango.hasta, **reporte})
+
+    for error in rango.errores:
+        messages.warning(request, error)
+    return render(request, 'bodega/listas/analitica.html', {
+        'reporte': reporte,
+        **rango.contexto(),
+        'sugerir_segundo_plano': _rango_grande(rango),
+    })
+
+# --- Stock histórico (bitácora de movimientos) ---
+
+@login_required
+@lectura_en_replica
+def stock_historico(request):
+    if not request.user.is_staff:
+        messages.error(request, "Acceso denegado.")
+        return redirect('inicio')
+
+    momento = leer_momento(request.GET)
+    conteo = stock_en(momento, ubicaciones_usuario(request.user))
+
+    nombres = dict(Ubicacion.objects.filter(id__in={u for u, _ in conteo}).values_list('id', 'nombre'))
+    filas = []
+    for ubicacion_id in sorted(nombres, key=nombres.get):
+        fila = {estado.lower(): conteo[(ubicacion_id, estado)] for estado in ('DISPONIBLE', 'EN_USO', 'EN_MANTENCION', 'BAJA')}
+        fila['activas'] = fila['disponible'] + fila['en_uso'] + fila['en_mantencion']
+        filas.append(dict(fila, ubicacion=nombres[ubicacion_id]))
+    totales = {clave: sum(f[clave] for f in filas) for clave in ('disponible', 'en_uso', 'en_mantencion', 'baja', 'activas')}
+
+    if request.GET.get('formato') == 'json':
+        return JsonResponse({'momento': momento, 'ubicaciones': filas, 'totales': totales})
+
+    local = timezone.localtime(momento)
+    return render(request, 'bodega/listas/stock_historico.html', {
+        'filas': filas,
+        'totales': totales,
+        'momento': momento,
+        'filtro_fecha': request.GET.get('fecha', local.date().isoformat()),
+        'filtro_hora': request.GET.get('hora', ''),
+    })
+
 # ==============================================================================
 # 8. NUEVO REPORTE: TRAZABILIDAD TOTAL (HISTORIAL TRANSACCIONES)
 # ==============================================================================
 @login_required
+@lectura_en_replica
 def historial_transacciones(request):
     if not request.user.is_staff:
         messages.error(request, "Acceso Denegado")
         return redirect('inicio')
 
-    # 1. Captura de parámetros
-    query = request.GET.get('q', '')
-    fecha_inicio = request.GET.get('fecha_inicio', '')
-    fecha_fin = request.GET.get('fecha_fin', '')
-    orden_param = request.GET.get('orden', '')
-
-    # 2. CONFIGURACIÓN DE ORDENAMIENTO (Mapeo de Campos)
-    # Como la tabla es DetallePrestamo, los campos son diferentes (usamos __ para navegar)
-    opciones_orden = {
-        'fecha': 'prestamo__fecha_solicitud', '-fecha': '-prestamo__fecha_solicitud',
-        'herramienta': 'herramienta__nombre', '-herramienta': '-herramienta__nombre',
-        'trabajador': 'prestamo__trabajador__nombre', '-trabajador': '-prestamo__trabajador__nombre',
-        'bodeguero': 'prestamo__bodeguero__username', '-bodeguero': '-prestamo__bodeguero__username',
-        'estado': 'estado_devolucion', '-estado': '-estado_devolucion',
-        'devolucion': 'fecha_devolucion', '-devolucion': '-fecha_devolucion',
+    movimientos, rango = reportes.transacciones(request.GET, ubicaciones_usuario(request.user))
+    for error in rango.errores:
+        messages.warning(request, error)
+
+    return render(request, 'bodega/historial_transacciones.html', {
+        'movimientos': movimientos,
+        'query': request.GET.get('q', ''),
+        **rango.contexto(),
+        'sugerir_segundo_plano': _rango_grande(rango),
+        'orden_actual': request.GET.get('orden', '') # Para pintar las flechas
+    })
+# ==============================================================================
+# 9. SERVICE WORKER (CACHÉ DE ASSETS)
+# ==============================================================================
+# Se sirve desde /sw.js (y no desde /static/) porque un service worker sólo
+# controla las páginas bajo la ruta de donde se descargó.
+
+def _precarga_assets():
+    """URLs (con hash en producción) de los paquetes y archivos vendorizados disponibles."""
+    rutas = [ruta for nombre in PAQUETES for ruta, _ in archivos_de(nombre) if ruta]
+    rutas += [f'{VENDOR_DIR}/{archivo}' for archivo in VENDOR if not archivo.endswith(('.css', '.js'))]
+    return sorted({static(ruta) for ruta in rutas if existe(ruta)})
+
+def service_worker(request):
+    precarga = _precarga_assets()
+    response = render(request, 'bodega/sw.js', {
+        # Cambia con los hashes: un deploy con assets nuevos instala otra caché
+        'version': hashlib.sha1('\n'.join(precarga).encode()).hexdigest()[:12],
+        'precarga': json.dumps(precarga),
+        'static_url': settings.STATIC_URL,
+    }, content_type='application/javascript')
+    # El navegador debe revisar el worker en cada visita para enterarse de los deploys
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+# ==============================================================================
+# 10. PERFILES DE RENDIMIENTO
+# ==============================================================================
+# Perfiles guardados por PerfiladorMiddleware (ver bodega/perfilador.py).
+
+@login_required
+def perfiles(request):
+    if not request.user.is_staff:
+        messages.error(request, "Acceso denegado.")
+        return redirect('inicio')
+
+    return render(request, 'bodega/listas/perfiles.html', {
+        'perfiles': perfilador.recientes(),
+        'activo': settings.PERFILADOR_ACTIVO,
+        'muestreo': settings.PERFILADOR_MUESTREO,
+        'maximo': settings.PERFILADOR_MAXIMO,
+    })
+
+@login_required
+def descargar_perfil(request, nombre):
+    if not request.user.is_staff:
+        messages.error(request, "Acceso denegado.")
+        return redirect('inicio')
+
+    ruta = perfilador.ruta_archivo(nombre)
+    if ruta is None:
+        raise Http404("Perfil no encontrado")
+    return FileResponse(open(ruta, 'rb'), as_attachment=True, filename=nombre)
+
+# ==============================================================================
+# 11. REPORTES EN SEGUNDO PLANO
+# ==============================================================================
+# Los genera el comando procesar_trabajos (ver bodega/trabajos.py).
+
+def _datos_trabajo(trabajo):
+    return {
+        'id': str(trabajo.id),
+        'estado': trabajo.estado,
+        'progreso': trabajo.progreso,
+        'mensaje': trabajo.mensaje,
+        'filas': trabajo.filas,
+        'descarga': reverse('descargar_trabajo', args=[trabajo.id]) if trabajo.estado == 'LISTO' else None,
     }
-    # Por defecto: Fecha de préstamo descendente
-    criterio_final = opciones_orden.get(orden_param, '-prestamo__fecha_solicitud')
 
-    # 3. Consulta Base
-    movimientos = DetallePrestamo.objects.select_related(
-        'prestamo', 'herramienta', 'prestamo__trabajador', 'prestamo__bodeguero'
-    ).order_by(criterio_final)
+@login_required
+@require_POST
+def generar_reporte(request, tipo):
+    if not request.user.is_staff:
+        messages.error(request, "Acceso denegado.")
+        return redirect('inicio')
+    if tipo not in trabajos.GENERADORES:
+        raise Http404("Tipo de reporte desconocido")
 
-    # 4. Filtros
-    if query:
-        movimientos = movimientos.filter(
-            Q(herramienta__nombre__icontains=query) |
-            Q(herramienta__codigo_qr__icontains=query) |
-            Q(prestamo__trabajador__nombre__icontains=query) |
-            Q(prestamo__trabajador__rut__icontains=query)
-        )
+    parametros = {clave: request.POST.get(clave, '') for clave in reportes.PARAMETROS}
+    trabajos.encolar(tipo, parametros, request.user)
+    messages.success(request, "Reporte encolado: te avisamos aquí cuando esté listo para descargar.")
+    return redirect('trabajos')
 
-    if fecha_inicio: movimientos = movimientos.filter(prestamo__fecha_solicitud__date__gte=fecha_inicio)
-    if fecha_fin: movimientos = movimientos.filter(prestamo__fecha_solicitud__date__lte=fecha_fin)
+@login_required
+def lista_trabajos(request):
+    if not request.user.is_staff:
+        messages.error(request, "Acceso denegado.")
+        return redirect('inicio')
 
-    # 5. Retorno
-    return render(request, 'bodega/historial_transacciones.html', {
-        'movimientos': movimientos,
-        'query': query,
-        'fecha_inicio': fecha_inicio,
-        'fecha_fin': fecha_fin,
-        'orden_actual': orden_param # Para pintar las flechas
-    })
\ No newline at end of file
+    return render(request, 'bodega/listas/trabajos.html', {
+        'trabajos': TrabajoReporte.objects.filter(usuario=request.user).order_by('-creado')[:30],
+        'retencion': settings.TRABAJOS_RETENCION_DIAS,
+    })
+
+@login_required
+def api_trabajo(request, trabajo_id):
+    trabajo = TrabajoReporte.objects.filter(id=trabajo_id, usuario=request.user).first()
+    if trabajo is None:
+        return JsonResponse({'error': 'Trabajo no encontrado'}, status=404)
+    return JsonResponse(_datos_trabajo(trabajo))
+
+@login_required
+def descargar_trabajo(request, trabajo_id):
+    trabajo = get_object_or_404(TrabajoReporte, id=trabajo_id, usuario=request.user, estado='LISTO')
+    return FileResponse(trabajo.archivo.open('rb'), as_attachment=True, filename=trabajo.nombre_descarga())
+
+# ==============================================================================
+# 12. CONTEO FÍSICO DE INVENTARIO
+# ==============================================================================
+# Sesiones de escaneo por ubicación y su conciliación (ver bodega/conteos.py).
+
+def _conteo_del_usuario(request, conteo_id):
+    """Conteo de una ubicación que el usuario puede ver (404 si no)."""
+    conteos_visibles = filtrar_por_ubicacion(ConteoInventario.objects.select_related('ubicacion', 'usuario'),
+                                             ubicaciones_usuario(request.user))
+    return get_object_or_404(conteos_visibles, id=conteo_id)
+
+@login_required
+def lista_conteos(request):
+    if not request.user.is_staff:
+        messages.error(request, "Acceso denegado.")
+        return redirect('inicio')
+
+    ubicaciones = filtrar_por_ubicacion(Ubicacion.objects.order_by('nombre'), ubicaciones_usuario(request.user), 'id')
+    if request.method == 'POST':
+        ubicacion = ubicaciones.filter(id=request.POST.get('ubicacion') or 0).first()
+        if ubicacion is None:
+            messages.error(request, "Seleccione una ubicación válida.")
+            return redirect('conteos')
+        conteo = conteos.abrir(ubicacion, request.user)
+        return redirect('ver_conteo', conteo_id=conteo.id)
+
+    return render(request, 'bodega/listas/conteos.html', {
+        'conteos': filtrar_por_ubicacion(
+            ConteoInventario.objects.select_related('ubicacion', 'usuario'), ubicaciones_usuario(request.user)
+        ).order_by('-abierto')[:50],
+        'ubicaciones': ubicaciones,
+    })
+
+@login_required
+def ver_conteo(request, conteo_id):
+    if not request.user.is_staff:
+        messages.error(request, "Acceso denegado.")
+        return redirect('inicio')
+
+    conteo = _conteo_del_usuario(request, conteo_id)
+    # Abierto: vista previa de la conciliación con lo escaneado hasta ahora
+    resultado = conteo.resultado if conteo.estado == 'CERRADO' else conteos.conciliar(conteo)
+    if request.GET.get('formato') == 'json':
+        return JsonResponse({'id': conteo.id, 'ubicacion': conteo.ubicacion.nombre, 'estado': conteo.estado, **resultado})
+
+    return render(request, 'bodega/conteo.html', {
+        'conteo': conteo,
+        'resultado': resultado,
+        'lote_maximo': API_LOTE_MAXIMO,
+    })
+
+@login_required
+@require_POST
+def cerrar_conteo(request, conteo_id):
+    if not request.user.is_staff:
+        messages.error(request, "Acceso denegado.")
+        return redirect('inicio')
+
+    conteo = _conteo_del_usuario(request, conteo_id)
+    try:
+        conteo = conteos.cerrar(conteo)
+    except conteos.ConteoInvalido as error:
+        messages.warning(request, str(error))
+    else:
+        r = conteo.resultado
+        messages.success(request, f"Conteo cerrado: {r['encontradas']} de {r['esperadas']} encontradas, "
+                                  f"{len(r['faltantes'])} faltantes.")
+    return redirect('ver_conteo', conteo_id=conteo.id)
+
+@login_required
+@require_POST
+def api_lecturas_conteo(request, conteo_id):
+    """
+    Lote de códigos escaneados en un conteo.
+    Body: {"codigos": ["HER-1", "HER-2", ...]}
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Acceso denegado.'}, status=403)
+    conteo = filtrar_por_ubicacion(ConteoInventario.objects, ubicaciones_usuario(request.user)).filter(id=conteo_id).first()
+    if conteo is None:
+        return JsonResponse({'error': 'Conteo no encontrado.'}, status=404)
+
+    codigos = _lista_codigos(_leer_json(request))
+    if codigos is None:
+        return JsonResponse({'error': f'Envíe una lista "codigos" de hasta {API_LOTE_MAXIMO} textos.'}, status=400)
+    # Uno más largo que la columna sería un DataError (500) en MySQL estricto
+    largo = LecturaConteo._meta.get_field('codigo').max_length
+    largos = [codigo for codigo in codigos if len(codigo.strip()) > largo]
+    if largos:
+        return JsonResponse({'error': f'Código de más de {largo} caracteres: {largos[0][:largo]}...'}, status=400)
+
+    try:
+        resultados = conteos.registrar_lecturas(conteo, codigos, request.user)
+    except conteos.ConteoInvalido as error:
+        return JsonResponse({'error': str(error)}, status=error.status)
+    return JsonResponse({
+        'resultados': {codigo: {'clave': clave, 'texto': texto} for codigo, (clave, texto) in resultados.items()},
+        'lecturas': conteo.lecturas.count(),
+    })
@@ -0,0 +1,45 @@
+"""
+Configuración de Gunicorn para Railway / producción.
+
+SMARTSTOCK_SERVIDOR elige el perfil de despliegue:
+  - wsgi (por defecto): workers sync clásicos sobre smartstock.wsgi
+  - asgi: workers uvicorn sobre smartstock.asgi; las vistas async del escáner
+          (/api/verificar/, /api/prestamo/, ...) ya no bloquean un worker
+          mientras esperan a MySQL, y habilita el stream SSE de eventos.
+
+La cantidad de workers sale de WEB_CONCURRENCY y el puerto de PORT, que
+Gunicorn ya lee por su cuenta. Con más de un worker se exige REDIS_URL: los
+ids de los eventos en vivo salen de cache.incr, que en la caché de archivos
+no es atómico entre procesos (ver bodega/eventos.py).
+
+GUNICORN_PRELOAD=1 carga Django una sola vez en el proceso maestro y los
+workers nacen ya importados (fork): arranque más rápido y memoria compartida.
+"""
+import os
+
+servidor = os.getenv('SMARTSTOCK_SERVIDOR', 'wsgi').lower()
+
+if servidor == 'asgi':
+    wsgi_app = 'smartstock.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'smartstock.wsgi:application'
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+if workers > 1 and not os.getenv('REDIS_URL'):
+    raise RuntimeError(
+        f"WEB_CONCURRENCY={workers} requiere REDIS_URL: sin una caché compartida con incr atómico "
+        "los workers repiten ids de eventos y se pisan. Configure Redis o use un solo worker."
+    )
+
+preload_app = os.getenv('GUNICORN_PRELOAD', '0') == '1'
+
+
+def post_fork(server, worker):
+    # Con preload nada debería haber abierto conexiones en el maestro, pero si
+    # algo lo hizo no deben compartirse entre procesos.
+    if preload_app:
+        from django.db import connections
+        connections.close_all()
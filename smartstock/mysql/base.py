@@ -0,0 +1,16 @@
+"""
+Backend MySQL sobre PyMySQL.
+
+Registra PyMySQL como MySQLdb al importarse el backend, en lugar de hacerlo
+en smartstock/__init__.py y settings.py: así los comandos y tests que no
+tocan MySQL no pagan el import.
+"""
+import pymysql
+
+# Le decimos que se identifique como una versión moderna (Django exige mysqlclient >= 2.2.1)
+pymysql.version_info = (2, 2, 2, "final", 0)
+
+pymysql.install_as_MySQLdb()
+
+from django.db.backends.mysql.base import *  # noqa: E402,F401,F403
+from django.db.backends.mysql.base import DatabaseWrapper  # noqa: E402,F401
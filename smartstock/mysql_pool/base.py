@@ -0,0 +1,82 @@
+"""
+Backend MySQL (PyMySQL) con pool de conexiones por proceso.
+
+Se activa con DB_POOL=1. Pensado para el perfil ASGI: ahí Django cierra la
+conexión al final de cada petición (CONN_MAX_AGE=0, las conexiones
+persistentes no son seguras con threads efímeros), así que sin pool cada
+petición pagaría el handshake TCP + autenticación contra MySQL.
+
+En vez de cerrar, la conexión vuelve al pool; al pedir una nueva se reutiliza
+una del pool previa verificación con ping().
+
+Opciones (clave POOL en DATABASES):
+    TAMANO: conexiones ociosas que se guardan por proceso
+    VIDA_MAXIMA: segundos antes de descartar una conexión (bajo wait_timeout)
+"""
+import queue
+import threading
+import time
+
+from smartstock.mysql import base as mysql_base
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool(alias, tamano):
+    with _pools_lock:
+        if alias not in _pools:
+            _pools[alias] = queue.LifoQueue(maxsize=tamano)
+        return _pools[alias]
+
+
+def _cerrar_silencioso(conexion):
+    try:
+        conexion.close()
+    except Exception:
+        pass
+
+
+class DatabaseWrapper(mysql_base.DatabaseWrapper):
+
+    def _opciones_pool(self):
+        opciones = self.settings_dict.get('POOL') or {}
+        return int(opciones.get('TAMANO', 10)), int(opciones.get('VIDA_MAXIMA', 1800))
+
+    def get_new_connection(self, conn_params):
+        tamano, vida_maxima = self._opciones_pool()
+        pool = _pool(self.alias, tamano)
+
+        while True:
+            try:
+                conexion = pool.get_nowait()
+            except queue.Empty:
+                break
+            if time.monotonic() - conexion._smartstock_creada > vida_maxima:
+                _cerrar_silencioso(conexion)
+                continue
+            try:
+                conexion.ping(reconnect=False)
+            except Exception:
+                _cerrar_silencioso(conexion)
+                continue
+            return conexion
+
+        conexion = super().get_new_connection(conn_params)
+        conexion._smartstock_creada = time.monotonic()
+        return conexion
+
+    def _close(self):
+        if self.connection is None:
+            return
+        # Una conexión que tuvo errores no vuelve al pool
+        if self.errors_occurred:
+            return super()._close()
+
+        tamano, _ = self._opciones_pool()
+        try:
+            # Nunca devolvemos una transacción a medio camino
+            self.connection.rollback()
+            _pool(self.alias, tamano).put_nowait(self.connection)
+        except Exception:
+            return super()._close()
@@ -5,12 +5,9 @@ ARCHIVO DE CONFIGURACIÓN UNIFICADO (LOCAL + RAILWAY)
 
 from pathlib import Path
 import os
-import pymysql
+import tempfile
 import dj_database_url
 
-# Configuración necesaria para usar PyMySQL como conector de MySQL
-pymysql.install_as_MySQLdb()
-
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -54,6 +51,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'bodega.perfilador.PerfiladorMiddleware', # Perfilado bajo demanda (se descarta si está apagado)
+    'bodega.routers.EscrituraRecienteMiddleware', # Read-your-writes con la réplica de reportes
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -98,6 +97,51 @@ else:
         }
     }
 
+# ------------------------------------------------------------------------------
+# Perfil de conexiones (producción)
+# ------------------------------------------------------------------------------
+# DB_CONN_MAX_AGE: segundos que un worker WSGI reutiliza su conexión (0 = una
+#   conexión por petición, como antes). Bajo ASGI usar 0 y activar DB_POOL.
+# DB_HEALTH_CHECKS: verifica la conexión reutilizada antes de cada petición.
+# DB_POOL: usa el backend smartstock.mysql_pool (pool por proceso para PyMySQL).
+#
+# Los motores MySQL pasan por smartstock.mysql, que registra PyMySQL como
+# MySQLdb sólo cuando de verdad se usa MySQL (no en tests con SQLite).
+# Mismo criterio que gunicorn.conf.py para elegir el perfil (ASGI, Asgi, asgi...)
+SERVIDOR = os.getenv('SMARTSTOCK_SERVIDOR', 'wsgi').lower()
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '0' if SERVIDOR == 'asgi' else '600'))
+DB_HEALTH_CHECKS = os.getenv('DB_HEALTH_CHECKS', '1') == '1'
+DB_POOL = os.getenv('DB_POOL', '0') == '1'
+
+
+def _perfil_conexion(config):
+    config['CONN_MAX_AGE'] = DB_CONN_MAX_AGE
+    config['CONN_HEALTH_CHECKS'] = DB_HEALTH_CHECKS
+    if config['ENGINE'] != 'django.db.backends.mysql':
+        return config
+    config['ENGINE'] = 'smartstock.mysql'
+    if DB_POOL:
+        config['ENGINE'] = 'smartstock.mysql_pool'
+        config['POOL'] = {
+            'TAMANO': int(os.getenv('DB_POOL_TAMANO', '10')),
+            'VIDA_MAXIMA': int(os.getenv('DB_POOL_VIDA_MAXIMA', '1800')),
+        }
+    return config
+
+
+DATABASES['default'] = _perfil_conexion(DATABASES['default'])
+
+# Réplica de sólo lectura para los reportes (opcional). Si no se define, todos
+# los reportes leen de 'default' como siempre.
+if os.getenv('REPORTES_DATABASE_URL'):
+    DATABASES['reportes'] = _perfil_conexion(dj_database_url.config(env='REPORTES_DATABASE_URL'))
+
+DATABASE_ROUTERS = ['bodega.routers.RouterReportes']
+
+# Segundos durante los cuales un usuario que acaba de escribir lee sus
+# reportes desde la base principal (cubre el lag de replicación)
+REPLICA_LECTURA_PROPIA_SEGUNDOS = int(os.getenv('REPLICA_LECTURA_PROPIA_SEGUNDOS', '15'))
+
 # ==============================================================================
 # 4. VALIDACIÓN DE PASSWORD
 # ==============================================================================
@@ -125,13 +169,51 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# WhiteNoise: nombres con hash + versiones .gz/.br generadas en collectstatic
+# (los assets de bodega/assets.py se sirven precomprimidos y con caché larga).
+# Media direccionada por contenido (bodega/almacen.py): cada archivo se guarda
+# una vez, nombrado por su hash. Los bytes van a MEDIA_ROOT, o con
+# MEDIA_S3_BUCKET a un bucket compatible con S3 (AWS, MinIO, R2), lo que
+# requiere instalar django-storages y boto3.
+ALMACEN_OPCIONES = {}
+if os.getenv('MEDIA_S3_BUCKET'):
+    ALMACEN_OPCIONES = {
+        'interno': 'storages.backends.s3.S3Storage',
+        'opciones': {
+            'bucket_name': os.getenv('MEDIA_S3_BUCKET'),
+            'endpoint_url': os.getenv('MEDIA_S3_ENDPOINT'),  # Vacío = AWS
+            'access_key': os.getenv('MEDIA_S3_ACCESS_KEY'),
+            'secret_key': os.getenv('MEDIA_S3_SECRET_KEY'),
+            'custom_domain': os.getenv('MEDIA_S3_DOMINIO'),
+            'querystring_auth': False,
+            # El contenido de un nombre nunca cambia
+            'object_parameters': {'CacheControl': 'public, max-age=31536000, immutable'},
+        },
+    }
+
+# STATICFILES_STORAGE ya no existe en Django 6: va en STORAGES.
+STORAGES = {
+    'default': {
+        'BACKEND': 'bodega.almacen.AlmacenContenido',
+        'OPTIONS': ALMACEN_OPCIONES,
+    },
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
 # Configuración CRÍTICA para que funcionen las fotos en Railway
+# (FileSystemStorage crea las carpetas al guardar el primer archivo)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
-# Asegura que la carpeta media exista para evitar errores al guardar
-if not os.path.exists(MEDIA_ROOT):
-    os.makedirs(MEDIA_ROOT)
+# Fotos de evidencia: el navegador las reduce a FOTO_LADO_MAXIMO px (JPEG de
+# calidad FOTO_CALIDAD) y las sube en partes a SUBIDAS_DIR (bodega/subidas.py)
+FOTO_LADO_MAXIMO = int(os.getenv('FOTO_LADO_MAXIMO', '1600'))
+FOTO_CALIDAD = float(os.getenv('FOTO_CALIDAD', '0.8'))
+SUBIDAS_DIR = os.getenv('SUBIDAS_DIR', os.path.join(MEDIA_ROOT, 'subidas'))
+SUBIDA_PARTE_BYTES = 256 * 1024
+SUBIDA_TAMANO_MAXIMO = 15 * 1024 * 1024
 
 # ==============================================================================
 # 7. REDIRECCIONES
@@ -142,5 +224,113 @@ LOGOUT_REDIRECT_URL = 'login'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-# Configuración específica para WhiteNoise y archivos estáticos en producción
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
\ No newline at end of file
+# ==============================================================================
+# 8. ACTUALIZACIONES EN VIVO
+# ==============================================================================
+
+# Cada cuánto el navegador vuelve a preguntar a /api/eventos/ (WSGI) y cada
+# cuánto el stream SSE revisa los eventos de otros workers y envía un latido.
+# /api/eventos/ responde al tiro: no retiene workers sync de Gunicorn.
+EVENTOS_POLL_SEGUNDOS = int(os.getenv('EVENTOS_POLL_SEGUNDOS', '5'))
+
+# Vida de cada evento en la caché compartida. Un cliente que vuelve después
+# de esto (pestaña suspendida, red caída) recarga la página completa.
+EVENTOS_RETENCION_SEGUNDOS = int(os.getenv('EVENTOS_RETENCION_SEGUNDOS', '300'))
+
+# ==============================================================================
+# 9. CACHÉ
+# ==============================================================================
+
+# La caché debe ser compartida entre workers: la versión del inventario que
+# invalida los fragmentos se incrementa en el worker que procesó el cambio.
+# Con REDIS_URL usamos Redis; si no, archivos en el disco local del servidor
+# (sólo con un worker: gunicorn.conf.py no arranca más sin REDIS_URL).
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'smartstock-cache')),
+        }
+    }
+
+# Vida máxima de los fragmentos de listas (la versión del inventario los
+# invalida antes ante cualquier cambio)
+CACHE_FRAGMENTOS_SEGUNDOS = int(os.getenv('CACHE_FRAGMENTOS_SEGUNDOS', '3600'))
+
+# ==============================================================================
+# 10. PLAZOS DE PRÉSTAMO
+# ==============================================================================
+
+# Horas que puede estar prestada una herramienta si su categoría no define
+# un plazo propio (Categoria.horas_prestamo) ni se indicó uno en el préstamo
+PRESTAMO_HORAS_DEFECTO = int(os.getenv('PRESTAMO_HORAS_DEFECTO', '24'))
+
+# ==============================================================================
+# 11. SESIONES Y AUTENTICACIÓN
+# ==============================================================================
+# Con la configuración por defecto de Django cada petición autenticada hace
+# dos consultas antes de llegar a la vista (django_session y auth_user).
+#   - SESIONES=cache_db (defecto): se leen desde la caché compartida y se
+#     escriben también en MySQL, así que sobreviven a un reinicio de Redis.
+#   - SESIONES=cookies: firmadas en la cookie, sin estado en el servidor.
+#   - SESIONES=db: el comportamiento original.
+_MOTORES_SESION = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cache_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_ENGINE = _MOTORES_SESION[os.getenv('SESIONES', 'cache_db')]
+
+# request.user sale de un caché en memoria de cada worker, invalidado al
+# modificar el usuario, sus grupos/permisos o sus bodegas (bodega/autenticacion.py)
+AUTHENTICATION_BACKENDS = ['bodega.autenticacion.BackendUsuariosCacheados']
+
+# Vida máxima de un usuario en ese caché (0 = desactivado, siempre a la BD)
+AUTH_CACHE_SEGUNDOS = int(os.getenv('AUTH_CACHE_SEGUNDOS', '300'))
+
+# ==============================================================================
+# 12. PERFILADO DE PETICIONES
+# ==============================================================================
+# Con PERFILADOR=1 un usuario staff puede perfilar una petición agregando
+# ?_perfilar=1 (o la cabecera X-Perfilar: 1) y ver los resultados en
+# /perfiles/. Apagado, el middleware no se carga (bodega/perfilador.py).
+PERFILADOR_ACTIVO = os.getenv('PERFILADOR', '0') == '1'
+
+# Fracción de todas las peticiones que se perfilan solas (0.01 = 1%)
+PERFILADOR_MUESTREO = float(os.getenv('PERFILADOR_MUESTREO', '0'))
+
+# 'muestreo' (estadístico, pilas para flamegraph) o 'cprofile' (determinista)
+PERFILADOR_MODO = os.getenv('PERFILADOR_MODO', 'muestreo')
+PERFILADOR_INTERVALO_MS = float(os.getenv('PERFILADOR_INTERVALO_MS', '5'))
+
+# Buffer circular en disco: se conservan los últimos PERFILADOR_MAXIMO perfiles
+PERFILADOR_DIR = os.getenv('PERFILADOR_DIR', os.path.join(tempfile.gettempdir(), 'smartstock-perfiles'))
+PERFILADOR_MAXIMO = int(os.getenv('PERFILADOR_MAXIMO', '50'))
+
+# ==============================================================================
+# 13. REPORTES EN SEGUNDO PLANO
+# ==============================================================================
+# Los reportes grandes se encolan en la base y los genera el comando
+# procesar_trabajos (otro proceso / servicio de Railway), no el worker web.
+TRABAJOS_PROCESOS = int(os.getenv('TRABAJOS_PROCESOS', '2'))
+
+# Sobre este rango (o sin fechas) la página sugiere generar en segundo plano
+REPORTE_DIAS_SINCRONO = int(os.getenv('REPORTE_DIAS_SINCRONO', '92'))
+
+# Un trabajo EN_CURSO sin latido por este tiempo se da por muerto y se reintenta
+TRABAJOS_LATIDO_MAXIMO = int(os.getenv('TRABAJOS_LATIDO_MAXIMO', '120'))
+TRABAJOS_INTENTOS = 3
+
+# Los trabajos terminados (y sus archivos) se borran pasados estos días
+TRABAJOS_RETENCION_DIAS = int(os.getenv('TRABAJOS_RETENCION_DIAS', '7'))
+
+# Los generadores leen desde la réplica 'reportes' si está configurada
+TRABAJOS_EN_REPLICA = True
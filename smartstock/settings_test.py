@@ -0,0 +1,44 @@
+"""
+Settings para correr la suite sin MySQL:
+
+    python manage.py test --settings=smartstock.settings_test
+
+Usa SQLite como base principal y una segunda SQLite como réplica de reportes,
+para probar el ruteo de RouterReportes con dos bases realmente distintas.
+"""
+import tempfile
+from pathlib import Path
+
+from .settings import *  # noqa: F401,F403
+
+# Las bases de prueba van en memoria (TEST NAME None). NAME sólo se abre si
+# algo usa estos settings fuera de la suite (shell, runserver): queda en el
+# directorio temporal y no en el repositorio.
+_TEMPORAL = Path(tempfile.gettempdir())
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': _TEMPORAL / 'smartstock_test_default.sqlite3',
+        'TEST': {'NAME': None},
+    },
+    'reportes': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': _TEMPORAL / 'smartstock_test_reportes.sqlite3',
+        'TEST': {'NAME': None},
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+# Sin collectstatic previo: el storage con manifiesto fallaría en cada {% static %}
+STORAGES = {
+    **STORAGES,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}